@@ -0,0 +1,345 @@
+"""
+Arquivo frio de conferencia_reserva e romaneio_espelho_itens (Parquet zstd, por mês).
+
+Os volumes dos romaneios da Reserva encerrados há mais de --idade-dias e os itens
+dos romaneios espelho criados antes disso saem das tabelas quentes para
+<pasta>/<tabela>/mes=AAAA-MM/*.parquet (mês da expedição / da criação do espelho,
+em UTC). Os cabeçalhos (romaneios, romaneios_espelho) ficam no banco. Um índice
+pequeno (<tabela>/_indice/*.parquet: romaneio -> meses) leva as leituras por
+romaneio direto aos arquivos certos.
+
+Ordem de cada lote: grava os arquivos, grava o índice, relê e confere os ids e só
+então apaga do banco. Se parar no meio, a próxima execução refaz o lote; leituras
+descartam ids repetidos e, de romaneio já indexado, valem só as linhas do arquivo.
+
+Os repositórios (Repositorios(..., arquivo=...)) leem o arquivo junto com o banco
+na Base de Dados, no rastreio, na reimpressão e na conciliação.
+
+Uso:
+    python arquivo.py --idade-dias 180              # simulação: só conta
+    python arquivo.py --idade-dias 180 --executar
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from helpers import chunk_list
+from repositorios import TAMANHO_PAGINA
+
+PASTA_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".arquivo")
+IDADE_MINIMA_DIAS = 30  # romaneio encerrado há menos que isso ainda pode receber baixa na Pavuna
+SEM_DATA = "sem-data"
+INICIO = "1900-01-01T00:00:00+00:00"
+
+_TS = pa.timestamp("us", tz="UTC")
+
+# chave: romaneio dono da linha (índice); data: partição; caixa: ordem dentro do arquivo
+TABELAS = {
+    "conferencia_reserva": {
+        "chave": "romaneio_id",
+        "data": "data_expedicao",
+        "caixa": "chave_nfe",
+        "esquema": pa.schema([
+            ("id", pa.int64()),
+            ("chave_nfe", pa.string()),
+            ("romaneio_id", pa.int64()),
+            ("destino", pa.string()),
+            ("data_expedicao", _TS),
+            ("data_recebimento", _TS),
+            ("created_at", _TS),
+        ]),
+    },
+    "romaneio_espelho_itens": {
+        "chave": "romaneio_espelho_id",
+        "data": "criado_em",  # do cabeçalho: o item não tem data própria
+        "caixa": "caixa",
+        "esquema": pa.schema([
+            ("id", pa.int64()),
+            ("romaneio_espelho_id", pa.int64()),
+            ("caixa", pa.string()),
+            ("filial_origem", pa.string()),
+            ("destino", pa.string()),
+            ("qtde_pecas", pa.int64()),
+            ("criado_em", _TS),
+        ]),
+    },
+}
+
+
+def _ts(valor: str):
+    ts = pd.Timestamp(valor)
+    return (ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")).to_pydatetime()
+
+
+def _mes(valor: str, fim: bool = False) -> str:
+    """Mês (UTC) de um limite; para o fim exclusivo, o mês do último instante antes dele."""
+    ts = pd.Timestamp(_ts(valor))
+    return (ts - pd.Timedelta(microseconds=1) if fim else ts).strftime("%Y-%m")
+
+
+def _colunas(tabela: str, colunas: str) -> list[str]:
+    nomes = TABELAS[tabela]["esquema"].names
+    if colunas.strip() == "*":
+        return list(nomes)
+    return [c for c in (c.strip() for c in colunas.split(",")) if c in nomes]
+
+
+def _gravar_atomico(tbl: pa.Table, caminho: str):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = f"{caminho}.tmp"
+    pq.write_table(tbl, tmp, compression="zstd")
+    os.replace(tmp, caminho)
+
+
+def _valor(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+
+# =========================================================
+# ARQUIVO (leitura e gravação)
+# =========================================================
+class ArquivoFrio:
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+        self._indices: dict[str, tuple] = {}  # tabela -> (assinatura dos arquivos, {chave: {meses}})
+        self._lock = threading.Lock()
+        self.stats = {"leituras": 0, "arquivos_lidos": 0, "linhas_lidas": 0, "linhas_gravadas": 0}
+
+    def _dir(self, tabela: str) -> str:
+        return os.path.join(self.pasta, tabela)
+
+    # ---------- índice ----------
+    def _indice(self, tabela: str) -> dict[int, set]:
+        pasta = os.path.join(self._dir(tabela), "_indice")
+        try:
+            assinatura = tuple(sorted(
+                (e.name, e.stat().st_mtime_ns) for e in os.scandir(pasta) if e.name.endswith(".parquet")
+            ))
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            salvo = self._indices.get(tabela)
+            if salvo is not None and salvo[0] == assinatura:
+                return salvo[1]
+            indice: dict[int, set] = {}
+            for nome, _ in assinatura:
+                for r in pq.read_table(os.path.join(pasta, nome)).to_pylist():
+                    indice.setdefault(int(r["chave"]), set()).add(r["mes"])
+            self._indices[tabela] = (assinatura, indice)
+            return indice
+
+    def arquivados(self, tabela: str, ids) -> set[int]:
+        """Quais destes romaneios (ou espelhos) já estão no arquivo."""
+        indice = self._indice(tabela)
+        if not indice:
+            return set()
+        return {int(i) for i in ids if i is not None and int(i) in indice}
+
+    # ---------- leitura ----------
+    def _arquivos(self, tabela: str, ids, dt_ini, dt_fim) -> list[str]:
+        base = self._dir(tabela)
+        try:
+            meses = [n[4:] for n in os.listdir(base) if n.startswith("mes=")]
+        except FileNotFoundError:
+            return []
+        if ids is not None:
+            indice = self._indice(tabela)
+            dos_ids = set().union(*(indice.get(int(i), ()) for i in ids))
+            meses = [m for m in meses if m in dos_ids]
+        if dt_ini or dt_fim:
+            ini, fim = _mes(dt_ini) if dt_ini else "", _mes(dt_fim, fim=True) if dt_fim else "9999-99"
+            meses = [m for m in meses if m != SEM_DATA and ini <= m <= fim]
+        return sorted(
+            os.path.join(base, f"mes={m}", a)
+            for m in meses
+            for a in os.listdir(os.path.join(base, f"mes={m}"))
+            if a.endswith(".parquet")
+        )
+
+    def paginas(self, tabela: str, colunas="*", tamanho: int = TAMANHO_PAGINA,
+                ids=None, caixas=None, dt_ini: str | None = None, dt_fim: str | None = None):
+        """
+        Linhas arquivadas em páginas de até `tamanho`, com os mesmos filtros das consultas
+        quentes: ids (romaneio_id / romaneio_espelho_id), caixas e [dt_ini, dt_fim) na
+        data da partição. Datas voltam em ISO, como vêm do banco.
+        """
+        cfg = TABELAS[tabela]
+        if ids is not None:
+            ids = self.arquivados(tabela, ids)
+            if not ids:
+                return
+        arquivos = self._arquivos(tabela, ids, dt_ini, dt_fim)
+        if not arquivos:
+            return
+
+        condicoes = []
+        if ids is not None:
+            condicoes.append(ds.field(cfg["chave"]).isin(sorted(ids)))
+        if caixas is not None:
+            condicoes.append(ds.field(cfg["caixa"]).isin(list(caixas)))
+        if dt_ini:
+            condicoes.append(ds.field(cfg["data"]) >= pa.scalar(_ts(dt_ini), type=_TS))
+        if dt_fim:
+            condicoes.append(ds.field(cfg["data"]) < pa.scalar(_ts(dt_fim), type=_TS))
+        filtro = None
+        for c in condicoes:
+            filtro = c if filtro is None else filtro & c
+
+        cols = _colunas(tabela, colunas)
+        dataset = ds.dataset(arquivos, schema=cfg["esquema"], format="parquet")
+        self.stats["leituras"] += 1
+        self.stats["arquivos_lidos"] += len(arquivos)
+        vistos, pagina = set(), []
+        for lote in dataset.to_batches(columns=list(dict.fromkeys(["id", *cols])), filter=filtro):
+            for r in lote.to_pylist():
+                if r["id"] in vistos:  # cópia repetida de uma execução interrompida
+                    continue
+                vistos.add(r["id"])
+                pagina.append({c: _valor(r[c]) for c in cols})
+                if len(pagina) >= tamanho:
+                    self.stats["linhas_lidas"] += len(pagina)
+                    yield pagina
+                    pagina = []
+        if pagina:
+            self.stats["linhas_lidas"] += len(pagina)
+            yield pagina
+
+    def ler(self, tabela: str, colunas="*", limite: int | None = None, **filtros) -> list[dict]:
+        """Todas as páginas numa lista; limite para de ler depois de `limite` linhas."""
+        out = []
+        for pagina in self.paginas(tabela, colunas, **filtros):
+            out.extend(pagina)
+            if limite is not None and len(out) >= limite:
+                return out[:limite]
+        return out
+
+    # ---------- gravação ----------
+    def gravar(self, tabela: str, rows: list[dict]) -> int:
+        """Grava um lote (um arquivo por mês) e depois o índice do lote. Retorna nº de linhas."""
+        if not rows:
+            return 0
+        cfg = TABELAS[tabela]
+        esquema = cfg["esquema"]
+        df = pd.DataFrame(rows).reindex(columns=esquema.names)
+        for campo in esquema:
+            if campo.type == _TS:
+                df[campo.name] = pd.to_datetime(df[campo.name], utc=True, errors="coerce", format="ISO8601")
+            elif campo.type == pa.int64():
+                df[campo.name] = pd.to_numeric(df[campo.name], errors="coerce").astype("Int64")
+        meses = df[cfg["data"]].dt.strftime("%Y-%m").fillna(SEM_DATA)
+
+        nome = f"parte-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        for mes, grupo in df.groupby(meses, sort=True):
+            tbl = pa.Table.from_pandas(grupo.sort_values(cfg["caixa"]), schema=esquema, preserve_index=False)
+            _gravar_atomico(tbl, os.path.join(self._dir(tabela), f"mes={mes}", nome))
+
+        indice = pd.DataFrame({"chave": df[cfg["chave"]].astype("int64"), "mes": meses}).drop_duplicates()
+        _gravar_atomico(
+            pa.Table.from_pandas(indice, preserve_index=False),
+            os.path.join(self._dir(tabela), "_indice", nome),
+        )
+        self.stats["linhas_gravadas"] += len(df)
+        return len(df)
+
+    def estatisticas(self) -> dict:
+        st = dict(self.stats)
+        for tabela in TABELAS:
+            st[f"arquivados_{tabela}"] = len(self._indice(tabela))
+        return st
+
+
+def criar_arquivo() -> ArquivoFrio | None:
+    """Arquivo em CONFERENCIA_ARQUIVO_DIR (padrão .arquivo ao lado do app; vazio desliga)."""
+    pasta = os.environ.get("CONFERENCIA_ARQUIVO_DIR", PASTA_PADRAO)
+    return ArquivoFrio(pasta) if pasta else None
+
+
+# =========================================================
+# JOB DE ARQUIVAMENTO
+# =========================================================
+def _mover(arquivo: ArquivoFrio, repo, tabela: str, ids: list[int], rows: list[dict]) -> int:
+    """Grava, confere pela releitura e só então apaga do banco."""
+    arquivo.gravar(tabela, rows)
+    gravados = {r["id"] for r in arquivo.ler(tabela, "id", ids=ids)}
+    faltando = {int(r["id"]) for r in rows} - gravados
+    if faltando:
+        raise RuntimeError(f"{tabela}: {len(faltando)} linha(s) não conferem no arquivo; nada foi apagado")
+    return repo.apagar_ids([int(r["id"]) for r in rows])
+
+
+def arquivar(backend, arquivo: ArquivoFrio, idade_dias: float, executar: bool = False,
+             lote: int = 200, log=print) -> dict:
+    """
+    Move para o arquivo o que tiver mais de idade_dias. Sem executar, só conta.
+    Usa repositórios sem leitura do arquivo: só o que ainda está no banco é movido.
+    """
+    from repositorios import Repositorios
+
+    repos = Repositorios(backend)
+    corte = (pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=idade_dias)).isoformat()
+    resumo = {"corte": corte, "romaneios": 0, "volumes": 0, "espelhos": 0, "itens": 0}
+
+    # Reserva: volumes dos romaneios encerrados antes do corte
+    ids = [int(r["id"]) for r in repos.romaneios.encerrados_entre(INICIO, corte, "id")]
+    for part in chunk_list(ids, size=lote):
+        if not executar:
+            n = repos.conferencia.contar_por_romaneios(part)
+        else:
+            rows = [r for pagina in repos.conferencia.paginas_por_romaneios(part, "*") for r in pagina]
+            n = _mover(arquivo, repos.conferencia, "conferencia_reserva", part, rows) if rows else 0
+        resumo["romaneios"] += len(part) if n else 0
+        resumo["volumes"] += n
+        if n:
+            log(f"conferencia_reserva: {n} volume(s) de {len(part)} romaneio(s)")
+
+    # Pavuna: itens dos espelhos criados antes do corte (a data vai junto para a partição)
+    criado_em = {int(e["id"]): e.get("criado_em") for e in repos.espelhos.criados_entre(INICIO, corte, "id, criado_em")}
+    for part in chunk_list(list(criado_em), size=lote):
+        if not executar:
+            n = repos.espelho_itens.contar_por_espelhos(part)
+        else:
+            rows = [
+                {**r, "criado_em": criado_em.get(r["romaneio_espelho_id"])}
+                for pagina in repos.espelho_itens.paginas_por_espelhos(part, "*")
+                for r in pagina
+            ]
+            n = _mover(arquivo, repos.espelho_itens, "romaneio_espelho_itens", part, rows) if rows else 0
+        resumo["espelhos"] += len(part) if n else 0
+        resumo["itens"] += n
+        if n:
+            log(f"romaneio_espelho_itens: {n} item(ns) de {len(part)} espelho(s)")
+    return resumo
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Move romaneios antigos para o arquivo frio (Parquet).")
+    ap.add_argument("--idade-dias", type=float, default=180, help=f"idade mínima (>= {IDADE_MINIMA_DIAS})")
+    ap.add_argument("--pasta", default=os.environ.get("CONFERENCIA_ARQUIVO_DIR") or PASTA_PADRAO)
+    ap.add_argument("--lote", type=int, default=200, help="romaneios por lote (um arquivo por mês por lote)")
+    ap.add_argument("--executar", action="store_true", help="sem isto, só conta o que seria movido")
+    args = ap.parse_args()
+    if args.idade_dias < IDADE_MINIMA_DIAS:
+        ap.error(f"--idade-dias precisa ser >= {IDADE_MINIMA_DIAS}")
+
+    from backend import criar_backend
+    from ingest_faturamento import _credenciais_supabase
+
+    url, key = _credenciais_supabase()
+    resumo = arquivar(
+        criar_backend(url, key), ArquivoFrio(args.pasta), args.idade_dias,
+        executar=args.executar, lote=args.lote, log=lambda m: print(m, file=sys.stderr),
+    )
+    print(("movido: " if args.executar else "simulação (use --executar): ") + str(resumo))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,667 @@
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from helpers import env_float
+
+
+# =========================================================
+# BACKEND: acesso bruto às tabelas (Supabase ou SQLite local)
+# =========================================================
+# Filtros são tuplas (operador, coluna, valor):
+#   ("eq", "romaneio_id", 10), ("in", "caixa", [...]), ("gte", "data_expedicao", "2024-01-01T00:00:00"),
+#   ("lt", ...), ("gt", ...), ("lte", ...), ("neq", ...), ("is_null", col, None), ("not_null", col, None)
+#
+# Embed segue a sintaxe de recursos relacionados do PostgREST:
+#   {"romaneios": ["usuario_criou", "rota"]} ou {"romaneios": "*"}
+
+OPERADORES = {"eq", "neq", "in", "gt", "gte", "lt", "lte", "is_null", "not_null"}
+
+# tabela filha -> {tabela pai: coluna FK}
+RELACOES = {
+    "conferencia_reserva": {"romaneios": "romaneio_id"},
+    "romaneio_espelho_itens": {"romaneios_espelho": "romaneio_espelho_id"},
+}
+
+_IDENT = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+def _colunas_str(colunas, embed=None) -> str:
+    base = colunas if isinstance(colunas, str) else ", ".join(colunas)
+    partes = [base]
+    for tabela, cols in (embed or {}).items():
+        cols_str = cols if isinstance(cols, str) else ", ".join(cols)
+        partes.append(f"{tabela}({cols_str})")
+    return ", ".join(partes)
+
+
+class Backend:
+    """
+    Interface mínima usada pelos repositórios.
+    Cada método corresponde a UMA ida ao banco (um request no Supabase).
+    """
+
+    nome = "base"
+
+    def select(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, embed=None) -> list[dict]:
+        raise NotImplementedError
+
+    def count(self, tabela, filtros=()) -> int:
+        raise NotImplementedError
+
+    def insert(self, tabela, rows) -> list[dict]:
+        raise NotImplementedError
+
+    def update(self, tabela, valores: dict, filtros) -> list[dict]:
+        raise NotImplementedError
+
+    def delete(self, tabela, filtros) -> list[dict]:
+        raise NotImplementedError
+
+    def upsert(self, tabela, rows, on_conflict: list[str]) -> int:
+        """Insere ou atualiza pelo conjunto de colunas únicas. Retorna nº de linhas enviadas."""
+        raise NotImplementedError
+
+    def rpc(self, funcao: str, params: dict):
+        """Executa uma função do banco (sql/*.sql) numa única ida; retorna o JSON devolvido."""
+        raise NotImplementedError
+
+    def select_df(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, tipos=None) -> pd.DataFrame:
+        """
+        Mesmo select, já em DataFrame com as colunas de `tipos` tipadas (ver tipar).
+        Padrão: passa pelas linhas em dict; backends com transporte colunar sobrescrevem.
+        """
+        return tipar(pd.DataFrame(self.select(tabela, colunas, filtros, ordem, desc, limite)), tipos)
+
+
+# =========================================================
+# TRANSPORTE COLUNAR (leituras grandes direto em DataFrame)
+# =========================================================
+# tipos: {coluna: dtype do pandas} + "datetime" (ISO -> datetime UTC).
+# Ex.: {"caixa": "string", "destino": "category", "qtde_pecas": "Int64", "created_at": "datetime"}.
+# Colunas de código (caixa, chave_nfe) precisam estar em tipos como "string":
+# sem tipo o CSV infere número e some o zero à esquerda.
+_TIPOS_ARROW = {
+    "string": pa.string(),
+    "category": pa.dictionary(pa.int32(), pa.string()),  # vira Categorical no to_pandas, sem passar por str
+    "Int64": pa.int64(),
+    "float64": pa.float64(),
+}
+
+
+def tipar(df: pd.DataFrame, tipos: dict | None) -> pd.DataFrame:
+    for col, tipo in (tipos or {}).items():
+        if col not in df.columns:
+            df[col] = pd.Series(None, index=df.index, dtype=object)
+        if tipo == "datetime":
+            if not isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                df[col] = pd.to_datetime(df[col], utc=True, errors="coerce", format="ISO8601")
+        elif df[col].dtype != tipo:
+            df[col] = df[col].astype(tipo)
+    return df
+
+
+def ler_csv(texto: str, tipos: dict | None = None) -> pd.DataFrame:
+    """
+    CSV do PostgREST (cabeçalho + linhas; vazio = nulo) para DataFrame tipado.
+    Lido pelo leitor de CSV do Arrow: os tipos entram na leitura (código continua texto)
+    e as datas ISO já saem como timestamp.
+    """
+    tipos = tipos or {}
+    if not texto or not texto.strip():
+        return tipar(pd.DataFrame(), tipos)
+    opcoes = pa_csv.ConvertOptions(
+        column_types={c: _TIPOS_ARROW[t] for c, t in tipos.items() if t in _TIPOS_ARROW},
+        strings_can_be_null=True,
+    )
+    df = pa_csv.read_csv(io.BytesIO(texto.encode()), convert_options=opcoes).to_pandas()
+    return tipar(df, tipos)
+
+
+# =========================================================
+# SUPABASE
+# =========================================================
+class SupabaseBackend(Backend):
+    nome = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _aplicar_filtros(q, filtros):
+        for op, col, val in filtros:
+            if op == "in":
+                q = q.in_(col, list(val))
+            elif op == "is_null":
+                q = q.is_(col, "null")
+            elif op == "not_null":
+                q = q.not_.is_(col, "null")
+            elif op in OPERADORES:
+                q = getattr(q, op)(col, val)
+            else:
+                raise ValueError(f"Operador de filtro desconhecido: {op}")
+        return q
+
+    def select(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, embed=None):
+        q = self.client.table(tabela).select(_colunas_str(colunas, embed))
+        q = self._aplicar_filtros(q, filtros)
+        if ordem:
+            q = q.order(ordem, desc=desc)
+        if limite:
+            q = q.limit(limite)
+        return q.execute().data or []
+
+    def count(self, tabela, filtros=()):
+        q = self.client.table(tabela).select("id", count="exact")
+        q = self._aplicar_filtros(q, filtros)
+        res = q.execute()
+        return res.count if res.count else 0
+
+    def insert(self, tabela, rows):
+        return self.client.table(tabela).insert(rows).execute().data or []
+
+    def update(self, tabela, valores, filtros):
+        q = self.client.table(tabela).update(valores)
+        q = self._aplicar_filtros(q, filtros)
+        return q.execute().data or []
+
+    def delete(self, tabela, filtros):
+        q = self.client.table(tabela).delete()
+        q = self._aplicar_filtros(q, filtros)
+        return q.execute().data or []
+
+    def upsert(self, tabela, rows, on_conflict):
+        from postgrest.types import ReturnMethod
+
+        rows = list(rows)
+        if rows:
+            self.client.table(tabela).upsert(
+                rows, on_conflict=",".join(on_conflict), returning=ReturnMethod.minimal
+            ).execute()
+        return len(rows)
+
+    def rpc(self, funcao, params):
+        return self.client.rpc(funcao, params).execute().data
+
+    def select_df(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, tipos=None):
+        if _tem_json(tabela):  # jsonb/array viria como texto no CSV
+            return super().select_df(tabela, colunas, filtros, ordem, desc, limite, tipos)
+        # Accept: text/csv — sem JSON de lista de dicts no meio; o pandas lê direto as colunas
+        q = self.client.table(tabela).select(_colunas_str(colunas))
+        q = self._aplicar_filtros(q, filtros)
+        if ordem:
+            q = q.order(ordem, desc=desc)
+        if limite:
+            q = q.limit(limite)
+        texto = q.csv().execute().data
+        return ler_csv(texto if isinstance(texto, str) else "", tipos)
+
+
+# =========================================================
+# SQLITE (in-process): substituto local para testes e benchmarks
+# =========================================================
+_AGORA_SQL = "(strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now'))"
+
+SCHEMA_SQLITE = f"""
+create table if not exists romaneios (
+    id integer primary key autoincrement,
+    usuario_criou text,
+    unidade_origem text,
+    status text,
+    rota text,
+    created_at text default {_AGORA_SQL},
+    data_encerramento text,
+    qtd_volumes integer
+);
+create table if not exists conferencia_reserva (
+    id integer primary key autoincrement,
+    chave_nfe text,
+    romaneio_id integer references romaneios(id),
+    destino text,
+    data_expedicao text,
+    data_recebimento text,
+    created_at text default {_AGORA_SQL}
+);
+create table if not exists faturamento (
+    id integer primary key autoincrement,
+    caixa text,
+    filial_origem text,
+    destino text,
+    qtde_pecas integer,
+    created_at text default {_AGORA_SQL}
+);
+create table if not exists romaneios_espelho (
+    id integer primary key autoincrement,
+    usuario_criou text,
+    unidade_origem text,
+    status text,
+    romaneios_origem text,
+    qtd_caixas integer,
+    rota text,
+    criado_em text default {_AGORA_SQL}
+);
+create table if not exists romaneio_espelho_itens (
+    id integer primary key autoincrement,
+    romaneio_espelho_id integer references romaneios_espelho(id),
+    caixa text,
+    filial_origem text,
+    destino text,
+    qtde_pecas integer
+);
+create index if not exists idx_conferencia_reserva_romaneio on conferencia_reserva (romaneio_id);
+create index if not exists idx_conferencia_reserva_chave_nfe on conferencia_reserva (chave_nfe);
+create unique index if not exists uq_faturamento_caixa_created_at on faturamento (caixa, created_at);
+create index if not exists idx_romaneio_espelho_itens_caixa on romaneio_espelho_itens (caixa);
+create index if not exists idx_romaneio_espelho_itens_espelho on romaneio_espelho_itens (romaneio_espelho_id);
+"""
+
+# colunas gravadas como JSON (jsonb/arrays no Postgres)
+COLUNAS_JSON = {("romaneios_espelho", "romaneios_origem")}
+
+
+def _tem_json(tabela: str) -> bool:
+    """Tabelas com colunas JSON ficam fora do transporte colunar (select_df usa o caminho em dict)."""
+    return any(t == tabela for t, _ in COLUNAS_JSON)
+
+# colunas criadas depois do schema inicial: bancos locais antigos ganham a coluna ao abrir
+MIGRACOES_SQLITE = [("romaneios", "qtd_volumes", "integer")]
+
+
+class SQLiteBackend(Backend):
+    """
+    Implementação local em SQLite com o mesmo contrato do Supabase.
+    latencia_ms simula o tempo de ida e volta de cada request;
+    conexao_ms simula o handshake (TCP + TLS) do primeiro request de um cliente novo;
+    falha_pct / fora_do_ar simulam requests que não chegam ao banco (ConnectionError).
+    """
+
+    nome = "sqlite"
+
+    def __init__(self, caminho: str = ":memory:", latencia_ms: float = 0.0, conexao_ms: float = 0.0):
+        self.caminho = caminho
+        self.latencia_ms = float(latencia_ms or 0)
+        self.conexao_ms = float(conexao_ms or 0)
+        self.falha_pct = 0.0
+        self.fora_do_ar = False
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA_SQLITE)
+        for tabela, coluna, tipo in MIGRACOES_SQLITE:
+            if coluna not in self._colunas_tabela(tabela):
+                self.conn.execute(f"alter table {tabela} add column {coluna} {tipo}")
+        self.n_requests = 0
+        self.n_conexoes = 0
+        self._conectado = False
+
+    def nova_conexao(self):
+        """Equivale a criar um cliente novo: o próximo request paga o handshake."""
+        with self._lock:
+            self._conectado = False
+        return self
+
+    # ---------- internos ----------
+    def _latencia(self):
+        # a espera fica fora do lock: requests concorrentes "viajam" em paralelo
+        with self._lock:
+            self.n_requests += 1
+            handshake = not self._conectado
+            if handshake:
+                self._conectado = True
+                self.n_conexoes += 1
+        espera = self.latencia_ms + (self.conexao_ms if handshake else 0)
+        if espera > 0:
+            time.sleep(espera / 1000.0)
+        if self.fora_do_ar or (self.falha_pct and random.random() * 100 < self.falha_pct):
+            raise ConnectionError("backend local: falha simulada")
+
+    @staticmethod
+    def _ident(nome: str) -> str:
+        if not _IDENT.match(nome or ""):
+            raise ValueError(f"Identificador inválido: {nome!r}")
+        return nome
+
+    def _where(self, filtros):
+        partes, params = [], []
+        for op, col, val in filtros:
+            col = self._ident(col)
+            if op == "eq":
+                partes.append(f"{col} = ?")
+                params.append(val)
+            elif op == "neq":
+                partes.append(f"{col} <> ?")
+                params.append(val)
+            elif op == "in":
+                vals = list(val)
+                if not vals:
+                    partes.append("1 = 0")
+                else:
+                    partes.append(f"{col} in ({', '.join('?' * len(vals))})")
+                    params.extend(vals)
+            elif op in ("gt", "gte", "lt", "lte"):
+                sinal = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}[op]
+                partes.append(f"{col} {sinal} ?")
+                params.append(val)
+            elif op == "is_null":
+                partes.append(f"{col} is null")
+            elif op == "not_null":
+                partes.append(f"{col} is not null")
+            else:
+                raise ValueError(f"Operador de filtro desconhecido: {op}")
+        sql = (" where " + " and ".join(partes)) if partes else ""
+        return sql, params
+
+    def _colunas_tabela(self, tabela) -> list[str]:
+        return [r["name"] for r in self.conn.execute(f"pragma table_info({self._ident(tabela)})")]
+
+    def _decodificar(self, tabela, row) -> dict:
+        d = dict(row)
+        for t, col in COLUNAS_JSON:
+            if t == tabela and isinstance(d.get(col), str):
+                try:
+                    d[col] = json.loads(d[col])
+                except ValueError:
+                    pass
+        return d
+
+    def _codificar(self, tabela, row: dict) -> dict:
+        out = {}
+        for col, val in row.items():
+            if (tabela, col) in COLUNAS_JSON and not isinstance(val, str) and val is not None:
+                val = json.dumps(val)
+            out[self._ident(col)] = val
+        return out
+
+    def _sql_select(self, tabela, colunas, filtros, ordem=None, desc=False, limite=None):
+        tabela = self._ident(tabela)
+        if isinstance(colunas, str):
+            colunas = [c.strip() for c in colunas.split(",") if c.strip()]
+        cols_sql = "*" if colunas in (["*"], []) else ", ".join(self._ident(c) for c in colunas)
+        where, params = self._where(filtros)
+        sql = f"select {cols_sql} from {tabela}{where}"
+        if ordem:
+            sql += f" order by {self._ident(ordem)} {'desc' if desc else 'asc'}"
+        if limite:
+            sql += f" limit {int(limite)}"
+        return sql, params
+
+    def _select_sem_latencia(self, tabela, colunas, filtros, ordem=None, desc=False, limite=None):
+        sql, params = self._sql_select(tabela, colunas, filtros, ordem, desc, limite)
+        return [self._decodificar(tabela, r) for r in self.conn.execute(sql, params)]
+
+    # ---------- contrato ----------
+    def select(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, embed=None):
+        self._latencia()
+        with self._lock:
+            if isinstance(colunas, str):
+                colunas = [c.strip() for c in colunas.split(",") if c.strip()]
+            colunas = list(colunas)
+
+            fks = {}
+            for pai in (embed or {}):
+                fk = RELACOES.get(tabela, {}).get(pai)
+                if not fk:
+                    raise ValueError(f"Relação {tabela} -> {pai} não mapeada")
+                fks[pai] = fk
+
+            extras = [fk for fk in fks.values() if colunas != ["*"] and fk not in colunas]
+            rows = self._select_sem_latencia(tabela, colunas + extras, filtros, ordem, desc, limite)
+
+            for pai, cols_pai in (embed or {}).items():
+                fk = fks[pai]
+                ids = list({r[fk] for r in rows if r.get(fk) is not None})
+                if isinstance(cols_pai, str):
+                    cols_pai = [c.strip() for c in cols_pai.split(",") if c.strip()]
+                cols_pai = list(cols_pai)
+                pais = {}
+                if ids:
+                    cols_busca = cols_pai if cols_pai == ["*"] or "id" in cols_pai else cols_pai + ["id"]
+                    for p in self._select_sem_latencia(pai, cols_busca, [("in", "id", ids)]):
+                        pid = p["id"] if cols_pai == ["*"] or "id" in cols_pai else p.pop("id")
+                        pais[pid] = p
+                for r in rows:
+                    r[pai] = pais.get(r.get(fk))
+
+            for r in rows:
+                for fk in extras:
+                    r.pop(fk, None)
+            return rows
+
+    def select_df(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, tipos=None):
+        if _tem_json(tabela):  # colunas JSON decodificadas como no select
+            return super().select_df(tabela, colunas, filtros, ordem, desc, limite, tipos)
+        # colunar também no local: o cursor vai direto para o DataFrame, sem dict por linha
+        self._latencia()
+        with self._lock:
+            sql, params = self._sql_select(tabela, colunas, filtros, ordem, desc, limite)
+            df = pd.read_sql_query(sql, self.conn, params=params)
+        return tipar(df, tipos)
+
+    def count(self, tabela, filtros=()):
+        self._latencia()
+        with self._lock:
+            where, params = self._where(filtros)
+            return int(self.conn.execute(f"select count(*) from {self._ident(tabela)}{where}", params).fetchone()[0])
+
+    def insert(self, tabela, rows):
+        if isinstance(rows, dict):
+            rows = [rows]
+        self._latencia()
+        with self._lock:
+            tabela = self._ident(tabela)
+            out = []
+            self.conn.execute("begin")
+            try:
+                for row in rows:
+                    row = self._codificar(tabela, row)
+                    cols = list(row.keys())
+                    sql = (
+                        f"insert into {tabela} ({', '.join(cols)}) values ({', '.join('?' * len(cols))}) returning *"
+                        if cols else f"insert into {tabela} default values returning *"
+                    )
+                    out.extend(self._decodificar(tabela, r) for r in self.conn.execute(sql, list(row.values())))
+                self.conn.execute("commit")
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+            return out
+
+    def update(self, tabela, valores, filtros):
+        self._latencia()
+        with self._lock:
+            tabela = self._ident(tabela)
+            valores = self._codificar(tabela, valores)
+            sets = ", ".join(f"{c} = ?" for c in valores)
+            where, params = self._where(filtros)
+            sql = f"update {tabela} set {sets}{where} returning *"
+            return [self._decodificar(tabela, r) for r in self.conn.execute(sql, list(valores.values()) + params)]
+
+    def delete(self, tabela, filtros):
+        self._latencia()
+        with self._lock:
+            where, params = self._where(filtros)
+            sql = f"delete from {self._ident(tabela)}{where} returning *"
+            return [self._decodificar(tabela, r) for r in self.conn.execute(sql, params)]
+
+    def upsert(self, tabela, rows, on_conflict):
+        rows = [self._codificar(tabela, r) for r in rows]
+        if not rows:
+            return 0
+        self._latencia()
+        with self._lock:
+            tabela = self._ident(tabela)
+            cols = list(rows[0].keys())
+            chave = [self._ident(c) for c in on_conflict]
+            sets = ", ".join(f"{c} = excluded.{c}" for c in cols if c not in chave)
+            sql = (
+                f"insert into {tabela} ({', '.join(cols)}) values ({', '.join('?' * len(cols))}) "
+                f"on conflict ({', '.join(chave)}) do " + (f"update set {sets}" if sets else "nothing")
+            )
+            self.conn.execute("begin")
+            try:
+                self.conn.executemany(sql, [[r.get(c) for c in cols] for r in rows])
+                self.conn.execute("commit")
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+            return len(rows)
+
+    def rpc(self, funcao, params):
+        fn = getattr(self, f"_rpc_{self._ident(funcao)}", None)
+        if fn is None:
+            raise ValueError(f"Função não emulada no SQLite: {funcao}")
+        self._latencia()
+        with self._lock:
+            self.conn.execute("begin immediate")
+            try:
+                out = fn(**params)
+                self.conn.execute("commit")
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+            return out
+
+    # ---------- funções do banco (espelham sql/*.sql) ----------
+    def _rpc_encerrar_romaneio_reserva(self, p_romaneio_id, p_rota):
+        rota = (p_rota or "").strip().upper()
+        if not rota:
+            return {"ok": False, "motivo": "sem_rota"}
+        rom = self.conn.execute(
+            "select id, status, unidade_origem, qtd_volumes from romaneios where id = ?", (int(p_romaneio_id),)
+        ).fetchone()
+        if rom is None:
+            return {"ok": False, "motivo": "nao_encontrado"}
+        if rom["unidade_origem"] != "CD Reserva":
+            return {"ok": False, "motivo": "unidade_invalida"}
+        if rom["status"] == "Encerrado":
+            return {"ok": False, "motivo": "ja_encerrado", "qtd_volumes": rom["qtd_volumes"]}
+        qtd = self.conn.execute(
+            "select count(*) from conferencia_reserva where romaneio_id = ?", (int(p_romaneio_id),)
+        ).fetchone()[0]
+        if qtd == 0:
+            return {"ok": False, "motivo": "sem_volumes", "qtd_volumes": 0}
+        self.conn.execute(
+            f"update romaneios set status = 'Encerrado', data_encerramento = {_AGORA_SQL}, rota = ?, qtd_volumes = ? where id = ?",
+            (rota, qtd, int(p_romaneio_id)),
+        )
+        return {"ok": True, "motivo": None, "qtd_volumes": qtd, "rota": rota}
+
+    def _rpc_monitor_romaneios_abertos(self, p_desde_id=0):
+        abertos = [
+            dict(r) for r in self.conn.execute(
+                "select id, usuario_criou, created_at from romaneios "
+                "where status = 'Aberto' and unidade_origem = 'CD Reserva' order by id"
+            )
+        ]
+        novos = [
+            dict(r) for r in self.conn.execute(
+                "select c.romaneio_id, count(*) as volumes, max(c.data_expedicao) as ultima_bipagem "
+                "from conferencia_reserva c join romaneios r on r.id = c.romaneio_id "
+                "where c.id > ? and r.status = 'Aberto' and r.unidade_origem = 'CD Reserva' "
+                "group by c.romaneio_id",
+                (int(p_desde_id),),
+            )
+        ]
+        marca = self.conn.execute(
+            "select max(id) from conferencia_reserva where id > ?", (int(p_desde_id),)
+        ).fetchone()[0]
+        return {"marca": marca if marca is not None else int(p_desde_id), "abertos": abertos, "novos": novos}
+
+
+# =========================================================
+# CLIENTE SUPABASE (pool HTTP compartilhado + keep-alive)
+# =========================================================
+def http2_disponivel() -> bool:
+    import importlib.util
+
+    return importlib.util.find_spec("h2") is not None
+
+
+def criar_cliente_http():
+    """
+    httpx.Client único para o processo: pool de conexões com keep-alive,
+    HTTP/2 quando o pacote h2 estiver instalado e timeouts configuráveis.
+
+    Variáveis (opcionais):
+      CONFERENCIA_HTTP_TIMEOUT_S (10), CONFERENCIA_HTTP_CONNECT_TIMEOUT_S (5),
+      CONFERENCIA_HTTP_MAX_CONEXOES (20), CONFERENCIA_HTTP_KEEPALIVE (10),
+      CONFERENCIA_HTTP_KEEPALIVE_S (120), CONFERENCIA_HTTP2 (auto | 0 | 1)
+    """
+    import httpx
+
+    timeout = env_float("CONFERENCIA_HTTP_TIMEOUT_S", 10)
+    connect = env_float("CONFERENCIA_HTTP_CONNECT_TIMEOUT_S", 5)
+    pref_http2 = (os.environ.get("CONFERENCIA_HTTP2") or "auto").strip().lower()
+    http2 = http2_disponivel() if pref_http2 == "auto" else pref_http2 in ("1", "true", "sim")
+
+    return httpx.Client(
+        http2=http2,
+        timeout=httpx.Timeout(timeout, connect=connect),
+        limits=httpx.Limits(
+            max_connections=int(env_float("CONFERENCIA_HTTP_MAX_CONEXOES", 20)),
+            max_keepalive_connections=int(env_float("CONFERENCIA_HTTP_KEEPALIVE", 10)),
+            keepalive_expiry=env_float("CONFERENCIA_HTTP_KEEPALIVE_S", 120),
+        ),
+    )
+
+
+def criar_cliente_supabase(url: str, key: str):
+    from supabase import create_client
+    from supabase.lib.client_options import SyncClientOptions
+
+    http_client = criar_cliente_http()
+    opcoes = SyncClientOptions(httpx_client=http_client)
+    return create_client(url, key, options=opcoes)
+
+
+# =========================================================
+# FÁBRICA
+# =========================================================
+_BACKENDS_LOCAIS: dict[str, SQLiteBackend] = {}
+_LOCK_LOCAIS = threading.Lock()
+
+
+def criar_backend(url: str | None = None, key: str | None = None) -> Backend:
+    """
+    Escolhe o backend pela variável CONFERENCIA_BACKEND:
+    - vazia / "supabase": usa url/key do Supabase
+    - "sqlite:///caminho.db" ou "sqlite://:memory:": usa SQLite local
+      (CONFERENCIA_LATENCIA_MS simula latência por request,
+      CONFERENCIA_CONEXAO_MS o handshake de cada cliente novo e
+      CONFERENCIA_FALHA_PCT a fração de requests que falham)
+    """
+    alvo = (os.environ.get("CONFERENCIA_BACKEND") or "supabase").strip()
+
+    if alvo.startswith("sqlite://"):
+        caminho = alvo[len("sqlite://"):]
+        if caminho in ("", "/:memory:"):
+            caminho = ":memory:"
+        latencia = env_float("CONFERENCIA_LATENCIA_MS", 0)
+        conexao = env_float("CONFERENCIA_CONEXAO_MS", 0)
+        # um único banco por caminho no processo (o banco :memory: vive na conexão)
+        with _LOCK_LOCAIS:
+            be = _BACKENDS_LOCAIS.get(caminho)
+            if be is None:
+                be = _BACKENDS_LOCAIS[caminho] = SQLiteBackend(caminho, latencia_ms=latencia, conexao_ms=conexao)
+            be.latencia_ms = latencia
+            be.conexao_ms = conexao
+            be.falha_pct = env_float("CONFERENCIA_FALHA_PCT", 0)
+            return be.nova_conexao()
+
+    if not url or not key:
+        raise ValueError("Credenciais do Supabase não informadas.")
+
+    return SupabaseBackend(criar_cliente_supabase(url, key))
+
+
+def backend_local_configurado() -> bool:
+    return (os.environ.get("CONFERENCIA_BACKEND") or "").strip().startswith("sqlite://")
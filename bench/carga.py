@@ -0,0 +1,307 @@
+"""
+Teste de carga: N operadores simulados contra um processo só do app e o SQLite local.
+
+Cada operador é uma sessão (AppTest, caches do processo compartilhados) numa thread
+própria, como as sessões de um servidor Streamlit. Papéis, na proporção de --mix:
+  reserva   abre romaneio, bipa --caixas-romaneio volumes e encerra; abre outro
+  pavuna    carrega romaneios encerrados (multi) e bipa o recebimento
+  espelho   a cada --intervalo-espelho-s adiciona romaneios recebidos e finaliza o espelho
+Bipagens chegam a cada --intervalo-s (±50%); se o app demora mais que isso o
+operador atrasa, como no galpão. Cada nível de --sessoes roda --duracao segundos
+com sessões novas e reporta CPU do processo, memória por sessão (RSS e session_state),
+consultas/s ao backend e latências por ação.
+
+A CPU medida inclui o próprio AppTest (montagem da árvore de elementos a cada
+rerun): é um teto pessimista para o servidor real.
+
+Uso:
+    python bench/carga.py --sessoes 1 2 4 8 --duracao 30
+    python bench/carga.py --sessoes 4 8 16 --mix 3:2:1 --intervalo-s 1 --latencia-ms 30 --json carga.json
+"""
+import argparse
+import gc
+import json
+import math
+import random
+import threading
+import time
+
+from comum import (
+    caixa,
+    nova_sessao,
+    percentil,
+    permitir_sessoes_concorrentes,
+    preparar_backend,
+    semear_faturamento,
+    semear_romaneios_encerrados,
+    verificar,
+)
+
+PAPEIS = ["reserva", "pavuna", "espelho"]
+ROMANEIOS_POR_CARGA = 4
+
+
+def rss_mib() -> float:
+    """RSS atual do processo (Linux); 0 onde /proc não existe."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def papeis(n: int, mix: str) -> list[str]:
+    """mix "2:2:1" -> reserva, reserva, pavuna, pavuna, espelho, reserva, ... (n sessões)."""
+    pesos = [int(p) for p in mix.split(":")]
+    padrao = [p for p, w in zip(PAPEIS, pesos) for _ in range(w)]
+    return [padrao[i % len(padrao)] for i in range(n)]
+
+
+class Caixas:
+    """Numeração única de caixas entre operadores e níveis."""
+
+    def __init__(self):
+        self.proxima = 0
+
+    def reservar(self, n: int) -> int:
+        inicio, self.proxima = self.proxima, self.proxima + n
+        return inicio
+
+
+# =========================================================
+# OPERADORES
+# =========================================================
+class Operador(threading.Thread):
+    def __init__(self, nome: str, at, args, fim: float, amostras: dict, lock: threading.Lock):
+        super().__init__(name=nome, daemon=True)
+        self.at = at
+        self.args = args
+        self.fim = fim
+        self.amostras = amostras
+        self.lock = lock
+        self.rng = random.Random(nome)
+        self.erro = None
+
+    def medir(self, acao: str, fn):
+        t0 = time.perf_counter()
+        fn()
+        verificar(self.at)
+        with self.lock:
+            self.amostras.setdefault(acao, []).append((time.perf_counter() - t0) * 1000)
+
+    def esperar(self, intervalo: float) -> bool:
+        """Dorme ~intervalo (±50%); False quando o tempo do nível acabou."""
+        restante = self.fim - time.monotonic()
+        if restante <= 0:
+            return False
+        time.sleep(min(intervalo * self.rng.uniform(0.5, 1.5), restante))
+        return time.monotonic() < self.fim
+
+    def bipar(self, key: str, valor: str):
+        self.medir("bipagem", lambda: self.at.text_input(key=key).set_value(valor).run())
+
+    def run(self):
+        try:
+            time.sleep(self.rng.uniform(0, self.args.intervalo_s))  # operadores não começam juntos
+            self.trabalhar()
+        except Exception as e:  # a sessão quebrou: conta e para este operador
+            self.erro = f"{type(e).__name__}: {e}"
+
+
+class OperadorReserva(Operador):
+    def __init__(self, *a, caixas: list[str], **kw):
+        super().__init__(*a, **kw)
+        self.caixas = caixas
+
+    def trabalhar(self):
+        self.at.button[0].click().run()
+        verificar(self.at)
+        n = 0
+        for c in self.caixas:
+            if not self.esperar(self.args.intervalo_s):
+                return
+            self.bipar("input_reserva", c)
+            n += 1
+            if n % self.args.caixas_romaneio == 0:
+                self.at.text_input(key="rota_reserva").set_value("ROTA CARGA").run()
+                self.medir("encerrar_reserva", lambda: self.at.button(key="btn_fecha_rom_reserva").click().run())
+                self.at.button[0].click().run()
+                verificar(self.at)
+
+
+class OperadorPavuna(Operador):
+    def __init__(self, *a, romaneios: list[int], caixas: list[str], **kw):
+        super().__init__(*a, **kw)
+        self.romaneios = romaneios
+        self.caixas = caixas
+
+    def trabalhar(self):
+        self.at.text_area(key="rom_multi_input").set_value("\n".join(map(str, self.romaneios))).run()
+        self.medir("carregar_pavuna", lambda: self.at.button(key="btn_carregar_multi").click().run())
+        for c in self.caixas:
+            if not self.esperar(self.args.intervalo_s):
+                return
+            self.bipar("input_pavuna_multi", c)
+
+
+class OperadorEspelho(Operador):
+    def __init__(self, *a, cargas: list[list[int]], **kw):
+        super().__init__(*a, **kw)
+        self.cargas = cargas
+
+    def trabalhar(self):
+        self.at.radio(key="modo_pavuna").set_value("🚛 Expedição CD Pavuna (Romaneio Espelho)").run()
+        verificar(self.at)
+        for ids in self.cargas:
+            if not self.esperar(self.args.intervalo_espelho_s):
+                return
+            self.at.text_area(key="roms_espelho_input").set_value("\n".join(map(str, ids))).run()
+            self.medir("carregar_espelho", lambda: self.at.button(key="btn_add_roms_espelho").click().run())
+            self.at.text_input(key="rota_espelho").set_value("ROTA CARGA").run()
+            self.medir("finalizar_espelho", lambda: self.at.button(key="btn_finalizar_espelho").click().run())
+            self.at.button(key="btn_ok_novo_espelho").click().run()
+            verificar(self.at)
+
+
+# =========================================================
+# NÍVEL DE CONCORRÊNCIA
+# =========================================================
+def preparar_operadores(be, args, n: int, numeracao: Caixas) -> list[tuple]:
+    """Sementes e sessões de um nível (fora da medição). Retorna (classe, sessão, kwargs) por operador."""
+    bipagens = math.ceil(args.duracao / (args.intervalo_s * 0.5)) + 1  # teto: todas no intervalo mínimo
+    cargas = math.ceil(args.duracao / (args.intervalo_espelho_s * 0.5)) + 1
+    planos = []
+    for i, papel in enumerate(papeis(n, args.mix)):
+        if papel == "reserva":
+            inicio = numeracao.reservar(bipagens)
+            semear_faturamento(be, bipagens, inicio=inicio)
+            kw = {"caixas": [caixa(inicio + j) for j in range(bipagens)]}
+            planos.append((OperadorReserva, "CD Reserva", kw))
+        elif papel == "pavuna":
+            por_rom = math.ceil(bipagens / ROMANEIOS_POR_CARGA)
+            inicio = numeracao.reservar(por_rom * ROMANEIOS_POR_CARGA)
+            ids, cxs = semear_romaneios_encerrados(be, ROMANEIOS_POR_CARGA, por_rom, inicio=inicio)
+            planos.append((OperadorPavuna, "CD Pavuna", {"romaneios": ids, "caixas": cxs}))
+        else:
+            lista = []
+            for _ in range(cargas):
+                inicio = numeracao.reservar(ROMANEIOS_POR_CARGA * args.caixas_espelho)
+                ids, _ = semear_romaneios_encerrados(be, ROMANEIOS_POR_CARGA, args.caixas_espelho, recebidos=True, inicio=inicio)
+                semear_faturamento(be, ROMANEIOS_POR_CARGA * args.caixas_espelho, inicio=inicio)
+                lista.append(ids)
+            planos.append((OperadorEspelho, "CD Pavuna", {"cargas": lista}))
+
+    return [
+        (cls, nova_sessao(unidade, usuario=f"carga{i}@azzas", limpar_cache=False), kw)
+        for i, (cls, unidade, kw) in enumerate(planos)
+    ]
+
+
+def tamanho_sessao(at) -> int:
+    from estado_sessao import medir_sessao
+
+    return int(medir_sessao(at.session_state)["bytes"].sum())
+
+
+def rodar_nivel(be, args, n: int, numeracao: Caixas) -> dict:
+    gc.collect()
+    rss_base = rss_mib()
+    planos = preparar_operadores(be, args, n, numeracao)
+    gc.collect()
+    rss_sessoes = rss_mib()
+
+    amostras, lock = {}, threading.Lock()
+    fim = time.monotonic() + args.duracao
+    operadores = [
+        cls(f"op{i}", at, args, fim, amostras, lock, **kw)
+        for i, (cls, at, kw) in enumerate(planos)
+    ]
+    consultas0, cpu0, t0 = be.n_requests, time.process_time(), time.perf_counter()
+    for op in operadores:
+        op.start()
+    for op in operadores:
+        op.join(timeout=args.duracao + 120)
+    parede = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    consultas = be.n_requests - consultas0
+    rss_fim = rss_mib()
+
+    bytes_estado = sorted(tamanho_sessao(op.at) for op in operadores)
+    res = {
+        "sessoes": n,
+        "papeis": {p: papeis(n, args.mix).count(p) for p in PAPEIS},
+        "segundos": round(parede, 1),
+        "cpu_pct": round(100 * cpu / parede, 1),
+        "rss_mib": round(rss_fim, 1),
+        "mib_por_sessao": round((rss_fim - rss_base) / n, 2),
+        "mib_abrir_sessao": round((rss_sessoes - rss_base) / n, 2),
+        "estado_kib_p50": round(percentil(bytes_estado, 50) / 1024, 1),
+        "estado_kib_max": round(bytes_estado[-1] / 1024, 1),
+        "consultas_por_s": round(consultas / parede, 1),
+        "bipagens_por_s": round(len(amostras.get("bipagem", [])) / parede, 2),
+        "erros": [f"{op.name}: {op.erro}" for op in operadores if op.erro],
+        "acoes": {
+            acao: {
+                "n": len(ms),
+                "p50_ms": round(percentil(ms, 50), 1),
+                "p95_ms": round(percentil(ms, 95), 1),
+                "p99_ms": round(percentil(ms, 99), 1),
+                "max_ms": round(max(ms), 1),
+            }
+            for acao, ms in sorted(amostras.items())
+        },
+    }
+    del operadores, planos
+    return res
+
+
+def imprimir(r: dict):
+    b = r["acoes"].get("bipagem", {})
+    print(
+        f"{r['sessoes']:>3} sessões {r['papeis']}  cpu={r['cpu_pct']:>5}%  rss={r['rss_mib']:.0f} MiB "
+        f"({r['mib_por_sessao']:+} MiB/sessão, estado p50={r['estado_kib_p50']} KiB)  "
+        f"consultas/s={r['consultas_por_s']}  bipagens/s={r['bipagens_por_s']}  "
+        f"bipagem p50={b.get('p50_ms', 0)} p95={b.get('p95_ms', 0)} p99={b.get('p99_ms', 0)} ms"
+    )
+    for acao, a in r["acoes"].items():
+        if acao != "bipagem":
+            print(f"      {acao:<18} n={a['n']:<4} p50={a['p50_ms']}ms p95={a['p95_ms']}ms max={a['max_ms']}ms")
+    for e in r["erros"]:
+        print(f"      ERRO {e}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga multi-sessão (AppTest em threads + SQLite local).")
+    ap.add_argument("--sessoes", type=int, nargs="+", default=[1, 2, 4, 8], help="níveis de concorrência")
+    ap.add_argument("--duracao", type=float, default=30.0, help="segundos por nível")
+    ap.add_argument("--mix", default="2:2:1", help="proporção reserva:pavuna:espelho")
+    ap.add_argument("--intervalo-s", type=float, default=2.0, help="intervalo médio entre bipagens de um operador")
+    ap.add_argument("--intervalo-espelho-s", type=float, default=20.0, help="intervalo médio entre espelhos")
+    ap.add_argument("--caixas-romaneio", type=int, default=40, help="volumes por romaneio da Reserva antes de encerrar")
+    ap.add_argument("--caixas-espelho", type=int, default=25, help="caixas por romaneio em cada carga de espelho")
+    ap.add_argument("--latencia-ms", type=float, default=30.0, help="latência simulada por request ao backend")
+    ap.add_argument("--conexao-ms", type=float, default=80.0, help="handshake simulado de cada cliente novo")
+    ap.add_argument("--json", help="grava os resultados em JSON neste arquivo")
+    args = ap.parse_args()
+
+    be = preparar_backend("carga", args.latencia_ms, args.conexao_ms)
+    permitir_sessoes_concorrentes()
+    nova_sessao("CD Reserva")  # processo aquecido (caches de recurso, imports) antes do primeiro nível
+    numeracao = Caixas()
+
+    resultados = []
+    for n in args.sessoes:
+        r = rodar_nivel(be, args, n, numeracao)
+        imprimir(r)
+        resultados.append(r)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+MAIN = os.path.join(RAIZ, "main.py")
+
+
+# =========================================================
+# BACKEND LOCAL + SEMENTES
+# =========================================================
+def preparar_backend(nome: str, latencia_ms: float = 0.0, conexao_ms: float = 0.0):
+    """
+    Aponta o app para um SQLite novo (um arquivo por cenário) e devolve o backend.
+    O app e o benchmark compartilham a mesma instância (criar_backend é por processo).
+    """
+    from backend import criar_backend
+
+    pasta = tempfile.mkdtemp(prefix="bench_conferencia_")
+    os.environ["CONFERENCIA_BACKEND"] = f"sqlite://{os.path.join(pasta, nome + '.db')}"
+    os.environ["CONFERENCIA_LATENCIA_MS"] = str(latencia_ms)
+    os.environ["CONFERENCIA_CONEXAO_MS"] = str(conexao_ms)
+    # cache de faturamento em disco isolado por cenário (não reaproveita execuções anteriores)
+    os.environ["CONFERENCIA_CACHE_DIR"] = os.path.join(pasta, "cache")
+    os.environ["CONFERENCIA_JORNAL_DIR"] = os.path.join(pasta, "jornal")
+    os.environ["CONFERENCIA_ARQUIVO_DIR"] = os.path.join(pasta, "arquivo")
+    return criar_backend()
+
+
+def caixa(i: int) -> str:
+    return f"F{2830000 + i:07d}"
+
+
+def semear_faturamento(be, n: int, inicio: int = 0):
+    rows = [
+        {
+            "caixa": caixa(i),
+            "filial_origem": f"FILIAL {i % 7}",
+            "destino": f"LOJA {i % 40:02d}",
+            "qtde_pecas": 1 + i % 30,
+        }
+        for i in range(inicio, inicio + n)
+    ]
+    lat, be.latencia_ms = be.latencia_ms, 0
+    try:
+        for i in range(0, len(rows), 5000):
+            be.insert("faturamento", rows[i:i + 5000])
+    finally:
+        be.latencia_ms = lat
+
+
+def semear_romaneios_encerrados(be, n_romaneios: int, caixas_por_romaneio: int, recebidos: bool = False, inicio: int = 0):
+    """Cria romaneios encerrados da Reserva com volumes já bipados. Retorna (ids, caixas)."""
+    from helpers import get_now_utc
+
+    lat, be.latencia_ms = be.latencia_ms, 0
+    ids, todas = [], []
+    try:
+        for r in range(n_romaneios):
+            rid = be.insert("romaneios", {
+                "usuario_criou": "bench@azzas",
+                "unidade_origem": "CD Reserva",
+                "status": "Encerrado",
+                "rota": "ROTA BENCH",
+                "data_encerramento": get_now_utc(),
+            })[0]["id"]
+            cxs = [caixa(inicio + r * caixas_por_romaneio + i) for i in range(caixas_por_romaneio)]
+            be.insert("conferencia_reserva", [
+                {
+                    "chave_nfe": c,
+                    "romaneio_id": rid,
+                    "data_expedicao": get_now_utc(),
+                    "data_recebimento": get_now_utc() if recebidos else None,
+                }
+                for c in cxs
+            ])
+            ids.append(rid)
+            todas.extend(cxs)
+    finally:
+        be.latencia_ms = lat
+    return ids, todas
+
+
+# =========================================================
+# APPTEST
+# =========================================================
+def silenciar_streamlit():
+    # AppTest roda sem runtime: os avisos de ScriptRunContext são esperados
+    for nome in list(logging.root.manager.loggerDict):
+        if nome.startswith("streamlit"):
+            logging.getLogger(nome).setLevel(logging.ERROR)
+
+
+def permitir_sessoes_concorrentes():
+    """
+    O AppTest foi feito para uma sessão por vez; o servidor roda várias em threads.
+    Ajustes (só no processo do benchmark) para várias sessões rodarem juntas:
+      - um ScriptCache só: o servidor compila o main.py uma vez por processo, o AppTest
+        compila a cada rerun (e o compile() concorrente do CPython 3.11 falha);
+      - o Runtime falso de um rerun não some no meio do rerun de outra sessão
+        (cada AppTest o zera ao terminar).
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    compartilhado = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: compartilhado
+
+    ultimo = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            ultimo["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" in ultimo:
+            return ultimo["runtime"]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in ultimo)
+
+
+def nova_sessao(unidade: str, usuario: str = "bench@azzas", timeout: float = 60, limpar_cache: bool = True):
+    """limpar_cache=False: nova sessão no mesmo processo, reaproveitando os caches das anteriores."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    silenciar_streamlit()
+
+    if limpar_cache:
+        st.cache_data.clear()
+        st.cache_resource.clear()
+    at = AppTest.from_file(MAIN, default_timeout=timeout)
+    at.session_state["auth"] = True
+    at.session_state["user_email"] = usuario
+    at.session_state["unidade"] = unidade
+    # o AppTest não dirige componentes customizados: bipa pelo campo de texto
+    at.session_state["entrada_simples"] = True
+    at.run()
+    verificar(at)
+    return at
+
+
+def verificar(at):
+    if at.exception:
+        raise RuntimeError(f"Erro no app: {at.exception[0].value}")
+
+
+# =========================================================
+# MEDIÇÃO
+# =========================================================
+def percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100.0
+    f = int(k)
+    c = min(f + 1, len(ordenados) - 1)
+    return ordenados[f] + (ordenados[c] - ordenados[f]) * (k - f)
+
+
+@dataclass
+class Resultado:
+    fluxo: str
+    latencias_ms: list = field(default_factory=list)
+    consultas: list = field(default_factory=list)
+    extras: dict = field(default_factory=dict)
+
+    def medir(self, be, fn):
+        antes = be.n_requests
+        t0 = time.perf_counter()
+        fn()
+        self.latencias_ms.append((time.perf_counter() - t0) * 1000)
+        self.consultas.append(be.n_requests - antes)
+
+    def resumo(self) -> dict:
+        total_s = sum(self.latencias_ms) / 1000.0
+        n = len(self.latencias_ms)
+        return {
+            "fluxo": self.fluxo,
+            "eventos": n,
+            "por_segundo": round(n / total_s, 2) if total_s else 0.0,
+            "primeiro_ms": round(self.latencias_ms[0], 1) if n else 0.0,
+            "p50_ms": round(percentil(self.latencias_ms, 50), 1),
+            "p95_ms": round(percentil(self.latencias_ms, 95), 1),
+            "p99_ms": round(percentil(self.latencias_ms, 99), 1),
+            "consultas_por_evento": round(sum(self.consultas) / n, 2) if n else 0.0,
+            **self.extras,
+        }
@@ -0,0 +1,157 @@
+"""
+Benchmark da conciliação (conciliacao.py) contra o SQLite local.
+
+Semeia `--dias` dias passados com `--volumes` volumes por dia e divergências
+conhecidas, roda o período a frio (sem cache) e de novo (dias encerrados em cache)
+e confere as contagens por tipo. Depois carrega o faturamento que faltava (e a
+qtde corrigida) e roda do cache: essas divergências têm de sumir sem recalcular o dia.
+Reporta linhas/s, consultas e pico de memória.
+Com --arquivar, move tudo para o arquivo frio (arquivo.py) e roda de novo, lendo
+do Parquet: as contagens têm de continuar iguais.
+
+Uso:
+    python bench/conciliacao.py --dias 5 --volumes 20000
+    python bench/conciliacao.py --dias 30 --volumes 5000 --latencia-ms 20 --pagina 1000
+    python bench/conciliacao.py --dias 5 --volumes 10000 --arquivar
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import timedelta
+
+from comum import caixa, preparar_backend
+
+
+def semear(be, dias: int, volumes: int, por_romaneio: int = 200) -> dict:
+    """Por dia: 1% não recebido, 1% sem espelho, 1 espelho por romaneio (0,5% sem faturamento, 0,5% qtde diferente)."""
+    import pandas as pd
+
+    from conciliacao import FUSO
+
+    esperado = dict.fromkeys(["expedido_nao_recebido", "recebido_sem_espelho", "espelho_sem_faturamento",
+                              "qtde_pecas_divergente", "qtd_volumes_divergente", "qtd_caixas_divergente"], 0)
+    hoje = pd.Timestamp.now(tz=FUSO).normalize()
+    lat, be.latencia_ms = be.latencia_ms, 0
+    n = 0
+    atrasado = []  # faturamento que "chega depois" (rodada ingest)
+    try:
+        for d in range(dias, 0, -1):
+            ts = (hoje - timedelta(days=d) + timedelta(hours=12)).tz_convert("UTC").isoformat()
+            for r0 in range(0, volumes, por_romaneio):
+                cxs = [caixa(n + i) for i in range(min(por_romaneio, volumes - r0))]
+                n += len(cxs)
+                qtd_volumes = len(cxs) + (1 if r0 == 0 else 0)  # 1 romaneio por dia com qtd_volumes errada
+                esperado["qtd_volumes_divergente"] += 1 if r0 == 0 else 0
+                rid = be.insert("romaneios", {
+                    "usuario_criou": "bench@azzas", "unidade_origem": "CD Reserva", "status": "Encerrado",
+                    "rota": "ROTA BENCH", "data_encerramento": ts, "qtd_volumes": qtd_volumes,
+                })[0]["id"]
+                nao_rec = set(cxs[::100])
+                sem_esp = set(cxs[1::100])
+                esperado["expedido_nao_recebido"] += len(nao_rec)
+                esperado["recebido_sem_espelho"] += len(sem_esp)
+                be.insert("conferencia_reserva", [
+                    {"chave_nfe": c, "romaneio_id": rid, "data_expedicao": ts,
+                     "data_recebimento": None if c in nao_rec else ts}
+                    for c in cxs
+                ])
+
+                no_espelho = [c for c in cxs if c not in nao_rec and c not in sem_esp]
+                sem_fat = set(no_espelho[::200])
+                qtde_errada = set(no_espelho[100::200])
+                esperado["espelho_sem_faturamento"] += len(sem_fat)
+                esperado["qtde_pecas_divergente"] += len(qtde_errada)
+                atrasado += [(c, 10) for c in sem_fat] + [(c, 11) for c in qtde_errada]
+                be.insert("faturamento", [
+                    {"caixa": c, "filial_origem": "FILIAL", "destino": "LOJA", "qtde_pecas": 10, "created_at": ts}
+                    for c in cxs if c not in sem_fat
+                ])
+                esp_id = be.insert("romaneios_espelho", {
+                    "usuario_criou": "bench@azzas", "unidade_origem": "CD Pavuna", "status": "Encerrado",
+                    "romaneios_origem": str([rid]), "qtd_caixas": len(no_espelho), "rota": "ROTA BENCH", "criado_em": ts,
+                })[0]["id"]
+                be.insert("romaneio_espelho_itens", [
+                    {"romaneio_espelho_id": esp_id, "caixa": c, "filial_origem": "FILIAL", "destino": "LOJA",
+                     "qtde_pecas": 11 if c in qtde_errada else 10}
+                    for c in no_espelho
+                ])
+    finally:
+        be.latencia_ms = lat
+    esperado["linhas"] = n
+    esperado["atrasado"] = atrasado
+    return esperado
+
+
+def rodar(conc, inicio, fim, be, usar_cache: bool = True) -> dict:
+    antes = be.n_requests
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    div, resumo = conc.periodo(inicio, fim, usar_cache=usar_cache)
+    seg = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "segundos": round(seg, 2),
+        "consultas": be.n_requests - antes,
+        "pico_mib": round(pico / 2**20, 1),
+        "dias_cache": int(resumo["cache"].sum()),
+        "por_tipo": div["tipo"].value_counts().to_dict(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark da conciliação (SQLite local).")
+    ap.add_argument("--dias", type=int, default=5)
+    ap.add_argument("--volumes", type=int, default=10000, help="volumes expedidos por dia")
+    ap.add_argument("--latencia-ms", type=float, default=0.0)
+    ap.add_argument("--pagina", type=int, default=1000, help="linhas por página")
+    ap.add_argument("--arquivar", action="store_true", help="repete com os dias movidos para o arquivo frio")
+    args = ap.parse_args()
+
+    be = preparar_backend("conciliacao", args.latencia_ms, 0)
+    esperado = semear(be, args.dias, args.volumes)
+    linhas = esperado.pop("linhas")
+    atrasado = esperado.pop("atrasado")
+
+    from conciliacao import FUSO, criar_conciliacao
+    from repositorios import Repositorios
+
+    import pandas as pd
+
+    hoje = pd.Timestamp.now(tz=FUSO).date()
+    inicio, fim = hoje - timedelta(days=args.dias), hoje - timedelta(days=1)
+    from arquivo import arquivar, criar_arquivo
+
+    arq = criar_arquivo()
+    conc = criar_conciliacao(Repositorios(be, arquivo=arq))
+    conc.tamanho_pagina = args.pagina
+
+    rodadas = [("frio", True), ("cache", True), ("ingest", True)]
+    if args.arquivar:
+        rodadas.append(("parquet", False))
+    for rodada, usar_cache in rodadas:
+        if rodada == "ingest":
+            agora = pd.Timestamp.now(tz="UTC").isoformat()
+            be.insert("faturamento", [
+                {"caixa": c, "filial_origem": "FILIAL", "destino": "LOJA", "qtde_pecas": q, "created_at": agora}
+                for c, q in atrasado
+            ])
+            esperado["espelho_sem_faturamento"] = esperado["qtde_pecas_divergente"] = 0
+        if rodada == "parquet":
+            t0 = time.perf_counter()
+            movido = arquivar(be, arq, idade_dias=0.5, executar=True, log=lambda m: None)
+            print(
+                f"arquivo: {movido['volumes']} volumes + {movido['itens']} itens em {time.perf_counter() - t0:.1f}s  "
+                f"banco agora: {be.count('conferencia_reserva', [])} volumes, {be.count('romaneio_espelho_itens', [])} itens"
+            )
+        r = rodar(conc, inicio, fim, be, usar_cache)
+        print(
+            f"{rodada:<7} {linhas} volumes em {r['segundos']}s ({linhas / max(r['segundos'], 1e-9):,.0f}/s)  "
+            f"consultas={r['consultas']}  pico={r['pico_mib']} MiB  dias em cache={r['dias_cache']}"
+        )
+        divergentes = {t: (r["por_tipo"].get(t, 0), n) for t, n in esperado.items() if r["por_tipo"].get(t, 0) != n}
+        print("        contagens conferem" if not divergentes else f"        DIFERENTE (achado, esperado): {divergentes}")
+
+
+if __name__ == "__main__":
+    main()
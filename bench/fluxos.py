@@ -0,0 +1,160 @@
+"""
+Benchmark de bipagem ponta a ponta (headless, via streamlit AppTest).
+
+Executa os fluxos reais do main.py contra o SQLite local com latência
+simulada por request e reporta bipagens/s, p50/p95/p99 e consultas por bipagem.
+
+Uso:
+    python bench/fluxos.py --latencia-ms 40 --caixas 200
+    python bench/fluxos.py --fluxos reserva pavuna_multi --json resultado.json
+    python bench/fluxos.py --lote 10   # 10 caixas por rerun, como um lote do leitor
+"""
+import argparse
+import json
+
+from comum import (
+    Resultado,
+    caixa,
+    nova_sessao,
+    preparar_backend,
+    semear_faturamento,
+    semear_romaneios_encerrados,
+    verificar,
+)
+
+
+def bipar(at, key: str, valor: str):
+    at.text_input(key=key).set_value(valor).run()
+    verificar(at)
+
+
+def em_lotes(caixas: list[str], tamanho: int) -> list[str]:
+    """Junta as caixas em leituras de `tamanho` (um rerun por lote, mesmo caminho do leitor)."""
+    return [" ".join(caixas[i:i + tamanho]) for i in range(0, len(caixas), tamanho)]
+
+
+# =========================================================
+# FLUXOS
+# =========================================================
+def fluxo_reserva(args) -> Resultado:
+    be = preparar_backend("reserva", args.latencia_ms, args.conexao_ms)
+    semear_faturamento(be, args.faturamento)
+    res = Resultado("reserva (reg_reserva)")
+
+    at = nova_sessao("CD Reserva")
+    at.button[0].click().run()
+    verificar(at)
+
+    for lote in em_lotes([caixa(i) for i in range(args.caixas)], args.lote):
+        res.medir(be, lambda lote=lote: bipar(at, "input_reserva", lote))
+
+    at.text_input(key="rota_reserva").set_value("ROTA BENCH").run()
+    antes = be.n_requests
+    at.button(key="btn_fecha_rom_reserva").click().run()
+    verificar(at)
+    res.extras["consultas_encerramento"] = be.n_requests - antes
+    return res
+
+
+def fluxo_pavuna_multi(args) -> Resultado:
+    be = preparar_backend("pavuna_multi", args.latencia_ms, args.conexao_ms)
+    por_rom = max(args.caixas // args.romaneios, 1)
+    ids, caixas = semear_romaneios_encerrados(be, args.romaneios, por_rom)
+    res = Resultado("pavuna multi (reg_pavuna_multi)")
+
+    at = nova_sessao("CD Pavuna")
+    at.text_area(key="rom_multi_input").set_value("\n".join(map(str, ids))).run()
+    antes = be.n_requests
+    at.button(key="btn_carregar_multi").click().run()
+    verificar(at)
+    res.extras["consultas_carga"] = be.n_requests - antes
+
+    for lote in em_lotes(caixas, args.lote):
+        res.medir(be, lambda lote=lote: bipar(at, "input_pavuna_multi", lote))
+    return res
+
+
+def fluxo_pavuna_single(args) -> Resultado:
+    be = preparar_backend("pavuna_single", args.latencia_ms, args.conexao_ms)
+    ids, caixas = semear_romaneios_encerrados(be, 1, args.caixas)
+    res = Resultado("pavuna single (reg_pavuna_single)")
+
+    at = nova_sessao("CD Pavuna")
+    at.toggle[0].set_value(False).run()
+    at.text_input(key="rom_single_input").set_value(str(ids[0])).run()
+    at.button(key="btn_abrir_single").click().run()
+    verificar(at)
+
+    for lote in em_lotes(caixas, args.lote):
+        res.medir(be, lambda lote=lote: bipar(at, "input_pavuna_single", lote))
+    return res
+
+
+def fluxo_espelho(args) -> Resultado:
+    be = preparar_backend("espelho", args.latencia_ms, args.conexao_ms)
+    por_rom = max(args.caixas // args.romaneios, 1)
+    semear_faturamento(be, args.faturamento)
+    res = Resultado("espelho (carga + finalização)")
+
+    at = nova_sessao("CD Pavuna")
+    at.radio(key="modo_pavuna").set_value("🚛 Expedição CD Pavuna (Romaneio Espelho)").run()
+    verificar(at)
+
+    for rodada in range(args.rodadas_espelho):
+        ids, _ = semear_romaneios_encerrados(
+            be, args.romaneios, por_rom, recebidos=True, inicio=rodada * args.romaneios * por_rom
+        )
+        at.text_area(key="roms_espelho_input").set_value("\n".join(map(str, ids))).run()
+        res.medir(be, lambda: (at.button(key="btn_add_roms_espelho").click().run(), verificar(at)))
+
+        at.text_input(key="rota_espelho").set_value("ROTA BENCH").run()
+        res.medir(be, lambda: (at.button(key="btn_finalizar_espelho").click().run(), verificar(at)))
+
+        at.button(key="btn_ok_novo_espelho").click().run()
+        verificar(at)
+
+    res.extras["caixas_por_carga"] = por_rom * args.romaneios
+    return res
+
+
+FLUXOS = {
+    "reserva": fluxo_reserva,
+    "pavuna_multi": fluxo_pavuna_multi,
+    "pavuna_single": fluxo_pavuna_single,
+    "espelho": fluxo_espelho,
+}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de bipagem (AppTest + SQLite local).")
+    ap.add_argument("--fluxos", nargs="+", choices=list(FLUXOS), default=list(FLUXOS))
+    ap.add_argument("--latencia-ms", type=float, default=30.0, help="latência simulada por request ao backend")
+    ap.add_argument("--conexao-ms", type=float, default=80.0, help="handshake simulado de cada cliente novo (TCP + TLS)")
+    ap.add_argument("--caixas", type=int, default=100, help="caixas bipadas por fluxo")
+    ap.add_argument("--romaneios", type=int, default=4, help="romaneios carregados nos fluxos multi/espelho")
+    ap.add_argument("--faturamento", type=int, default=5000, help="linhas semeadas em faturamento")
+    ap.add_argument("--rodadas-espelho", type=int, default=3)
+    ap.add_argument("--lote", type=int, default=1, help="caixas por bipagem (lote do leitor); 1 = uma por rerun")
+    ap.add_argument("--json", help="grava o resumo em JSON neste arquivo")
+    args = ap.parse_args()
+
+    resumos = []
+    for nome in args.fluxos:
+        r = FLUXOS[nome](args).resumo()
+        if nome != "espelho":
+            r["caixas_por_segundo"] = round(r["por_segundo"] * args.lote, 2)
+        resumos.append(r)
+        print(
+            f"{r['fluxo']:<36} n={r['eventos']:<5} {r['por_segundo']:>7}/s  1º={r['primeiro_ms']:>7}ms  "
+            f"p50={r['p50_ms']:>7}ms  p95={r['p95_ms']:>7}ms  p99={r['p99_ms']:>7}ms  "
+            f"consultas/evento={r['consultas_por_evento']}"
+            + (f"  caixas/s={r['caixas_por_segundo']}" if "caixas_por_segundo" in r else "")
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resumos}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark da leitura de códigos em lote (codigos.py) contra o caminho por texto
+(extrair_caixas + validação da NF-e em Python puro).
+
+Gera uma colagem com caixas, chaves NF-e válidas/inválidas, leituras
+parciais e lixo, e compara códigos/s e o resultado das duas abordagens.
+
+Uso:
+    python bench/leitura_codigos.py --n 100000
+"""
+import argparse
+import random
+import time
+
+import comum  # noqa: F401  (coloca a raiz do app no sys.path)
+from codigos import PESOS_NFE, classificar, codigos_validos, tokenizar_texto
+from helpers import extrair_caixas
+
+
+def gerar_chave(rng: random.Random, valida: bool = True) -> str:
+    base = (
+        rng.choice(["35", "33", "31", "41"])
+        + f"{rng.randint(20, 26):02d}{rng.randint(1, 12):02d}"
+        + f"{rng.randint(0, 10**14 - 1):014d}"
+        + "55"
+        + f"{rng.randint(1, 999):03d}{rng.randint(1, 10**9 - 1):09d}1{rng.randint(0, 10**8 - 1):08d}"
+    )
+    resto = sum(int(c) * p for c, p in zip(base, PESOS_NFE)) % 11
+    dv = 0 if resto < 2 else 11 - resto
+    if not valida:
+        dv = (dv + 1) % 10
+    return base + str(dv)
+
+
+def gerar_colagem(n: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        x = rng.random()
+        if x < 0.70:
+            out.append(f"F{rng.randint(2800000, 2899999)}")
+        elif x < 0.90:
+            out.append(gerar_chave(rng))
+        elif x < 0.95:
+            out.append(gerar_chave(rng, valida=False))
+        elif x < 0.98:
+            out.append(str(rng.randint(10**10, 10**12)))
+        else:
+            out.append("LIXO-" + str(rng.randint(0, 99)))
+    return out
+
+
+# =========================================================
+# REFERÊNCIA: um texto por vez, em Python
+# =========================================================
+def dv_valido_py(chave: str) -> bool:
+    resto = sum(int(c) * p for c, p in zip(chave[:43], PESOS_NFE)) % 11
+    return (0 if resto < 2 else 11 - resto) == int(chave[43])
+
+
+def referencia(linhas: list[str]) -> list[str]:
+    vistos, out = set(), []
+    for linha in linhas:
+        for c in extrair_caixas(linha):
+            if c.isdigit():
+                if len(c) != 44 or not dv_valido_py(c):
+                    continue
+            elif not c[0].isalpha() or not c[1:].isdigit() or len(c) < 8:
+                continue
+            if c not in vistos:
+                vistos.add(c)
+                out.append(c)
+    return out
+
+
+def medir(nome: str, fn, n: int, repeticoes: int):
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        res = fn()
+        tempos.append(time.perf_counter() - t0)
+    melhor = min(tempos)
+    print(f"{nome:<34} {melhor * 1000:9.1f} ms   {n / melhor:>12,.0f} códigos/s")
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark da leitura de códigos em lote.")
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    args = ap.parse_args()
+
+    linhas = gerar_colagem(args.n)
+    texto = "\n".join(linhas)
+
+    ref = medir("referência (por texto)", lambda: referencia(linhas), args.n, args.repeticoes)
+    df = medir("classificar (lista de leituras)", lambda: classificar(linhas), args.n, args.repeticoes)
+    df_txt = medir("classificar (colagem única)", lambda: classificar(tokenizar_texto(texto)), args.n, args.repeticoes)
+
+    validos = codigos_validos(df)
+    assert validos == ref, "resultado diferente da referência"
+    assert codigos_validos(df_txt) == ref
+    print()
+    print(df["tipo"].value_counts().to_string())
+    print(df["motivo"].value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
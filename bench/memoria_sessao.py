@@ -0,0 +1,105 @@
+"""
+Memória por sessão: estado antigo (dict/list de strings + cópias de DataFrame)
+contra o compacto (estado_sessao.py), para o mesmo volume de caixas.
+
+Mede com tamanho_profundo (o mesmo do painel de métricas) e com tracemalloc.
+
+Uso:
+    python bench/memoria_sessao.py --caixas 5000 --romaneios 10
+"""
+import argparse
+import random
+import tracemalloc
+
+import comum
+import pandas as pd
+
+from estado_sessao import ConferenciaCompacta, compactar_espelho, espelho_selecionado, tamanho_profundo
+from helpers import normalize_chave
+
+
+def linhas_conferencia(n_caixas: int, n_romaneios: int) -> list[dict]:
+    rng = random.Random(3)
+    return [
+        {
+            "chave_nfe": comum.caixa(i),
+            "romaneio_id": 1000 + i % n_romaneios,
+            "data_recebimento": "2026-01-01T10:00:00+00:00" if rng.random() < 0.5 else None,
+        }
+        for i in range(n_caixas)
+    ]
+
+
+def df_espelho(n_caixas: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "selecionar": True,
+        "caixa": [comum.caixa(i) for i in range(n_caixas)],
+        "filial_origem": [f"FILIAL {i % 7}" for i in range(n_caixas)],
+        "destino": [f"LOJA {i % 40:02d}" for i in range(n_caixas)],
+        "qtde_pecas": [1 + i % 30 for i in range(n_caixas)],
+        "ja_expedida": [i % 50 == 0 for i in range(n_caixas)],
+        "romaneio_espelho_existente": [7 if i % 50 == 0 else None for i in range(n_caixas)],
+    })
+
+
+# =========================================================
+# ESTADOS
+# =========================================================
+def estado_antigo(rows: list[dict], df: pd.DataFrame) -> dict:
+    map_chave, totais, conferidos = {}, {}, set()
+    for r in rows:
+        c = normalize_chave(r["chave_nfe"])
+        map_chave[c] = r["romaneio_id"]
+        totais[r["romaneio_id"]] = totais.get(r["romaneio_id"], 0) + 1
+        if r["data_recebimento"]:
+            conferidos.add(c)
+    return {
+        "map_chave_para_rom": map_chave,
+        "totais_por_rom": totais,
+        "conferidos_agora_multi": list(conferidos),
+        "espelho_df_full": df.copy(),
+        "espelho_df": df.loc[~df["ja_expedida"], ["caixa", "filial_origem", "destino", "qtde_pecas"]].copy(),
+    }
+
+
+def estado_compacto(rows: list[dict], df: pd.DataFrame, romaneios: list[int]) -> dict:
+    conf, _ = ConferenciaCompacta.de_linhas(rows, romaneios)
+    return {"conf_pavuna_multi": conf, "espelho_df_full": compactar_espelho(df)}
+
+
+def medir(nome: str, fabrica):
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    estado = fabrica()
+    depois = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    alocado = sum(s.size_diff for s in depois.compare_to(antes, "filename"))
+    profundo = sum(tamanho_profundo(v) for v in estado.values())
+    print(f"{nome:<10} tamanho_profundo={profundo / 1024:9.1f} KiB   tracemalloc={alocado / 1024:9.1f} KiB")
+    for k, v in estado.items():
+        print(f"    {k:<24} {tamanho_profundo(v) / 1024:9.1f} KiB")
+    return estado, profundo
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Memória do estado de sessão (antigo x compacto).")
+    ap.add_argument("--caixas", type=int, default=5000)
+    ap.add_argument("--romaneios", type=int, default=10)
+    args = ap.parse_args()
+
+    rows = linhas_conferencia(args.caixas, args.romaneios)
+    df = df_espelho(args.caixas)
+    romaneios = sorted({r["romaneio_id"] for r in rows})
+
+    antigo, b_antigo = medir("antigo", lambda: estado_antigo(rows, df))
+    novo, b_novo = medir("compacto", lambda: estado_compacto(rows, df, romaneios))
+
+    conf = novo["conf_pavuna_multi"]
+    assert conf.totais_por_romaneio() == antigo["totais_por_rom"]
+    assert conf.n_recebidos == len(antigo["conferidos_agora_multi"])
+    assert len(espelho_selecionado(novo["espelho_df_full"])) == len(antigo["espelho_df"])
+    print(f"\nredução: {b_antigo / max(b_novo, 1):.1f}x ({b_antigo / 1024:.0f} KiB -> {b_novo / 1024:.0f} KiB por sessão)")
+
+
+if __name__ == "__main__":
+    main()
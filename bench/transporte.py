@@ -0,0 +1,103 @@
+"""
+Benchmark do transporte de leituras grandes: JSON (lista de dicts -> DataFrame)
+contra CSV (Accept: text/csv do PostgREST -> read_csv tipado, backend.ler_csv).
+
+Gera linhas no formato de public.faturamento, serializa nos dois formatos como
+o PostgREST devolveria e mede o parse até o DataFrame tipado (destino e
+filial_origem em category), o tamanho da resposta e a memória do resultado.
+Mede também o mesmo caminho pelo SQLiteBackend (select + DataFrame x select_df).
+
+Uso:
+    python bench/transporte.py --linhas 50000
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import time
+
+import pandas as pd
+
+import comum  # noqa: F401  (coloca a raiz do app no sys.path)
+from backend import SQLiteBackend, ler_csv, tipar
+from repositorios import FaturamentoRepo
+
+TIPOS = FaturamentoRepo.tipos
+COLUNAS = list(TIPOS)
+
+
+def gerar_linhas(n: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    filiais = [f"FILIAL {i:02d}" for i in range(20)]
+    destinos = [f"LOJA {i:03d}" for i in range(300)]
+    return [
+        {
+            "caixa": f"F{2800000 + i:07d}",
+            "filial_origem": rng.choice(filiais),
+            "destino": rng.choice(destinos) if rng.random() > 0.02 else None,
+            "qtde_pecas": rng.randint(1, 80),
+            "created_at": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00+00:00",
+        }
+        for i in range(n)
+    ]
+
+
+def como_postgrest_csv(linhas: list[dict]) -> str:
+    # cabeçalho + linhas; nulo vira campo vazio
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=COLUNAS, lineterminator="\n")
+    w.writeheader()
+    w.writerows({k: ("" if v is None else v) for k, v in r.items()} for r in linhas)
+    return buf.getvalue()
+
+
+def via_json(payload: str) -> pd.DataFrame:
+    return tipar(pd.DataFrame(json.loads(payload)), TIPOS)
+
+
+def via_csv(payload: str) -> pd.DataFrame:
+    return ler_csv(payload, TIPOS)
+
+
+def medir(nome: str, fn, n: int, repeticoes: int):
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        res = fn()
+        tempos.append(time.perf_counter() - t0)
+    melhor = min(tempos)
+    mem = res.memory_usage(deep=True).sum() / 1024 / 1024
+    print(f"{nome:<34} {melhor * 1000:9.1f} ms   {n / melhor:>12,.0f} linhas/s   {mem:7.1f} MiB")
+    return res, melhor
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Transporte JSON x CSV para leituras grandes.")
+    ap.add_argument("--linhas", type=int, default=50_000)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    args = ap.parse_args()
+
+    linhas = gerar_linhas(args.linhas)
+    p_json = json.dumps(linhas, separators=(",", ":"))
+    p_csv = como_postgrest_csv(linhas)
+    print(f"resposta: json={len(p_json.encode()) / 1024:,.0f} KiB   csv={len(p_csv.encode()) / 1024:,.0f} KiB\n")
+
+    df_j, t_j = medir("json -> DataFrame tipado", lambda: via_json(p_json), args.linhas, args.repeticoes)
+    df_c, t_c = medir("csv -> DataFrame tipado", lambda: via_csv(p_csv), args.linhas, args.repeticoes)
+    pd.testing.assert_frame_equal(df_j[COLUNAS], df_c[COLUNAS], check_dtype=False, check_categorical=False)
+    print(f"csv {t_j / t_c:.1f}x mais rápido\n")
+
+    be = SQLiteBackend()
+    be.insert("faturamento", linhas)
+    colunas = ", ".join(COLUNAS)
+    df_s, t_s = medir("sqlite select -> DataFrame",
+                      lambda: tipar(pd.DataFrame(be.select("faturamento", colunas)), TIPOS), args.linhas, args.repeticoes)
+    df_sd, t_sd = medir("sqlite select_df", lambda: be.select_df("faturamento", colunas, tipos=TIPOS),
+                        args.linhas, args.repeticoes)
+    pd.testing.assert_frame_equal(df_s[COLUNAS], df_sd[COLUNAS], check_dtype=False, check_categorical=False)
+    print(f"select_df {t_s / t_sd:.1f}x mais rápido")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from helpers import chunk_list, env_float
+
+PASTA_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+# =========================================================
+# NÍVEL 2: chave-valor em disco (sobrevive a restart)
+# =========================================================
+class DiscoKV:
+    """
+    Chave-valor em SQLite (um arquivo compartilhado pelos processos do app).
+    Valores em JSON com o instante de gravação (relógio de parede, para o TTL
+    valer entre restarts). A "geração" muda a cada invalidação: os processos
+    que a observam limpam o próprio nível em memória.
+    """
+
+    def __init__(self, caminho: str, ttl: float):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.execute("create table if not exists kv (chave text primary key, valor text, ts real not null)")
+        self._conn.execute("create table if not exists meta (nome text primary key, valor integer not null)")
+        self._conn.execute("insert or ignore into meta (nome, valor) values ('geracao', 0)")
+        self._conn.execute("delete from kv where ts < ?", (time.time() - ttl,))
+
+    def buscar(self, chaves: list[str]) -> dict:
+        """Retorna {chave: (ts_gravacao, valor)} das chaves ainda dentro do TTL."""
+        limite = time.time() - self.ttl
+        out = {}
+        with self._lock:
+            for part in chunk_list(chaves, size=500):
+                marcadores = ",".join("?" * len(part))
+                cur = self._conn.execute(
+                    f"select chave, valor, ts from kv where ts >= ? and chave in ({marcadores})", [limite, *part]
+                )
+                for chave, valor, ts in cur:
+                    out[chave] = (ts, json.loads(valor))
+        return out
+
+    def gravar(self, valores: dict):
+        if not valores:
+            return
+        agora = time.time()
+        linhas = [(c, json.dumps(v, ensure_ascii=False, default=str), agora) for c, v in valores.items()]
+        with self._lock:
+            self._conn.execute("begin")
+            try:
+                self._conn.executemany("insert or replace into kv (chave, valor, ts) values (?, ?, ?)", linhas)
+                self._conn.execute("commit")
+            except Exception:
+                self._conn.execute("rollback")
+                raise
+
+    def invalidar(self, chaves=None):
+        with self._lock:
+            self._conn.execute("begin")
+            try:
+                if chaves is None:
+                    self._conn.execute("delete from kv")
+                else:
+                    for part in chunk_list(list(chaves), size=500):
+                        self._conn.execute(f"delete from kv where chave in ({','.join('?' * len(part))})", part)
+                self._conn.execute("update meta set valor = valor + 1 where nome = 'geracao'")
+                self._conn.execute("commit")
+            except Exception:
+                self._conn.execute("rollback")
+                raise
+
+    def geracao(self) -> int:
+        with self._lock:
+            return self._conn.execute("select valor from meta where nome = 'geracao'").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("select count(*) from kv").fetchone()[0]
+
+
+def abrir_disco(caminho: str | None, ttl: float) -> DiscoKV | None:
+    """Abre o nível em disco; sem caminho ou sem permissão de escrita, o cache fica só em memória."""
+    if not caminho:
+        return None
+    try:
+        return DiscoKV(caminho, ttl)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+# =========================================================
+# CACHE POR CAIXA (processo): LRU em memória + disco
+# =========================================================
+def _tamanho(chave: str, valor) -> int:
+    """Estimativa rasa (bytes) de uma entrada, suficiente para o teto do LRU."""
+    n = sys.getsizeof(chave) + 64  # tupla (ts, valor) + nó do OrderedDict
+    if isinstance(valor, dict):
+        n += sys.getsizeof(valor) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in valor.items())
+    else:
+        n += sys.getsizeof(valor)
+    return n
+
+
+class CacheCaixas:
+    """
+    Cache do processo com uma entrada por caixa, compartilhado entre sessões.
+    Nível 1: LRU em memória limitado a max_bytes. Nível 2 (opcional): DiscoKV.
+    Caixas consultadas e sem registro ficam guardadas como None só em memória e
+    por ttl_ausente (padrão: o menor entre ttl e 5 min): o faturamento da caixa
+    pode chegar logo depois e a ausência não deve durar o TTL inteiro.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int = 16 * 1024 * 1024, disco: DiscoKV | None = None, verificar_geracao_s: float = 30.0,
+                 ttl_ausente: float | None = None):
+        self.ttl = ttl
+        self.ttl_ausente = min(ttl, 5 * 60) if ttl_ausente is None else ttl_ausente
+        self.max_bytes = max_bytes
+        self.disco = disco
+        self.verificar_geracao_s = verificar_geracao_s
+        self._dados: OrderedDict[str, tuple[float, dict | None, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._geracao = disco.geracao() if disco else 0
+        self._geracao_verificada = time.monotonic()
+        self.stats = {"hits_memoria": 0, "hits_disco": 0, "misses": 0, "gravacoes": 0, "despejos": 0, "invalidacoes": 0}
+
+    # ---------- nível 1 ----------
+    def _por_em_memoria(self, chave: str, valor, agora: float):
+        antigo = self._dados.pop(chave, None)
+        if antigo is not None:
+            self._bytes -= antigo[2]
+        tam = _tamanho(chave, valor)
+        self._dados[chave] = (agora, valor, tam)
+        self._bytes += tam
+        while self._bytes > self.max_bytes and self._dados:
+            _, (_, _, t) = self._dados.popitem(last=False)
+            self._bytes -= t
+            self.stats["despejos"] += 1
+
+    def _limpar_memoria(self):
+        self._dados.clear()
+        self._bytes = 0
+
+    def _conferir_geracao(self):
+        """Outro processo (ex.: ingestão) invalidou o disco: descarta a memória local."""
+        if self.disco is None or time.monotonic() - self._geracao_verificada < self.verificar_geracao_s:
+            return
+        self._geracao_verificada = time.monotonic()
+        try:
+            geracao = self.disco.geracao()
+        except sqlite3.Error:
+            return
+        if geracao != self._geracao:
+            self._geracao = geracao
+            self._limpar_memoria()
+
+    # ---------- API ----------
+    def buscar(self, caixas) -> tuple[dict, list[str]]:
+        """Retorna (encontrados {caixa: valor}, faltando [caixas])."""
+        agora = time.monotonic()
+        achados, faltando = {}, []
+        with self._lock:
+            self._conferir_geracao()
+            for c in caixas:
+                item = self._dados.get(c)
+                if item is not None and agora - item[0] < (self.ttl if item[1] is not None else self.ttl_ausente):
+                    self._dados.move_to_end(c)
+                    achados[c] = item[1]
+                else:
+                    faltando.append(c)
+            self.stats["hits_memoria"] += len(achados)
+
+        if faltando and self.disco is not None:
+            try:
+                # None gravado no disco por versões antigas não vale: consulta de novo
+                do_disco = {c: tv for c, tv in self.disco.buscar(faltando).items() if tv[1] is not None}
+            except sqlite3.Error:
+                do_disco = {}
+            if do_disco:
+                parede = time.time()
+                with self._lock:
+                    for c, (ts, v) in do_disco.items():
+                        # mantém a idade da gravação original no nível em memória
+                        self._por_em_memoria(c, v, agora - (parede - ts))
+                        achados[c] = v
+                    self.stats["hits_disco"] += len(do_disco)
+                faltando = [c for c in faltando if c not in do_disco]
+
+        with self._lock:
+            self.stats["misses"] += len(faltando)
+        return achados, faltando
+
+    def get(self, caixa: str) -> tuple[bool, dict | None]:
+        achados, _ = self.buscar([caixa])
+        return (caixa in achados), achados.get(caixa)
+
+    def gravar(self, valores: dict, ausentes=()):
+        novos = dict(valores)
+        for c in ausentes:
+            if c not in novos:
+                novos[c] = None
+        if not novos:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            for c, v in novos.items():
+                self._por_em_memoria(c, v, agora)
+            self.stats["gravacoes"] += len(novos)
+        achados = {c: v for c, v in novos.items() if v is not None}  # ausência não vai para o disco
+        if self.disco is not None and achados:
+            try:
+                self.disco.gravar(achados)
+            except sqlite3.Error:
+                pass
+
+    def invalidar(self, caixas=None):
+        """Descarta caixas (ou tudo) nos dois níveis; use quando o faturamento for atualizado."""
+        with self._lock:
+            if caixas is None:
+                self._limpar_memoria()
+            else:
+                for c in caixas:
+                    item = self._dados.pop(c, None)
+                    if item is not None:
+                        self._bytes -= item[2]
+            self.stats["invalidacoes"] += 1
+        if self.disco is not None:
+            try:
+                self.disco.invalidar(caixas)
+                with self._lock:
+                    self._geracao = self.disco.geracao()
+            except sqlite3.Error:
+                pass
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            st = dict(self.stats)
+            st["entradas_memoria"] = len(self._dados)
+            st["bytes_memoria"] = self._bytes
+        consultas = st["hits_memoria"] + st["hits_disco"] + st["misses"]
+        st["taxa_acerto"] = round((st["hits_memoria"] + st["hits_disco"]) / consultas, 4) if consultas else 0.0
+        if self.disco is not None:
+            try:
+                st["entradas_disco"] = len(self.disco)
+            except sqlite3.Error:
+                pass
+        return st
+
+    def __len__(self):
+        return len(self._dados)
+
+
+# =========================================================
+# FÁBRICA
+# =========================================================
+def criar_cache_faturamento(ttl: float = 6 * 3600) -> CacheCaixas:
+    """
+    Cache de faturamento por caixa. Variáveis de ambiente:
+      CONFERENCIA_CACHE_DIR (pasta do nível em disco; padrão .cache ao lado do app, vazio desliga)
+      CONFERENCIA_CACHE_MEM_MB (teto do LRU em memória, 16)
+      CONFERENCIA_CACHE_AUSENTE_S (quanto tempo "caixa sem faturamento" vale, só em memória; 300)
+    """
+    pasta = os.environ.get("CONFERENCIA_CACHE_DIR", PASTA_PADRAO)
+    disco = abrir_disco(os.path.join(pasta, "faturamento.sqlite3") if pasta else None, ttl)
+    return CacheCaixas(
+        ttl,
+        max_bytes=int(env_float("CONFERENCIA_CACHE_MEM_MB", 16) * 1024 * 1024),
+        disco=disco,
+        ttl_ausente=env_float("CONFERENCIA_CACHE_AUSENTE_S", 300),
+    )
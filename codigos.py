@@ -0,0 +1,173 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from helpers import CAIXA_PATTERN
+
+
+# =========================================================
+# LEITURA DE CÓDIGOS EM LOTE (caixa / chave NF-e)
+# =========================================================
+# Trabalha sobre o lote inteiro (Series/arrays) em vez de um texto por vez:
+# colagens grandes, importações e conciliação não passam por laços Python.
+CODIGO = re.compile(rf"{CAIXA_PATTERN.pattern}|(?<![0-9])[0-9]{{44}}(?![0-9])")
+PADRAO_CODIGOS = re.compile(rf"(?P<codigo>{CODIGO.pattern})")
+SEPARADORES = re.compile(r"[^A-Z0-9]")
+TOKEN = re.compile(r"[A-Z0-9]+")
+
+TIPOS = ["caixa", "nfe", "rejeitado"]
+MOTIVOS = [
+    "nfe_uf_invalida",
+    "nfe_mes_invalido",
+    "nfe_modelo_invalido",
+    "nfe_dv_invalido",
+    "numerico_tamanho_invalido",
+    "formato_desconhecido",
+]
+# rejeitos que não são NF-e: consultas (Rastrear Caixa) ainda pesquisam o código como veio
+MOTIVOS_FORA_PADRAO = ["numerico_tamanho_invalido", "formato_desconhecido"]
+
+# cUF do IBGE usados na chave de acesso
+UFS_NFE = np.array([11, 12, 13, 14, 15, 16, 17, 21, 22, 23, 24, 25, 26, 27, 28, 29, 31, 32, 33, 35, 41, 42, 43, 50, 51, 52, 53])
+MODELOS_NFE = np.array([55, 65])
+# módulo 11: pesos 2..9 da direita para a esquerda sobre os 43 primeiros dígitos
+PESOS_NFE = np.array([2 + (42 - i) % 8 for i in range(43)], dtype=np.int64)
+
+
+def tokenizar_texto(texto: str) -> pd.Series:
+    """Quebra um texto colado (qualquer separador) em tokens, uma linha por token."""
+    if not texto:
+        return pd.Series([], dtype=object)
+    return pd.Series(TOKEN.findall(texto.upper()), dtype=object)
+
+
+def _digitos(chaves) -> np.ndarray:
+    """Matriz (n, 44) de dígitos a partir de strings com 44 dígitos."""
+    bruto = "".join(chaves).encode("ascii")
+    return np.frombuffer(bruto, dtype=np.uint8).reshape(-1, 44).astype(np.int64) - 48
+
+
+def _cod_motivos_nfe(chaves) -> np.ndarray:
+    """Códigos (índice em MOTIVOS, -1 = válida) para chaves de 44 dígitos."""
+    chaves = list(chaves)
+    out = np.full(len(chaves), -1, dtype=np.int8)
+    if not chaves:
+        return out
+
+    d = _digitos(chaves)
+    uf = d[:, 0] * 10 + d[:, 1]
+    mes = d[:, 4] * 10 + d[:, 5]
+    modelo = d[:, 20] * 10 + d[:, 21]
+    resto = (d[:, :43] @ PESOS_NFE) % 11
+    dv = np.where(resto < 2, 0, 11 - resto)
+
+    # do menos para o mais grave: o último que se aplica prevalece
+    out[dv != d[:, 43]] = MOTIVOS.index("nfe_dv_invalido")
+    out[~np.isin(modelo, MODELOS_NFE)] = MOTIVOS.index("nfe_modelo_invalido")
+    out[(mes < 1) | (mes > 12)] = MOTIVOS.index("nfe_mes_invalido")
+    out[~np.isin(uf, UFS_NFE)] = MOTIVOS.index("nfe_uf_invalida")
+    return out
+
+
+def motivos_nfe(chaves) -> np.ndarray:
+    """
+    Valida chaves de acesso de 44 dígitos (UF, mês, modelo e dígito verificador).
+    Retorna um array com o motivo da rejeição, ou None para chave válida.
+    """
+    cod = _cod_motivos_nfe(chaves)
+    return np.array([None, *MOTIVOS], dtype=object)[cod + 1]
+
+
+def classificar(entradas) -> pd.DataFrame:
+    """
+    Classifica um lote de leituras (str, lista ou Series; cada item pode ter vários códigos).
+    Retorna um DataFrame na ordem de leitura com:
+      entrada (posição do item de origem), codigo, tipo (caixa | nfe | rejeitado),
+      motivo (None se válido) e duplicado (repetição de um código válido já lido).
+    """
+    if isinstance(entradas, str):
+        entradas = [entradas]
+    s = pd.Series(entradas, dtype=object).fillna("").astype(str).str.upper()
+    s.index = pd.RangeIndex(len(s))
+
+    # 1) tokens: a maioria das leituras já é um código só; só quebra as que têm separador
+    tem_sep = s.str.contains(SEPARADORES.pattern, regex=True).astype(bool)
+    tokens = s[~tem_sep & (s != "")]
+    if tem_sep.any():
+        partes = s[tem_sep].str.findall(TOKEN.pattern).explode().dropna()
+        tokens = pd.concat([tokens, partes]).sort_index(kind="stable")
+    tokens = pd.Series(tokens.to_numpy(dtype=object), index=tokens.index.to_numpy())
+
+    # 2) tokens que não são um código inteiro podem conter vários (ex.: F2830233F2830222)
+    numerico = tokens.str.isdigit().astype(bool)
+    inteiro = tokens.str.fullmatch(CAIXA_PATTERN.pattern).astype(bool) | (tokens.str.len().eq(44) & numerico)
+    colados = ~inteiro
+    colados[colados] = tokens[colados].str.contains(CODIGO).astype(bool)
+
+    pos = np.arange(len(tokens))
+    simples = ~colados.to_numpy()
+    blocos = [pd.DataFrame({
+        "pos": pos[simples],
+        "sub": 0,
+        "entrada": tokens.index.to_numpy()[simples],
+        "codigo": tokens.to_numpy()[simples],
+    })]
+    if colados.any():
+        ext = pd.Series(tokens.to_numpy()[~simples], index=pos[~simples]).str.extractall(PADRAO_CODIGOS)
+        p_ext = ext.index.get_level_values(0).to_numpy()
+        blocos.append(pd.DataFrame({
+            "pos": p_ext,
+            "sub": ext.index.get_level_values(1).to_numpy(),
+            "entrada": tokens.index.to_numpy()[p_ext],
+            "codigo": ext["codigo"].to_numpy(dtype=object),
+        }))
+    df = pd.concat(blocos, ignore_index=True) if len(blocos) > 1 else blocos[0]
+    if len(blocos) > 1:
+        df = df.sort_values(["pos", "sub"], kind="stable").reset_index(drop=True)
+    df = df.drop(columns=["pos", "sub"])
+
+    # 3) classificação
+    codigo = df["codigo"]
+    numerico = codigo.str.isdigit().astype(bool)
+    eh_nfe = codigo.str.len().eq(44) & numerico
+    eh_caixa = codigo.str.fullmatch(CAIXA_PATTERN.pattern).astype(bool)
+
+    outro = (~eh_caixa & ~eh_nfe).to_numpy()
+    num = numerico.to_numpy()
+    motivo = np.full(len(df), -1, dtype=np.int8)
+    motivo[outro & num] = MOTIVOS.index("numerico_tamanho_invalido")
+    motivo[outro & ~num] = MOTIVOS.index("formato_desconhecido")
+    idx_nfe = np.flatnonzero(eh_nfe.to_numpy())
+    motivo[idx_nfe] = _cod_motivos_nfe(codigo.to_numpy()[idx_nfe])
+
+    tipo = np.where(eh_caixa.to_numpy(), 0, np.where(eh_nfe.to_numpy(), 1, 2)).astype(np.int8)
+    tipo[motivo >= 0] = TIPOS.index("rejeitado")
+
+    df["tipo"] = pd.Categorical.from_codes(tipo, categories=TIPOS)
+    df["motivo"] = pd.Categorical.from_codes(motivo, categories=MOTIVOS)
+    validos = df["tipo"] != "rejeitado"
+    df["duplicado"] = validos & df["codigo"].where(validos).duplicated()
+    return df
+
+
+def codigos_validos(df: pd.DataFrame) -> list[str]:
+    """Códigos aceitos (caixa ou NF-e válida), sem repetição, na ordem de leitura."""
+    ok = (df["tipo"] != "rejeitado") & ~df["duplicado"]
+    return df.loc[ok, "codigo"].tolist()
+
+
+def codigos_fora_padrao(df: pd.DataFrame) -> list[str]:
+    """Rejeitados que não são chave de NF-e (tamanho/formato fora do padrão), sem repetição, na ordem de leitura."""
+    fora = df["motivo"].isin(MOTIVOS_FORA_PADRAO)
+    return list(dict.fromkeys(df.loc[fora, "codigo"]))
+
+
+def resumo_rejeitos(df: pd.DataFrame) -> pd.DataFrame:
+    """Contagem dos rejeitos por motivo (só motivos presentes)."""
+    rej = df[df["tipo"] == "rejeitado"]
+    return (
+        rej.groupby("motivo", observed=True)["codigo"]
+        .agg(qtd="size", exemplos=lambda x: ", ".join(x.head(5)))
+        .reset_index()
+    )
@@ -0,0 +1,321 @@
+"""
+Conciliação por período: expedido (Reserva) x recebido (Pavuna) x espelho x faturamento.
+
+Divergências (uma linha por caixa ou romaneio):
+  expedido_nao_recebido    volume de romaneio encerrado sem data_recebimento
+  recebido_sem_espelho     recebido na Pavuna e fora de qualquer romaneio espelho
+  espelho_sem_faturamento  caixa de romaneio espelho sem linha em faturamento
+  qtde_pecas_divergente    qtde_pecas do item do espelho != faturamento (mais recente)
+  qtd_volumes_divergente   romaneio da Reserva: qtd_volumes gravado != volumes em conferencia_reserva
+  qtd_caixas_divergente    romaneio espelho: qtd_caixas != itens
+
+O período é processado dia a dia (fuso de SP): volumes pela data de expedição,
+espelhos pela data de criação e romaneios pela data de encerramento. Cada tabela
+é lida em páginas por id; em memória ficam uma página e as divergências achadas.
+Dias já encerrados vão para o cache em disco; na reutilização só as contagens do
+dia e as pendências que podem ter se resolvido (recebidos sem espelho; itens sem
+faturamento ou com qtde divergente, que mudam com a carga do faturamento) são consultadas.
+
+Uso:
+    python conciliacao.py --inicio 2026-10-01 --fim 2026-10-15
+    python conciliacao.py --inicio 2026-10-01 --fim 2026-10-15 --csv divergencias.csv --sem-cache
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+import pandas as pd
+
+from cache import PASTA_PADRAO, DiscoKV, abrir_disco
+from repositorios import TAMANHO_PAGINA
+
+FUSO = "America/Sao_Paulo"
+VERSAO = 2  # muda a chave do cache quando a regra de conciliação mudar
+
+TIPOS = [
+    "expedido_nao_recebido",
+    "recebido_sem_espelho",
+    "espelho_sem_faturamento",
+    "qtde_pecas_divergente",
+    "qtd_volumes_divergente",
+    "qtd_caixas_divergente",
+]
+COLUNAS = ["dia", "tipo", "caixa", "romaneio_id", "romaneio_espelho_id", "esperado", "encontrado"]
+CONTADORES = ["expedidos", "recebidos", "espelhos", "itens_espelho", "romaneios_encerrados"]
+
+
+def limites_dia(dia: date) -> tuple[str, str]:
+    """[início, fim) do dia no fuso de SP, em ISO UTC (mesmo formato gravado pelo app)."""
+    ini = pd.Timestamp(dia).tz_localize(FUSO).tz_convert("UTC")
+    fim = pd.Timestamp(dia + timedelta(days=1)).tz_localize(FUSO).tz_convert("UTC")
+    return ini.isoformat(), fim.isoformat()
+
+
+def _normalizar(s: pd.Series) -> pd.Series:
+    return s.fillna("").astype(str).str.strip().str.upper()
+
+
+def _bloco(dia: date, tipo: str, df: pd.DataFrame) -> pd.DataFrame:
+    return df.reindex(columns=COLUNAS).assign(dia=dia.isoformat(), tipo=tipo)
+
+
+def _tipar(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.reindex(columns=COLUNAS)
+    return df.assign(
+        tipo=pd.Categorical(df["tipo"], categories=TIPOS),
+        caixa=df["caixa"].astype("string"),
+        **{c: pd.to_numeric(df[c], errors="coerce").astype("Int64") for c in COLUNAS[3:]},
+    )
+
+
+def _juntar(partes: list[pd.DataFrame]) -> pd.DataFrame:
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return _tipar(pd.DataFrame(columns=COLUNAS))
+    return _tipar(pd.concat(partes, ignore_index=True))
+
+
+def _registros(df: pd.DataFrame) -> list[dict]:
+    """Linhas em JSON puro (NA -> None) para o cache em disco."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+# =========================================================
+# MOTOR
+# =========================================================
+class Conciliacao:
+    """
+    repos: Repositorios. disco: cache dos dias encerrados (None = sem cache).
+    tamanho_pagina: linhas por leitura; define o teto de memória por tabela.
+    """
+
+    def __init__(self, repos, disco: DiscoKV | None = None, tamanho_pagina: int = TAMANHO_PAGINA):
+        self.repos = repos
+        self.disco = disco
+        self.tamanho_pagina = tamanho_pagina
+        self.stats = {"dias_calculados": 0, "dias_cache": 0, "paginas": 0, "pendencias_resolvidas": 0}
+
+    def periodo(self, inicio: date, fim: date, usar_cache: bool = True, progresso=None) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Retorna (divergências, resumo por dia). progresso(i, n, dia) é chamado ao fim de cada dia.
+        O resumo traz os contadores do dia, as divergências por tipo e se veio do cache.
+        """
+        dias = [d.date() for d in pd.date_range(inicio, fim, freq="D")]
+        partes, resumo = [], []
+        for i, dia in enumerate(dias, start=1):
+            div, cont, do_cache = self.dia(dia, usar_cache=usar_cache)
+            partes.append(div)
+            resumo.append({"dia": dia.isoformat(), **cont, "cache": do_cache})
+            if progresso is not None:
+                progresso(i, len(dias), dia)
+
+        div = _juntar(partes)
+        df_resumo = pd.DataFrame(resumo, columns=["dia", *CONTADORES, "cache"])
+        if not df_resumo.empty:
+            por_tipo = pd.crosstab(div["dia"], div["tipo"]).reindex(index=df_resumo["dia"], columns=TIPOS, fill_value=0)
+            df_resumo = df_resumo.join(por_tipo.reset_index(drop=True))
+        return div, df_resumo
+
+    def dia(self, dia: date, usar_cache: bool = True) -> tuple[pd.DataFrame, dict, bool]:
+        """(divergências, contadores, veio_do_cache) de um dia."""
+        ini, fim = limites_dia(dia)
+        encerrado = dia < pd.Timestamp.now(tz=FUSO).date()
+        cacheavel = encerrado and self.disco is not None
+        chave = f"v{VERSAO}:{dia.isoformat()}"
+
+        impressao = self._impressao(ini, fim) if cacheavel else None
+        if cacheavel and usar_cache:
+            salvo = self.disco.buscar([chave]).get(chave)
+            if salvo is not None and salvo[1]["impressao"] == impressao:
+                valor = salvo[1]
+                div = _tipar(pd.DataFrame(valor["divergencias"], columns=COLUNAS))
+                div, resolvidas = self._revalidar(div)
+                if resolvidas:
+                    self.disco.gravar({chave: {**valor, "divergencias": _registros(div)}})
+                self.stats["dias_cache"] += 1
+                return div, valor["contadores"], True
+
+        div, cont = self._calcular(dia, ini, fim)
+        self.stats["dias_calculados"] += 1
+        if cacheavel:
+            self.disco.gravar({chave: {"impressao": impressao, "contadores": cont, "divergencias": _registros(div)}})
+        return div, cont, False
+
+    def _impressao(self, ini: str, fim: str) -> list[int]:
+        """Contagens do dia: se alguma mudou, o dia em cache não vale mais."""
+        return [
+            self.repos.conferencia.contar_por_expedicao(ini, fim),
+            self.repos.conferencia.contar_por_expedicao(ini, fim, recebidos=True),
+            self.repos.espelhos.contar_criados_entre(ini, fim),
+            self.repos.romaneios.contar_encerrados_entre(ini, fim),
+        ]
+
+    def _revalidar(self, div: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+        """Pendências do cache conferidas de novo; retorna (divergências, nº de linhas que mudaram)."""
+        div, n_espelho = self._revalidar_espelho(div)
+        div, n_fat = self._revalidar_faturamento(div)
+        return div, n_espelho + n_fat
+
+    def _revalidar_espelho(self, div: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+        """Recebidos sem espelho podem ter entrado num espelho depois: tira os que entraram."""
+        pend = div["tipo"] == "recebido_sem_espelho"
+        if not pend.any():
+            return div, 0
+        desde = limites_dia(date.fromisoformat(div.loc[pend, "dia"].min()))[0]
+        no_espelho = self._caixas_em_espelho(div.loc[pend, "caixa"].unique().tolist(), desde)
+        resolvidas = pend & div["caixa"].isin(no_espelho)
+        n = int(resolvidas.sum())
+        self.stats["pendencias_resolvidas"] += n
+        return (div[~resolvidas].reset_index(drop=True) if n else div), n
+
+    def _revalidar_faturamento(self, div: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+        """
+        O faturamento chega depois (ingest): item sem faturamento pode ter ganhado linha e a
+        qtde mais recente pode ter mudado. Refaz a comparação só para essas caixas.
+        """
+        alvo = div["tipo"].isin(["espelho_sem_faturamento", "qtde_pecas_divergente"])
+        if not alvo.any():
+            return div, 0
+        sub = div[alvo]
+        fat = self._faturamento(sub["caixa"].dropna().unique().tolist())
+        esperado = sub["caixa"].map(fat).astype("Int64")
+        tipo = esperado.isna().map({True: "espelho_sem_faturamento", False: "qtde_pecas_divergente"})
+        resolvida = esperado.eq(sub["encontrado"]).fillna(False).astype(bool)
+        mudou = resolvida | tipo.ne(sub["tipo"].astype(str)) | esperado.fillna(-1).ne(sub["esperado"].fillna(-1))
+        n = int(mudou.sum())
+        if not n:
+            return div, 0
+        div = div.copy()
+        div.loc[alvo, "tipo"] = tipo
+        div.loc[alvo, "esperado"] = esperado
+        self.stats["pendencias_resolvidas"] += int(resolvida.sum())
+        return _tipar(div.drop(index=sub.index[resolvida]).reset_index(drop=True)), n
+
+    def _caixas_em_espelho(self, caixas: list[str], desde: str) -> pd.Index:
+        """Caixas que estão em algum espelho criado a partir de `desde` (banco e arquivo frio)."""
+        rows = self.repos.espelho_itens.por_caixas(caixas, "caixa", com_arquivo=True, desde=desde)
+        return pd.Index(_normalizar(pd.Series([r.get("caixa") for r in rows], dtype=object)).unique())
+
+    def _faturamento(self, caixas: list[str]) -> pd.Series:
+        """qtde_pecas da linha mais recente de cada caixa (índice = caixa)."""
+        df = pd.DataFrame(
+            self.repos.faturamento.por_caixas(caixas, "caixa, qtde_pecas, created_at"),
+            columns=["caixa", "qtde_pecas", "created_at"],
+        )
+        df["caixa"] = _normalizar(df["caixa"])
+        df = df.sort_values("created_at", ascending=False).drop_duplicates("caixa")
+        return pd.to_numeric(df.set_index("caixa")["qtde_pecas"], errors="coerce")
+
+    def _calcular(self, dia: date, ini: str, fim: str) -> tuple[pd.DataFrame, dict]:
+        cont = dict.fromkeys(CONTADORES, 0)
+        partes = []
+
+        # 1) volumes expedidos no dia: recebimento e espelho
+        status = {}  # romaneio_id -> status (cabeçalhos só dos romaneios ainda não vistos)
+        for pagina in self.repos.conferencia.paginas_por_expedicao(ini, fim, tamanho=self.tamanho_pagina):
+            self.stats["paginas"] += 1
+            df = pd.DataFrame(pagina, columns=["id", "chave_nfe", "romaneio_id", "data_recebimento"])
+            df["caixa"] = _normalizar(df["chave_nfe"])
+            novos = set(df["romaneio_id"].dropna().astype(int)) - status.keys()
+            if novos:
+                cab = self.repos.romaneios.buscar_varios(list(novos), "id, status")
+                status.update({i: (cab.get(i) or {}).get("status") for i in novos})
+
+            recebido = df["data_recebimento"].notna()
+            encerrado = df["romaneio_id"].map(status).eq("Encerrado")
+            cont["expedidos"] += len(df)
+            cont["recebidos"] += int(recebido.sum())
+            partes.append(_bloco(dia, "expedido_nao_recebido", df[~recebido & encerrado]))
+
+            rec = df[recebido]
+            if not rec.empty:
+                no_espelho = self._caixas_em_espelho(rec["caixa"].unique().tolist(), ini)
+                partes.append(_bloco(dia, "recebido_sem_espelho", rec[~rec["caixa"].isin(no_espelho)]))
+
+        # 2) espelhos criados no dia: itens x faturamento e qtd_caixas
+        espelhos = self.repos.espelhos.criados_entre(ini, fim, "id, qtd_caixas")
+        cont["espelhos"] = len(espelhos)
+        if espelhos:
+            qtd_caixas = pd.Series({e["id"]: e.get("qtd_caixas") for e in espelhos}, dtype="Int64")
+            n_itens = pd.Series(0, index=qtd_caixas.index, dtype="int64")
+            for pagina in self.repos.espelho_itens.paginas_por_espelhos(list(qtd_caixas.index), tamanho=self.tamanho_pagina):
+                self.stats["paginas"] += 1
+                itens = pd.DataFrame(pagina, columns=["id", "romaneio_espelho_id", "caixa", "qtde_pecas"])
+                itens["caixa"] = _normalizar(itens["caixa"])
+                cont["itens_espelho"] += len(itens)
+                n_itens = n_itens.add(itens["romaneio_espelho_id"].value_counts(), fill_value=0).astype("int64")
+
+                fat = self._faturamento(itens["caixa"].unique().tolist())
+                sem_fat = ~itens["caixa"].isin(fat.index)
+                # encontrado = qtde do item: a revalidação compara quando o faturamento chegar
+                partes.append(_bloco(dia, "espelho_sem_faturamento", itens[sem_fat].assign(
+                    encontrado=lambda d: pd.to_numeric(d["qtde_pecas"], errors="coerce"),
+                )))
+
+                comp = itens[~sem_fat].assign(
+                    esperado=lambda d: d["caixa"].map(fat),
+                    encontrado=lambda d: pd.to_numeric(d["qtde_pecas"], errors="coerce"),
+                )
+                difere = comp["esperado"].ne(comp["encontrado"]) & comp["esperado"].notna()
+                partes.append(_bloco(dia, "qtde_pecas_divergente", comp[difere]))
+
+            qtd = pd.DataFrame({"esperado": qtd_caixas, "encontrado": n_itens.reindex(qtd_caixas.index, fill_value=0)})
+            qtd = qtd[qtd["esperado"].notna() & qtd["esperado"].ne(qtd["encontrado"])]
+            partes.append(_bloco(dia, "qtd_caixas_divergente", qtd.rename_axis("romaneio_espelho_id").reset_index()))
+
+        # 3) romaneios da Reserva encerrados no dia: qtd_volumes x volumes
+        roms = self.repos.romaneios.encerrados_entre(ini, fim, "id, qtd_volumes")
+        cont["romaneios_encerrados"] = len(roms)
+        qtd_volumes = pd.Series({r["id"]: r["qtd_volumes"] for r in roms if r.get("qtd_volumes") is not None}, dtype="Int64")
+        if not qtd_volumes.empty:
+            n_vol = pd.Series(0, index=qtd_volumes.index, dtype="int64")
+            for pagina in self.repos.conferencia.paginas_por_romaneios(list(qtd_volumes.index), tamanho=self.tamanho_pagina):
+                self.stats["paginas"] += 1
+                vc = pd.DataFrame(pagina, columns=["id", "romaneio_id"])["romaneio_id"].value_counts()
+                n_vol = n_vol.add(vc, fill_value=0).astype("int64")
+            vol = pd.DataFrame({"esperado": qtd_volumes, "encontrado": n_vol.reindex(qtd_volumes.index, fill_value=0)})
+            vol = vol[vol["esperado"].ne(vol["encontrado"])]
+            partes.append(_bloco(dia, "qtd_volumes_divergente", vol.rename_axis("romaneio_id").reset_index()))
+
+        return _juntar(partes), cont
+
+
+def criar_conciliacao(repos, ttl: float = 90 * 24 * 3600) -> Conciliacao:
+    """Cache dos dias encerrados em CONFERENCIA_CACHE_DIR/conciliacao.sqlite3 (vazio desliga)."""
+    pasta = os.environ.get("CONFERENCIA_CACHE_DIR", PASTA_PADRAO)
+    return Conciliacao(repos, disco=abrir_disco(os.path.join(pasta, "conciliacao.sqlite3") if pasta else None, ttl))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Conciliação expedido x recebido x espelho x faturamento.")
+    ap.add_argument("--inicio", required=True, type=date.fromisoformat, help="primeiro dia (AAAA-MM-DD, fuso de SP)")
+    ap.add_argument("--fim", type=date.fromisoformat, help="último dia (padrão: --inicio)")
+    ap.add_argument("--csv", help="grava as divergências em CSV")
+    ap.add_argument("--sem-cache", action="store_true", help="recalcula todos os dias")
+    args = ap.parse_args()
+
+    from arquivo import criar_arquivo
+    from backend import criar_backend
+    from ingest_faturamento import _credenciais_supabase
+    from repositorios import Repositorios
+
+    url, key = _credenciais_supabase()
+    conc = criar_conciliacao(Repositorios(criar_backend(url, key), arquivo=criar_arquivo()))
+    div, resumo = conc.periodo(
+        args.inicio,
+        args.fim or args.inicio,
+        usar_cache=not args.sem_cache,
+        progresso=lambda i, n, dia: print(f"[{i}/{n}] {dia}", file=sys.stderr),
+    )
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(resumo.to_string(index=False))
+    print(f"{len(div)} divergência(s) | {conc.stats}")
+    if args.csv:
+        div.to_csv(args.csv, index=False)
+        print(f"-> {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
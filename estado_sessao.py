@@ -0,0 +1,222 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from helpers import normalize_chave
+
+
+# =========================================================
+# CONFERÊNCIA COMPACTA (estado por sessão)
+# =========================================================
+class ConferenciaCompacta:
+    """
+    Volumes de um ou mais romaneios em arrays, em vez de dict/list de strings:
+      caixas    array de bytes ordenado (~1 byte por caractere)
+      rom       int32, índice em romaneios
+      recebido  bool, marcado in place a cada bipagem
+    A busca é por np.searchsorted (O(log n)); nada é recriado por bipagem.
+    """
+
+    def __init__(self, romaneios: list[int], caixas, rom_ids, recebidos):
+        self.romaneios = np.asarray(romaneios, dtype=np.int64)
+        caixas = np.asarray(caixas, dtype=object)
+        ordem = np.argsort(caixas, kind="stable")
+        try:
+            self.caixas = caixas[ordem].astype("S")
+            self._ascii = True
+        except UnicodeEncodeError:
+            self.caixas = caixas[ordem].astype("U")
+            self._ascii = False
+        ordem_rom = np.argsort(self.romaneios, kind="stable")
+        pos = np.searchsorted(self.romaneios[ordem_rom], np.asarray(rom_ids, dtype=np.int64)[ordem])
+        self.rom = ordem_rom[pos].astype(np.int32)
+        self.recebido = np.asarray(recebidos, dtype=bool)[ordem].copy()
+        self.n_linhas = len(self.caixas)  # linhas do manifesto de origem (de_linhas: antes de tirar repetidas)
+
+    @classmethod
+    def de_linhas(cls, rows: list[dict], romaneios: list[int]) -> tuple["ConferenciaCompacta", pd.DataFrame]:
+        """
+        Monta a partir das linhas de conferencia_reserva (chave_nfe, romaneio_id, data_recebimento).
+        Retorna (conferência, conflitos): conflitos tem uma linha por caixa que aparece em
+        romaneios diferentes (colunas de COLS_CONFLITOS); vazio = nenhum.
+        """
+        df = pd.DataFrame(rows, columns=["chave_nfe", "romaneio_id", "data_recebimento"])
+        df["chave_nfe"] = df["chave_nfe"].fillna("").astype(str).str.strip().str.upper()
+        df = df[(df["chave_nfe"] != "") & df["romaneio_id"].notna()]
+        df = df.drop_duplicates(subset=["chave_nfe", "romaneio_id"])
+        conflitos = _conflitos(df)
+        df = df.drop_duplicates(subset=["chave_nfe"])
+        conf = cls(
+            romaneios,
+            df["chave_nfe"].to_numpy(dtype=object),
+            df["romaneio_id"].astype("int64").to_numpy(),
+            df["data_recebimento"].notna().to_numpy(),
+        )
+        conf.n_linhas = len(rows)
+        return conf, conflitos
+
+    # ---------- consulta ----------
+    def _codificar(self, caixa: str):
+        # método (não lambda guardado no objeto): a conferência precisa ser picklable
+        return caixa.encode("ascii") if self._ascii else caixa
+
+    def indice(self, caixa: str) -> int:
+        try:
+            chave = self._codificar(normalize_chave(caixa))
+        except UnicodeEncodeError:
+            return -1
+        i = int(np.searchsorted(self.caixas, chave))
+        return i if i < len(self.caixas) and self.caixas[i] == chave else -1
+
+    def romaneio_de(self, caixa: str) -> int | None:
+        i = self.indice(caixa)
+        return int(self.romaneios[self.rom[i]]) if i >= 0 else None
+
+    def foi_recebida(self, caixa: str) -> bool:
+        i = self.indice(caixa)
+        return bool(self.recebido[i]) if i >= 0 else False
+
+    def __len__(self):
+        return len(self.caixas)
+
+    @property
+    def n_recebidos(self) -> int:
+        return int(self.recebido.sum())
+
+    def totais_por_romaneio(self) -> dict:
+        cont = np.bincount(self.rom, minlength=len(self.romaneios))
+        return {int(r): int(n) for r, n in zip(self.romaneios, cont)}
+
+    def recebidos_por_romaneio(self) -> dict:
+        cont = np.bincount(self.rom[self.recebido], minlength=len(self.romaneios))
+        return {int(r): int(n) for r, n in zip(self.romaneios, cont)}
+
+    def faltantes(self) -> list[str]:
+        return [c.decode("ascii") if isinstance(c, bytes) else str(c) for c in self.caixas[~self.recebido]]
+
+    # ---------- atualização ----------
+    def marcar_recebida(self, caixa: str) -> bool:
+        i = self.indice(caixa)
+        if i < 0:
+            return False
+        self.recebido[i] = True
+        return True
+
+    def mesclar_recebidas(self, caixas):
+        """Marca de uma vez as caixas já recebidas no banco (ex.: por outro operador)."""
+        caixas = [normalize_chave(c) for c in caixas if c]
+        if not caixas:
+            return
+        try:
+            alvo = np.asarray(caixas, dtype=object).astype(self.caixas.dtype.kind)
+        except UnicodeEncodeError:
+            alvo = np.asarray([c for c in caixas if c.isascii()], dtype=object).astype("S")
+        self.recebido |= np.isin(self.caixas, alvo)
+
+    @property
+    def nbytes(self) -> int:
+        return self.caixas.nbytes + self.rom.nbytes + self.recebido.nbytes + self.romaneios.nbytes
+
+
+# =========================================================
+# CONFLITOS: caixa em mais de um romaneio do recebimento multi
+# =========================================================
+COLS_CONFLITOS = ["caixa", "romaneios", "qtd_romaneios"]
+
+
+def _conflitos(df: pd.DataFrame) -> pd.DataFrame:
+    """Todas as caixas repetidas entre romaneios de uma vez (df já sem repetição caixa+romaneio)."""
+    dup = df.loc[df["chave_nfe"].duplicated(keep=False), ["chave_nfe", "romaneio_id"]]
+    if dup.empty:
+        return pd.DataFrame(columns=COLS_CONFLITOS)
+    grupos = dup.astype({"romaneio_id": "int64"}).sort_values(["chave_nfe", "romaneio_id"]).groupby("chave_nfe", sort=True)["romaneio_id"]
+    return pd.DataFrame({
+        "caixa": grupos.size().index.to_numpy(),
+        "romaneios": grupos.agg(list).to_numpy(),
+        "qtd_romaneios": grupos.size().to_numpy(),
+    })
+
+
+def romaneios_sugeridos(conflitos: pd.DataFrame) -> list[int]:
+    """
+    Romaneios a tirar do recebimento para acabar com os conflitos: sai primeiro o que
+    está em mais conflitos ainda abertos (empate: o mais novo, id maior).
+    """
+    pendentes = [set(r) for r in conflitos["romaneios"]]
+    fora = []
+    while True:
+        pendentes = [r for r in pendentes if len(r) > 1]
+        if not pendentes:
+            return sorted(fora)
+        contagem = pd.Series([rid for r in pendentes for rid in r]).value_counts()
+        rid = int(max(contagem.index, key=lambda i: (contagem[i], i)))
+        fora.append(rid)
+        pendentes = [r - {rid} for r in pendentes]
+
+
+# =========================================================
+# ESPELHO: um único DataFrame compacto
+# =========================================================
+COLS_ESPELHO = ["caixa", "filial_origem", "destino", "qtde_pecas"]
+
+
+def compactar_espelho(df: pd.DataFrame) -> pd.DataFrame:
+    """Tipos enxutos para o DataFrame do espelho guardado na sessão (filial/destino repetem muito)."""
+    df = df.reset_index(drop=True)
+    return df.assign(
+        selecionar=df["selecionar"].astype(bool),
+        filial_origem=df["filial_origem"].astype("category"),
+        destino=df["destino"].astype("category"),
+        qtde_pecas=pd.to_numeric(df["qtde_pecas"], errors="coerce").fillna(0).astype("int32"),
+        ja_expedida=df["ja_expedida"].astype(bool),
+        romaneio_espelho_existente=pd.to_numeric(df["romaneio_espelho_existente"], errors="coerce").astype("Int64"),
+    )
+
+
+def espelho_selecionado(df_full: pd.DataFrame) -> pd.DataFrame:
+    """Caixas selecionadas e disponíveis (derivado na hora, não guardado na sessão)."""
+    if not isinstance(df_full, pd.DataFrame) or df_full.empty:
+        return pd.DataFrame(columns=COLS_ESPELHO)
+    sel = df_full["selecionar"] & ~df_full["ja_expedida"]
+    return df_full.loc[sel, COLS_ESPELHO]
+
+
+# =========================================================
+# MEDIÇÃO
+# =========================================================
+def tamanho_profundo(obj, _vistos=None) -> int:
+    """Bytes aproximados de um objeto e do que ele referencia (DataFrame/ndarray pelo buffer)."""
+    if _vistos is None:
+        _vistos = set()
+    if id(obj) in _vistos:
+        return 0
+    _vistos.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is not None else 0)
+    if isinstance(obj, ConferenciaCompacta):
+        return sys.getsizeof(obj) + obj.nbytes
+
+    n = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        n += sum(tamanho_profundo(k, _vistos) + tamanho_profundo(v, _vistos) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        n += sum(tamanho_profundo(x, _vistos) for x in obj)
+    return n
+
+
+def medir_sessao(estado) -> pd.DataFrame:
+    """Bytes por chave do st.session_state (maiores primeiro)."""
+    linhas = []
+    for k in list(estado.keys()):
+        try:
+            linhas.append({"chave": str(k), "bytes": tamanho_profundo(estado[k])})
+        except Exception:
+            continue
+    df = pd.DataFrame(linhas, columns=["chave", "bytes"])
+    return df.sort_values("bytes", ascending=False, ignore_index=True)
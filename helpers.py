@@ -0,0 +1,88 @@
+import os
+import re
+from datetime import datetime, timezone
+
+import pandas as pd
+
+
+# =========================================================
+# HELPERS
+# =========================================================
+def normalize_chave(value: str) -> str:
+    return (value or "").strip().upper()
+
+
+def env_float(nome: str, padrao: float) -> float:
+    try:
+        return float(os.environ.get(nome) or padrao)
+    except ValueError:
+        return padrao
+
+
+def get_now_utc() -> str:
+    """Grava em UTC."""
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def format_datetime_sp(value):
+    """
+    Converte datetime/string ISO para o fuso de São Paulo
+    e retorna no formato dd/mm/aaaa HH:MM:SS.
+    """
+    if value is None or value == "":
+        return ""
+
+    try:
+        dt = pd.to_datetime(value, errors="coerce", utc=True)
+        if pd.isna(dt):
+            return ""
+        return dt.tz_convert("America/Sao_Paulo").strftime("%d/%m/%Y %H:%M:%S")
+    except Exception:
+        return str(value)
+
+
+ROMANEIO_SEPARADORES = re.compile(r"[,;\n\t]+")
+
+
+def parse_romaneios(texto: str) -> list[int]:
+    if not texto:
+        return []
+    partes = ROMANEIO_SEPARADORES.split(texto.replace(" ", ""))
+    # unique mantendo ordem
+    return list(dict.fromkeys(int(p) for p in partes if p.isdigit()))
+
+
+def chunk_list(items: list, size: int = 500) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# =========================================================
+# CAIXAS: extrair múltiplas em um input (ex.: F2830233F2830222)
+# =========================================================
+CAIXA_PATTERN = re.compile(r"[A-Z]\d{7,}")  # Ex.: F2830233
+
+
+def extrair_caixas(raw: str) -> list[str]:
+    raw = normalize_chave(raw)
+    if not raw:
+        return []
+
+    achadas = CAIXA_PATTERN.findall(raw)
+    if achadas:
+        seen = set()
+        out = []
+        for c in achadas:
+            if c not in seen:
+                out.append(c)
+                seen.add(c)
+        return out
+
+    parts = re.split(r"[^A-Z0-9]+", raw)
+    parts = [p for p in parts if p]
+    seen = set()
+    out = []
+    for p in parts:
+        if p not in seen:
+            out.append(p)
+            seen.add(p)
+    return out
@@ -0,0 +1,210 @@
+"""
+Jornal de bipagens: um evento por leitura nas telas de bipagem.
+
+Cada evento (uma linha JSON) guarda:
+  ts (epoch), op (operador), tela (reserva | pavuna_multi | pavuna_single),
+  rom (romaneio), caixa, res (ok | duplicado | fora_romaneio | invalido | erro)
+  e ms (do início do callback de bipagem até o resultado daquela caixa; no leitor
+  em lote inclui o tempo que a leitura esperou na fila do navegador).
+
+Os eventos ficam num buffer e vão para o disco em lote (a cada `lote` eventos
+ou `intervalo` segundos), em arquivos JSONL próprios de cada processo
+(bipagens-<inicio>-<pid>.jsonl), girados por tamanho; os mais antigos além de
+max_arquivos são apagados.
+
+Relatório (vazão e percentis de latência por operador e por hora):
+    python jornal.py
+    python jornal.py --pasta .jornal --desde 2026-10-01 --por operador --csv relatorio.csv
+"""
+import argparse
+import atexit
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+PASTA_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jornal")
+PREFIXO = "bipagens-"
+FUSO = "America/Sao_Paulo"
+
+RESULTADOS = ["ok", "duplicado", "fora_romaneio", "invalido", "erro"]
+
+
+# =========================================================
+# GRAVAÇÃO
+# =========================================================
+class JornalBipagens:
+    def __init__(self, pasta: str, lote: int = 200, intervalo: float = 5.0, max_bytes: int = 8 * 1024 * 1024, max_arquivos: int = 50):
+        os.makedirs(pasta, exist_ok=True)
+        self.pasta = pasta
+        self.lote = lote
+        self.intervalo = intervalo
+        self.max_bytes = max_bytes
+        self.max_arquivos = max_arquivos
+        self._lock = threading.Lock()
+        self._buffer: list[str] = []
+        self._ultimo_flush = time.monotonic()
+        self._arquivo = None
+        self.stats = {"eventos": 0, "gravacoes": 0, "arquivos": 0, "erros": 0}
+        atexit.register(self.descarregar)
+
+    def registrar(self, tela: str, operador: str, romaneio, caixa: str, resultado: str, t0: float):
+        """t0: time.perf_counter() do início do callback que tratou a leitura."""
+        evento = {
+            "ts": round(time.time(), 3),
+            "op": operador or "",
+            "tela": tela,
+            "rom": int(romaneio) if romaneio is not None else None,
+            "caixa": caixa,
+            "res": resultado,
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+        linha = json.dumps(evento, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._buffer.append(linha)
+            self.stats["eventos"] += 1
+            cheio = len(self._buffer) >= self.lote or time.monotonic() - self._ultimo_flush >= self.intervalo
+        if cheio:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava o buffer (um write por lote)."""
+        with self._lock:
+            if not self._buffer:
+                return
+            bloco = "\n".join(self._buffer) + "\n"
+            try:
+                caminho = self._arquivo_atual(len(bloco))
+                with open(caminho, "a", encoding="utf-8") as f:
+                    f.write(bloco)
+                self._buffer.clear()
+                self.stats["gravacoes"] += 1
+            except OSError:
+                # disco cheio / sem permissão: mantém o buffer limitado e segue a operação
+                del self._buffer[: max(len(self._buffer) - 10 * self.lote, 0)]
+                self.stats["erros"] += 1
+            self._ultimo_flush = time.monotonic()
+
+    def _arquivo_atual(self, n_bytes: int) -> str:
+        if self._arquivo is None or (
+            os.path.exists(self._arquivo) and os.path.getsize(self._arquivo) + n_bytes > self.max_bytes
+        ):
+            nome = f"{PREFIXO}{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.jsonl"
+            self._arquivo = os.path.join(self.pasta, nome)
+            self.stats["arquivos"] += 1
+            self._podar()
+        return self._arquivo
+
+    def _podar(self):
+        arquivos = sorted(arquivos_jornal(self.pasta), key=os.path.getmtime)
+        for caminho in arquivos[: max(len(arquivos) - self.max_arquivos + 1, 0)]:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            st = dict(self.stats)
+            st["pendentes"] = len(self._buffer)
+        return st
+
+
+def criar_jornal() -> JornalBipagens | None:
+    """Pasta em CONFERENCIA_JORNAL_DIR (padrão .jornal ao lado do app; vazio desliga)."""
+    pasta = os.environ.get("CONFERENCIA_JORNAL_DIR", PASTA_PADRAO)
+    if not pasta:
+        return None
+    try:
+        return JornalBipagens(pasta)
+    except OSError:
+        return None
+
+
+# =========================================================
+# LEITURA / RELATÓRIO
+# =========================================================
+def arquivos_jornal(pasta: str) -> list[str]:
+    return glob.glob(os.path.join(pasta, f"{PREFIXO}*.jsonl"))
+
+
+def carregar(pasta: str = PASTA_PADRAO, desde=None) -> pd.DataFrame:
+    """Eventos de todos os arquivos da pasta (ts como datetime no fuso de SP)."""
+    colunas = ["ts", "op", "tela", "rom", "caixa", "res", "ms"]
+    partes = []
+    for caminho in arquivos_jornal(pasta):
+        if desde is not None and os.path.getmtime(caminho) < pd.Timestamp(desde).timestamp():
+            continue
+        try:
+            partes.append(pd.read_json(caminho, lines=True, dtype={"caixa": str, "op": str}))
+        except ValueError:
+            continue
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+    df = pd.concat(partes, ignore_index=True).reindex(columns=colunas)
+    df["ts"] = pd.to_datetime(df["ts"], unit="s", utc=True).dt.tz_convert(FUSO)
+    if desde is not None:
+        inicio = pd.Timestamp(desde)
+        inicio = inicio.tz_localize(FUSO) if inicio.tzinfo is None else inicio
+        df = df[df["ts"] >= inicio]
+    df["res"] = pd.Categorical(df["res"], categories=RESULTADOS)
+    return df.sort_values("ts", ignore_index=True)
+
+
+def relatorio(df: pd.DataFrame, por=("op", "hora")) -> pd.DataFrame:
+    """
+    Vazão e latência por grupo (op, tela, hora ou dia):
+    bipagens, contagem por resultado, bipagens/min no período ativo e p50/p95/p99/max (ms).
+    """
+    if df.empty:
+        return pd.DataFrame()
+    df = df.assign(hora=df["ts"].dt.floor("h"), dia=df["ts"].dt.date)
+    por = list(por)
+    g = df.groupby(por, observed=True)
+
+    out = g.agg(
+        bipagens=("res", "size"),
+        inicio=("ts", "min"),
+        fim=("ts", "max"),
+        p50_ms=("ms", lambda x: x.quantile(0.50)),
+        p95_ms=("ms", lambda x: x.quantile(0.95)),
+        p99_ms=("ms", lambda x: x.quantile(0.99)),
+        max_ms=("ms", "max"),
+    )
+    res = pd.crosstab([df[c] for c in por], df["res"]).reindex(columns=RESULTADOS, fill_value=0)
+    out = out.join(res)
+    minutos = (out["fim"] - out["inicio"]).dt.total_seconds() / 60
+    out["por_min"] = (out["bipagens"] / minutos.clip(lower=1)).round(1)
+    out[["p50_ms", "p95_ms", "p99_ms"]] = out[["p50_ms", "p95_ms", "p99_ms"]].round(1)
+    return out.drop(columns=["inicio", "fim"]).reset_index()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Relatório do jornal de bipagens.")
+    ap.add_argument("--pasta", default=os.environ.get("CONFERENCIA_JORNAL_DIR") or PASTA_PADRAO)
+    ap.add_argument("--desde", help="data/hora inicial (fuso de SP), ex.: 2026-10-01 ou 2026-10-01T08:00")
+    ap.add_argument("--por", nargs="+", default=["op", "hora"], choices=["op", "tela", "hora", "dia", "rom"])
+    ap.add_argument("--csv", help="grava o relatório em CSV em vez de imprimir")
+    args = ap.parse_args()
+
+    df = carregar(args.pasta, args.desde)
+    if df.empty:
+        print(f"Nenhum evento em {args.pasta}.")
+        return 1
+    rel = relatorio(df, args.por)
+    if args.csv:
+        rel.to_csv(args.csv, index=False)
+        print(f"{len(df)} eventos -> {args.csv}")
+    else:
+        with pd.option_context("display.width", 200, "display.max_rows", 500):
+            print(rel.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
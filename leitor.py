@@ -0,0 +1,80 @@
+import os
+from time import perf_counter
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+import metricas
+from helpers import extrair_caixas
+
+
+# =========================================================
+# LEITOR DE CAIXAS EM LOTE (componente em componentes/leitor_caixas)
+# =========================================================
+# Com st.text_input + on_change cada leitura espera um rerun inteiro; um
+# scanner rápido perde ou cola leituras. O componente guarda as leituras no
+# navegador (retorno imediato na tela) e manda lotes pelo canal do componente:
+# um rerun por lote, com os vereditos de todas as caixas numa resposta só.
+PASTA_COMPONENTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "componentes", "leitor_caixas")
+_componente = components.declare_component("leitor_caixas", path=PASTA_COMPONENTE)
+
+
+def veredito(caixa: str, resultado: str, msg: str) -> dict:
+    """resultado: um de jornal.RESULTADOS (ok, duplicado, fora_romaneio, invalido, erro)."""
+    return {"codigo": caixa, "res": resultado, "msg": msg}
+
+
+def processar_leituras(leituras: list[dict], bipar) -> list[dict]:
+    """
+    Extrai as caixas de cada leitura do lote e chama bipar(caixas, t0, espera) uma vez.
+    espera: {caixa: segundos na fila do navegador}, somada à latência do jornal.
+    Retorna os vereditos com o id da leitura de origem.
+    """
+    t0 = perf_counter()
+    itens, origem, caixas, espera = [], [], [], {}
+    for leitura in leituras:
+        achadas = extrair_caixas(leitura.get("texto"))
+        if not achadas:
+            itens.append({"id": leitura.get("id"), **veredito(leitura.get("texto") or "", "invalido", "Nenhum código reconhecido")})
+        for chave in achadas:
+            origem.append(leitura.get("id"))
+            caixas.append(chave)
+            espera.setdefault(chave, max(leitura.get("espera_ms") or 0, 0) / 1000)
+
+    if caixas:
+        itens.extend({"id": i, **v} for i, v in zip(origem, bipar(caixas, t0, espera)))
+    return itens
+
+
+def leitor_caixas(key: str, bipar, etapa: str, placeholder: str = "Bipe os volumes", lote_max: int = 25, intervalo_ms: int = 250, altura: int = 300):
+    """
+    Desenha o leitor. bipar(caixas, t0, espera) -> um veredito por caixa, na ordem.
+    Os vereditos do último lote ficam em st.session_state[f"{key}__vereditos"] e voltam
+    ao navegador no próximo desenho; um lote reenviado (mesma origem/lote) não é reprocessado.
+    """
+    chave_vereditos = f"{key}__vereditos"
+
+    @metricas.etapa(etapa)
+    def ao_receber():
+        lote = st.session_state.get(key)
+        if not lote or not lote.get("leituras"):
+            return
+        anterior = st.session_state.get(chave_vereditos)
+        if anterior and (anterior["origem"], anterior["lote"]) == (lote.get("origem"), lote.get("lote")):
+            return
+        st.session_state[chave_vereditos] = {
+            "origem": lote.get("origem"),
+            "lote": lote.get("lote"),
+            "itens": processar_leituras(lote["leituras"], bipar),
+        }
+
+    return _componente(
+        key=key,
+        default=None,
+        on_change=ao_receber,
+        vereditos=st.session_state.get(chave_vereditos),
+        placeholder=placeholder,
+        lote_max=lote_max,
+        intervalo_ms=intervalo_ms,
+        altura=altura,
+    )
@@ -1,11 +1,35 @@
-import re
 import streamlit as st
-from supabase import create_client
 from datetime import datetime, timezone, timedelta, time
 import pytz
+import numpy as np
 import pandas as pd
 import base64
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from time import perf_counter
+
+import arquivo
+import codigos
+import conciliacao
+import jornal
+import leitor
+import metricas
+import monitor
+import resiliencia
+from backend import backend_local_configurado, criar_backend
+from cache import CacheCaixas, criar_cache_faturamento
+from estado_sessao import ConferenciaCompacta, compactar_espelho, espelho_selecionado, medir_sessao, romaneios_sugeridos
+from helpers import (
+    chunk_list,
+    env_float,
+    extrair_caixas,
+    format_datetime_sp,
+    normalize_chave,
+    parse_romaneios,
+)
+from prefetch import Prefetcher
+from repositorios import Repositorios
 
 # =========================================================
 # CONFIG
@@ -17,45 +41,36 @@ FUSO_SP = pytz.timezone("America/Sao_Paulo")
 # =========================================================
 # SUPABASE
 # =========================================================
-try:
-    SUPABASE_URL = st.secrets["SUPABASE_URL"]
-    SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
-except Exception:
-    st.error("Erro: Credenciais do Supabase não encontradas nos Secrets.")
-    st.stop()
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-
-# =========================================================
-# HELPERS
-# =========================================================
-def normalize_chave(value: str) -> str:
-    return (value or "").strip().upper()
-
-
-def get_now_utc() -> str:
-    """Grava em UTC."""
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
-
+if backend_local_configurado():
+    SUPABASE_URL = SUPABASE_KEY = None
+else:
+    try:
+        SUPABASE_URL = st.secrets["SUPABASE_URL"]
+        SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
+    except Exception:
+        st.error("Erro: Credenciais do Supabase não encontradas nos Secrets.")
+        st.stop()
 
-def format_datetime_sp(value):
+@st.cache_resource(show_spinner=False)
+def get_repos() -> Repositorios:
     """
-    Converte datetime/string ISO para o fuso de São Paulo
-    e retorna no formato dd/mm/aaaa HH:MM:SS.
+    Um backend por processo, compartilhado entre reruns e sessões:
+    o cliente HTTP (pool + keep-alive) não é recriado a cada interação.
+    Consultas leem também o arquivo frio (arquivo.py), se houver. Toda chamada passa
+    pela camada de resiliência (resiliencia.py): retentativas, prazo e disjuntor.
     """
-    if value is None or value == "":
-        return ""
+    return Repositorios(
+        metricas.BackendInstrumentado(resiliencia.criar_backend_resiliente(criar_backend(SUPABASE_URL, SUPABASE_KEY))),
+        arquivo=arquivo.criar_arquivo(),
+    )
 
-    try:
-        dt = pd.to_datetime(value, errors="coerce", utc=True)
-        if pd.isna(dt):
-            return ""
-        return dt.tz_convert("America/Sao_Paulo").strftime("%d/%m/%Y %H:%M:%S")
-    except Exception:
-        return str(value)
 
+repos = get_repos()
 
+
+# =========================================================
+# HELPERS
+# =========================================================
 def get_base64_of_bin_file(bin_file: str) -> str:
     if os.path.exists(bin_file):
         with open(bin_file, "rb") as f:
@@ -64,66 +79,116 @@ def get_base64_of_bin_file(bin_file: str) -> str:
     return ""
 
 
-def parse_romaneios(texto: str) -> list[int]:
-    if not texto:
-        return []
-    raw = (
-        texto.replace(";", ",")
-        .replace("\n", ",")
-        .replace("\t", ",")
-        .replace(" ", "")
-    )
-    parts = [p for p in raw.split(",") if p]
-    ids = []
-    for p in parts:
-        if p.isdigit():
-            ids.append(int(p))
-    # unique mantendo ordem
-    seen = set()
-    out = []
-    for i in ids:
-        if i not in seen:
-            out.append(i)
-            seen.add(i)
-    return out
+def avisar(painel: str, nivel: str, msg: str):
+    """
+    Mensagem de um callback de bipagem (nivel: warning, error, toast...).
+    Callbacks de fragmento não podem desenhar: o painel exibe na próxima execução.
+    """
+    st.session_state.setdefault(f"avisos_{painel}", []).append((nivel, msg))
 
 
-# =========================================================
-# CAIXAS: extrair múltiplas em um input (ex.: F2830233F2830222)
-# =========================================================
-CAIXA_PATTERN = re.compile(r"[A-Z]\d{7,}")  # Ex.: F2830233
-
-
-def extrair_caixas(raw: str) -> list[str]:
-    raw = normalize_chave(raw)
-    if not raw:
-        return []
-
-    achadas = CAIXA_PATTERN.findall(raw)
-    if achadas:
-        seen = set()
-        out = []
-        for c in achadas:
-            if c not in seen:
-                out.append(c)
-                seen.add(c)
-        return out
-
-    parts = re.split(r"[^A-Z0-9]+", raw)
-    parts = [p for p in parts if p]
-    seen = set()
-    out = []
-    for p in parts:
-        if p not in seen:
-            out.append(p)
-            seen.add(p)
-    return out
+def mostrar_avisos(painel: str):
+    for nivel, msg in st.session_state.pop(f"avisos_{painel}", []):
+        getattr(st, nivel)(msg)
+
+
+def consulta_guardada(chave: str, filtros) -> bool:
+    salvo = st.session_state.get(chave)
+    return salvo is not None and salvo["filtros"] == filtros
+
+
+def consulta_da_secao(chave: str, filtros, buscar, forcar: bool = False):
+    """
+    Resultado de consulta da Base de Dados guardado na sessão (uma chave por tipo de consulta).
+    Reruns com os mesmos filtros (outras seções, botões da tela) não consultam de novo;
+    forcar=True (botão Pesquisar) atualiza.
+    """
+    if forcar or not consulta_guardada(chave, filtros):
+        st.session_state[chave] = {"filtros": filtros, "dados": buscar()}
+    return st.session_state[chave]["dados"]
 
 
 # =========================================================
 # FATURAMENTO (SUPABASE): destino/filial/qtde por caixa
 # =========================================================
-@st.cache_data(ttl=6 * 3600, show_spinner=False)
+COLS_FATURAMENTO = ["caixa", "filial_origem", "destino", "qtde_pecas"]
+PREFETCH_RECENTES_HORAS = 24
+PREFETCH_RECENTES_LIMITE = 5000  # em páginas de TAMANHO_PAGINA (max-rows do PostgREST)
+
+
+def _categoria(s: pd.Series) -> pd.Series:
+    """Texto repetido (destino, filial) como category, vazio no lugar de nulo."""
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype("category")
+    if "" not in s.cat.categories:
+        s = s.cat.add_categories([""])  # merge/fillna("") depois não quebram
+    return s.fillna("")
+
+
+def _df_faturamento(rows) -> pd.DataFrame:
+    """
+    Normaliza linhas de faturamento: 1 linha por caixa (mais recente por created_at).
+    Aceita lista de dicts ou o DataFrame já tipado do repositório (por_caixas_df/recentes_df).
+    """
+    if len(rows) == 0:
+        return pd.DataFrame(columns=COLS_FATURAMENTO)
+
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+
+    if "created_at" in df.columns:
+        if not isinstance(df["created_at"].dtype, pd.DatetimeTZDtype):
+            df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
+        df = df.sort_values(["caixa", "created_at"], ascending=[True, False])
+
+    df = df.drop_duplicates(subset=["caixa"], keep="first")
+
+    for col, default in {
+        "caixa": "",
+        "filial_origem": "",
+        "destino": "",
+        "qtde_pecas": 0,
+    }.items():
+        if col not in df.columns:
+            df[col] = default
+
+    df["caixa"] = df["caixa"].fillna("").astype(str).str.upper().str.strip()
+    df["filial_origem"] = _categoria(df["filial_origem"])
+    df["destino"] = _categoria(df["destino"])
+    df["qtde_pecas"] = pd.to_numeric(df["qtde_pecas"], errors="coerce").fillna(0).astype(int)
+
+    return df[COLS_FATURAMENTO]
+
+
+def _faturamento_por_caixas(caixas: list[str]) -> dict:
+    df = _df_faturamento(repos.faturamento.por_caixas_df(caixas))
+    return {r["caixa"]: r for r in df.to_dict("records")}
+
+
+def _faturamento_recente() -> dict:
+    desde = (datetime.now(timezone.utc) - timedelta(hours=PREFETCH_RECENTES_HORAS)).replace(microsecond=0).isoformat()
+    df = _df_faturamento(repos.faturamento.recentes_df(desde, limite=PREFETCH_RECENTES_LIMITE))
+    return {r["caixa"]: r for r in df.to_dict("records")}
+
+
+@st.cache_resource(show_spinner=False)
+def get_cache_faturamento() -> CacheCaixas:
+    """
+    Faturamento por caixa do processo: LRU em memória com teto + nível em disco.
+    Preenchido pelo prefetch, pelas buscas em lote e pela busca de destino na bipagem.
+    """
+    return criar_cache_faturamento()
+
+
+@st.cache_resource(show_spinner=False)
+def get_prefetcher() -> Prefetcher:
+    return Prefetcher(get_cache_faturamento(), _faturamento_por_caixas)
+
+
+cache_faturamento = get_cache_faturamento()
+prefetcher = get_prefetcher()
+
+
+@metricas.rotular("buscar_destino_por_caixa")
 def buscar_destino_por_caixa(caixa: str):
     """
     Busca destino (e filial_origem) na tabela public.faturamento (Supabase).
@@ -134,108 +199,415 @@ def buscar_destino_por_caixa(caixa: str):
     if not caixa:
         return None, None
 
-    try:
-        res = (
-            supabase.table("faturamento")
-            .select("destino, filial_origem")
-            .eq("caixa", caixa)
-            .order("created_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-        if res.data:
-            return res.data[0].get("destino"), res.data[0].get("filial_origem")
-    except Exception as e:
-        st.warning(f"⚠️ Falha ao buscar destino no faturamento: {e}")
-
+    achou, row = cache_faturamento.get(caixa)
+    if not achou:
+        try:
+            with resiliencia.prazo(ORCAMENTO_BIPAGEM_S):
+                row = repos.faturamento.ultimo_por_caixa(caixa, colunas=", ".join(COLS_FATURAMENTO))
+        except resiliencia.ErroBackend:
+            return None, None  # modo degradado: o aviso geral já está na tela
+        except Exception as e:
+            st.warning(f"⚠️ Falha ao buscar destino no faturamento: {e}")
+            return None, None
+        if row:
+            row = _df_faturamento([row]).to_dict("records")[0]
+        cache_faturamento.gravar({caixa: row} if row else {}, ausentes=[caixa])
+
+    if row:
+        return row.get("destino"), row.get("filial_origem")
     return None, None
 
 
-def chunk_list(items: list[str], size: int = 500) -> list[list[str]]:
-    return [items[i:i + size] for i in range(0, len(items), size)]
+@st.cache_resource(show_spinner=False)
+def get_cache_expedidas() -> CacheCaixas:
+    """
+    Caixas já expedidas em romaneio espelho, por caixa (só memória, TTL curto:
+    outro processo pode finalizar um espelho). Valor: {"romaneio_espelho_id": id} ou None.
+    """
+    return CacheCaixas(ttl=5 * 60, max_bytes=4 * 1024 * 1024)
+
+
+cache_expedidas = get_cache_expedidas()
 
 
-@st.cache_data(ttl=2 * 3600, show_spinner=False)
+@metricas.rotular("buscar_faturamento_batch")
 def buscar_faturamento_batch(caixas: list[str]) -> pd.DataFrame:
     """
     Busca em lote na tabela 'faturamento' do Supabase:
     caixa, filial_origem, destino, qtde_pecas, created_at
     Retorna 1 linha por caixa (mais recente por created_at).
+    Servido caixa a caixa pelo cache do processo: só as que faltam vão ao banco (em lotes).
     """
     caixas = [normalize_chave(c) for c in caixas if normalize_chave(c)]
     caixas = list(dict.fromkeys(caixas))
     if not caixas:
-        return pd.DataFrame(columns=["caixa", "filial_origem", "destino", "qtde_pecas"])
-
-    dfs = []
-    for part in chunk_list(caixas, size=500):
-        res = (
-            supabase.table("faturamento")
-            .select("caixa, filial_origem, destino, qtde_pecas, created_at")
-            .in_("caixa", part)
-            .execute()
-        )
-        if res.data:
-            dfs.append(pd.DataFrame(res.data))
+        return pd.DataFrame(columns=COLS_FATURAMENTO)
 
-    if not dfs:
-        return pd.DataFrame(columns=["caixa", "filial_origem", "destino", "qtde_pecas"])
+    achados, faltando = cache_faturamento.buscar(caixas)
+    df_cache = pd.DataFrame([v for v in achados.values() if v], columns=COLS_FATURAMENTO)
+    if not faltando:
+        return df_cache
 
-    df = pd.concat(dfs, ignore_index=True)
+    df_novos = _df_faturamento(repos.faturamento.por_caixas_df(faltando))
+    cache_faturamento.gravar({r["caixa"]: r for r in df_novos.to_dict("records")}, ausentes=faltando)
 
-    if "created_at" in df.columns:
-        df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
-        df = df.sort_values(["caixa", "created_at"], ascending=[True, False])
+    if df_cache.empty:
+        return df_novos
+    return pd.concat([df_cache, df_novos], ignore_index=True)
 
-    df = df.drop_duplicates(subset=["caixa"], keep="first")
 
-    for col, default in {
-        "caixa": "",
-        "filial_origem": "",
-        "destino": "",
-        "qtde_pecas": 0,
-    }.items():
-        if col not in df.columns:
-            df[col] = default
+@metricas.rotular("buscar_caixas_ja_expedidas")
+def buscar_caixas_ja_expedidas(caixas: list[str], revalidar: bool = False) -> pd.DataFrame:
+    """
+    Consulta romaneio_espelho_itens e retorna caixas que já foram expedidas.
+    Espera colunas: caixa, romaneio_espelho_id
+    Servido caixa a caixa pelo cache curto; revalidar=True ignora o cache
+    (checagem final antes de gravar o espelho) e atualiza as entradas.
+    """
+    caixas = [normalize_chave(c) for c in caixas if normalize_chave(c)]
+    caixas = list(dict.fromkeys(caixas))
+
+    if not caixas:
+        return pd.DataFrame(columns=["caixa", "romaneio_espelho_id"])
+
+    if revalidar:
+        achados, faltando = {}, caixas
+    else:
+        achados, faltando = cache_expedidas.buscar(caixas)
+
+    if faltando:
+        rows = repos.espelho_itens.por_caixas(faltando)
+        novos = {}
+        for r in rows:
+            c = normalize_chave(str(r.get("caixa") or ""))
+            if c and c not in novos:
+                novos[c] = {"romaneio_espelho_id": r.get("romaneio_espelho_id")}
+        cache_expedidas.gravar(novos, ausentes=faltando)
+        achados.update(novos)
+
+    expedidas = [
+        {"caixa": c, "romaneio_espelho_id": v["romaneio_espelho_id"]}
+        for c, v in achados.items() if v
+    ]
+    return pd.DataFrame(expedidas, columns=["caixa", "romaneio_espelho_id"])
+
+
+# =========================================================
+# JORNAL DE BIPAGENS (um evento por leitura; relatório em jornal.py)
+# =========================================================
+@st.cache_resource(show_spinner=False)
+def get_jornal() -> jornal.JornalBipagens | None:
+    """Um jornal por processo: o buffer é compartilhado e gravado em lote."""
+    return jornal.criar_jornal()
+
+
+jornal_bipagens = get_jornal()
+
+
+def registrar_bipagem(tela: str, romaneio, caixa: str, resultado: str, t0: float):
+    if jornal_bipagens is not None:
+        jornal_bipagens.registrar(tela, st.session_state.get("user_email"), romaneio, caixa, resultado, t0)
 
-    df["caixa"] = df["caixa"].fillna("").astype(str).str.upper().str.strip()
-    df["filial_origem"] = df["filial_origem"].fillna("").astype(str)
-    df["destino"] = df["destino"].fillna("").astype(str)
-    df["qtde_pecas"] = pd.to_numeric(df["qtde_pecas"], errors="coerce").fillna(0).astype(int)
 
-    return df[["caixa", "filial_origem", "destino", "qtde_pecas"]]
+# =========================================================
+# BIPAGEM EM LOTE (campo de texto e leitor; um veredito por caixa)
+# =========================================================
+NIVEL_AVISO = {"ok": "toast", "duplicado": "warning", "invalido": "warning", "fora_romaneio": "error", "erro": "error"}
+# tempo máximo de banco por lote bipado; passou disso, o lote volta com erro em vez de travar a tela
+ORCAMENTO_BIPAGEM_S = env_float("CONFERENCIA_ORCAMENTO_BIPAGEM_S", 3)
+
 
+def avisar_vereditos(painel: str, vereditos: list[dict]):
+    """Um aviso por leitura; erros do banco no mesmo lote viram um aviso só."""
+    erros = [v for v in vereditos if v["res"] == "erro"]
+    for v in vereditos:
+        if v["res"] != "erro" or len(erros) == 1:
+            avisar(painel, NIVEL_AVISO[v["res"]], v["msg"])
+    if len(erros) > 1:
+        avisar(painel, "error", f"{len(erros)} caixas não gravadas; bipe de novo. {erros[0]['msg']}")
 
-@st.cache_data(ttl=30 * 60, show_spinner=False)
-def buscar_caixas_ja_expedidas(caixas: list[str]) -> pd.DataFrame:
+
+@metricas.rotular("bipar_reserva")
+def bipar_reserva(romaneio_id: int, caixas: list[str], t0: float, espera: dict | None = None) -> list[dict]:
     """
-    Consulta romaneio_espelho_itens e retorna caixas que já foram expedidas.
-    Espera colunas: caixa, romaneio_espelho_id
+    Registra um lote no romaneio aberto da Reserva: destinos num select e
+    volumes novos num insert. Retorna um veredito por caixa, na ordem recebida.
+    """
+    espera = espera or {}
+    out, novas = [None] * len(caixas), {}
+    # um orçamento para o lote inteiro: manifesto, faturamento e insert
+    with resiliencia.prazo(ORCAMENTO_BIPAGEM_S):
+        try:
+            man = repos.manifestos.obter(romaneio_id)
+        except Exception as e:
+            out = [leitor.veredito(c, "erro", f"Erro ao registrar {c}: {e}") for c in caixas]
+            man = None
+        else:
+            for i, chave in enumerate(caixas):
+                if len(chave) < 4:
+                    out[i] = leitor.veredito(chave, "invalido", f"Chave muito curta ignorada: {chave}")
+                elif (man is not None and man.contem(chave)) or chave in novas:
+                    out[i] = leitor.veredito(chave, "duplicado", f"⚠️ Já bipado neste romaneio: {chave}")
+                else:
+                    novas[chave] = i
+            if novas and (man is None or not man.completo):
+                # manifesto ausente ou desatualizado (delta falhou): a duplicidade é conferida no banco
+                try:
+                    ja_bipadas = repos.conferencia.existentes(romaneio_id, list(novas))
+                except Exception as e:
+                    for chave, i in novas.items():
+                        out[i] = leitor.veredito(chave, "erro", f"Erro ao registrar {chave}: {e}")
+                    novas = {}
+                else:
+                    for chave in ja_bipadas:
+                        i = novas.pop(chave, None)
+                        if i is not None:
+                            out[i] = leitor.veredito(chave, "duplicado", f"⚠️ Já bipado neste romaneio: {chave}")
+
+        if novas:
+            try:
+                df_fat = buscar_faturamento_batch(list(novas))
+                destinos = {c: d for c, d in zip(df_fat["caixa"], df_fat["destino"]) if isinstance(d, str) and d}
+            except Exception:
+                destinos = {}  # sem destino o volume entra igual; a lista completa pelo faturamento depois
+            try:
+                repos.conferencia.registrar_varios(romaneio_id, [(c, destinos.get(normalize_chave(c))) for c in novas])
+                for chave, i in novas.items():
+                    out[i] = leitor.veredito(chave, "ok", f"✅ Bipado: {chave[-10:]}")
+            except Exception as e:
+                for chave, i in novas.items():
+                    out[i] = leitor.veredito(chave, "erro", f"Erro ao registrar {chave}: {e}")
+
+    for v in out:
+        registrar_bipagem("reserva", romaneio_id, v["codigo"], v["res"], t0 - espera.get(v["codigo"], 0))
+    return out
+
+
+@metricas.rotular("bipar_recebimento")
+def bipar_recebimento(conf: ConferenciaCompacta, tela: str, caixas: list[str], t0: float, espera: dict | None = None, romaneio_id: int | None = None) -> list[dict]:
+    """
+    Recebe um lote na Pavuna: um update por romaneio do lote, não por caixa (conf é marcado in place).
+    romaneio_id: modo single (um romaneio só); None no multi.
+    """
+    espera = espera or {}
+    out, por_rom, vistas = [None] * len(caixas), {}, set()
+    for i, chave in enumerate(caixas):
+        rid = conf.romaneio_de(chave)
+        if not rid:
+            msg = f"❌ Volume não pertence a este romaneio: {chave}" if romaneio_id else f"❌ Volume não pertence aos romaneios carregados: {chave}"
+            out[i] = leitor.veredito(chave, "fora_romaneio", msg)
+        elif conf.foi_recebida(chave) or chave in vistas:
+            msg = f"Já bipado: {chave}" if romaneio_id else f"Já bipado (já consta como recebido): {chave}"
+            out[i] = leitor.veredito(chave, "duplicado", msg)
+        else:
+            por_rom.setdefault(rid, []).append(i)
+            vistas.add(chave)
+
+    with resiliencia.prazo(ORCAMENTO_BIPAGEM_S):
+        for rid, posicoes in por_rom.items():
+            chaves = [caixas[i] for i in posicoes]
+            try:
+                repos.conferencia.marcar_recebidos(rid, chaves)
+                for i, chave in zip(posicoes, chaves):
+                    conf.marcar_recebida(chave)
+                    msg = f"✅ Validado: {chave}" if romaneio_id else f"✅ Validado {chave} no romaneio #{rid}!"
+                    out[i] = leitor.veredito(chave, "ok", msg)
+            except Exception as e:
+                for i, chave in zip(posicoes, chaves):
+                    out[i] = leitor.veredito(chave, "erro", f"Erro ao validar {chave}: {e}")
+
+    for v in out:
+        rom = romaneio_id or conf.romaneio_de(v["codigo"])
+        registrar_bipagem(tela, rom, v["codigo"], v["res"], t0 - espera.get(v["codigo"], 0))
+    return out
+
+
+# =========================================================
+# CONCILIAÇÃO (motor em conciliacao.py; dias encerrados em cache no disco)
+# =========================================================
+ROTULOS_CONCILIACAO = {
+    "expedido_nao_recebido": "Expedido sem recebimento",
+    "recebido_sem_espelho": "Recebido sem espelho",
+    "espelho_sem_faturamento": "Espelho sem faturamento",
+    "qtde_pecas_divergente": "Qtde peças divergente",
+    "qtd_volumes_divergente": "Qtd volumes (romaneio)",
+    "qtd_caixas_divergente": "Qtd caixas (espelho)",
+}
+
+
+@st.cache_resource(show_spinner=False)
+def get_conciliacao() -> conciliacao.Conciliacao:
+    return conciliacao.criar_conciliacao(repos)
+
+
+# =========================================================
+# MONITOR (estado no processo; telas abertas dividem a mesma consulta)
+# =========================================================
+INTERVALOS_MONITOR = [2, 5, 10, 15, 30, 60]
+MONITOR_PARADO_MIN = 10
+
+
+@st.cache_resource(show_spinner=False)
+def get_monitor() -> monitor.MonitorRomaneios:
+    return monitor.MonitorRomaneios(repos.romaneios, intervalo=env_float("CONFERENCIA_MONITOR_INTERVALO_S", 5))
+
+
+# =========================================================
+# RASTREIO DE CAIXAS (conferencia_reserva + faturamento + espelho)
+# =========================================================
+RASTREIO_CHUNK = 500
+RASTREIO_WORKERS = 6
+
+
+def _rastreio_reserva(part: list[str]) -> list[dict]:
+    return repos.conferencia.por_caixas(
+        part,
+        colunas="chave_nfe, romaneio_id, destino, data_expedicao, data_recebimento",
+        com_romaneio="status, rota, usuario_criou",
+        com_arquivo=True,
+    )
+
+
+def _rastreio_faturamento(part: list[str]) -> list[dict]:
+    return repos.faturamento.por_caixas(part)
+
+
+def _rastreio_espelho(part: list[str]) -> list[dict]:
+    return repos.espelho_itens.por_caixas(
+        part,
+        colunas="caixa, romaneio_espelho_id, destino, qtde_pecas",
+        com_espelho="criado_em, rota, usuario_criou",
+        com_arquivo=True,
+    )
+
+
+@metricas.rotular("rastrear_caixas")
+def rastrear_caixas(caixas: list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Rastreia uma ou várias caixas nas três tabelas do ciclo de vida.
+    As consultas são feitas em lotes (in_) e em paralelo: cada lote de
+    caixas gera uma consulta por tabela, todas disparadas no mesmo pool.
+    Retorna: (resumo por caixa, linha do tempo com um evento por linha)
     """
     caixas = [normalize_chave(c) for c in caixas if normalize_chave(c)]
     caixas = list(dict.fromkeys(caixas))
 
+    cols_resumo = ["caixa", "situacao", "romaneio", "rota", "destino", "filial_origem", "qtde_pecas",
+                   "expedicao", "recebimento", "romaneio_espelho", "rota_espelho"]
+    cols_timeline = ["caixa", "data", "etapa", "romaneio", "rota", "destino", "detalhe"]
     if not caixas:
-        return pd.DataFrame(columns=["caixa", "romaneio_espelho_id"])
+        return pd.DataFrame(columns=cols_resumo), pd.DataFrame(columns=cols_timeline)
+
+    fontes = {
+        "reserva": _rastreio_reserva,
+        "faturamento": _rastreio_faturamento,
+        "espelho": _rastreio_espelho,
+    }
+    linhas = {nome: [] for nome in fontes}
+    with ThreadPoolExecutor(max_workers=RASTREIO_WORKERS) as pool:
+        futuros = {
+            pool.submit(metricas.propagar(fn), part): nome
+            for part in chunk_list(caixas, size=RASTREIO_CHUNK)
+            for nome, fn in fontes.items()
+        }
+        for fut in as_completed(futuros):
+            linhas[futuros[fut]].extend(fut.result())
+
+    eventos = []
+    resumo = {c: {"caixa": c} for c in caixas}
+
+    fat = {}
+    for row in linhas["faturamento"]:
+        c = normalize_chave(row.get("caixa"))
+        atual = fat.get(c)
+        if atual is None or str(row.get("created_at") or "") > str(atual.get("created_at") or ""):
+            fat[c] = row
+    for c, row in fat.items():
+        if c not in resumo:
+            continue
+        resumo[c].update({
+            "destino": row.get("destino") or "",
+            "filial_origem": row.get("filial_origem") or "",
+            "qtde_pecas": row.get("qtde_pecas"),
+        })
+        eventos.append({
+            "caixa": c,
+            "data": row.get("created_at"),
+            "etapa": "Faturamento",
+            "destino": row.get("destino") or "",
+            "detalhe": f"Filial {row.get('filial_origem') or '-'} | {row.get('qtde_pecas') or 0} peças",
+        })
 
-    dfs = []
-    for part in chunk_list(caixas, size=500):
-        res = (
-            supabase.table("romaneio_espelho_itens")
-            .select("caixa, romaneio_espelho_id")
-            .in_("caixa", part)
-            .execute()
-        )
-        if res.data:
-            dfs.append(pd.DataFrame(res.data))
+    for row in linhas["reserva"]:
+        c = normalize_chave(row.get("chave_nfe"))
+        if c not in resumo:
+            continue
+        rom = row.get("romaneios") or {}
+        base = {
+            "caixa": c,
+            "romaneio": row.get("romaneio_id"),
+            "rota": rom.get("rota") or "",
+            "destino": row.get("destino") or resumo[c].get("destino", ""),
+        }
+        eventos.append({
+            **base,
+            "data": row.get("data_expedicao"),
+            "etapa": "Expedição Reserva",
+            "detalhe": f"{rom.get('usuario_criou') or ''} | romaneio {rom.get('status') or ''}",
+        })
+        if row.get("data_recebimento"):
+            eventos.append({**base, "data": row.get("data_recebimento"), "etapa": "Recebimento Pavuna", "detalhe": ""})
+        resumo[c].update({
+            "romaneio": row.get("romaneio_id"),
+            "rota": base["rota"],
+            "expedicao": row.get("data_expedicao"),
+            "recebimento": row.get("data_recebimento"),
+        })
+        if base["destino"]:
+            resumo[c]["destino"] = base["destino"]
+
+    for row in linhas["espelho"]:
+        c = normalize_chave(row.get("caixa"))
+        if c not in resumo:
+            continue
+        esp = row.get("romaneios_espelho") or {}
+        eventos.append({
+            "caixa": c,
+            "data": esp.get("criado_em"),
+            "etapa": "Romaneio Espelho",
+            "romaneio": row.get("romaneio_espelho_id"),
+            "rota": esp.get("rota") or "",
+            "destino": row.get("destino") or "",
+            "detalhe": esp.get("usuario_criou") or "",
+        })
+        resumo[c].update({
+            "romaneio_espelho": row.get("romaneio_espelho_id"),
+            "rota_espelho": esp.get("rota") or "",
+        })
 
-    if not dfs:
-        return pd.DataFrame(columns=["caixa", "romaneio_espelho_id"])
+    for r in resumo.values():
+        if r.get("romaneio_espelho"):
+            r["situacao"] = "Expedida Pavuna (espelho)"
+        elif r.get("recebimento"):
+            r["situacao"] = "Recebida Pavuna"
+        elif r.get("expedicao"):
+            r["situacao"] = "Expedida Reserva"
+        elif r.get("destino") or r.get("filial_origem"):
+            r["situacao"] = "Somente faturada"
+        else:
+            r["situacao"] = "Não encontrada"
 
-    df = pd.concat(dfs, ignore_index=True)
-    df["caixa"] = df["caixa"].fillna("").astype(str).str.upper().str.strip()
-    df = df.drop_duplicates(subset=["caixa"], keep="first")
-    return df[["caixa", "romaneio_espelho_id"]]
+    df_resumo = pd.DataFrame(list(resumo.values())).reindex(columns=cols_resumo)
+    for col in ["expedicao", "recebimento"]:
+        df_resumo[col] = df_resumo[col].apply(format_datetime_sp)
+
+    df_timeline = pd.DataFrame(eventos).reindex(columns=cols_timeline)
+    if not df_timeline.empty:
+        df_timeline["_ord"] = pd.to_datetime(df_timeline["data"], errors="coerce", utc=True)
+        df_timeline = df_timeline.sort_values(["caixa", "_ord"], na_position="last").drop(columns="_ord")
+        df_timeline["data"] = df_timeline["data"].apply(format_datetime_sp)
+
+    return df_resumo, df_timeline
 
 
 def montar_df_reserva_com_destino(rows) -> pd.DataFrame:
@@ -260,10 +632,83 @@ def montar_df_reserva_com_destino(rows) -> pd.DataFrame:
     return pd.DataFrame(dados)
 
 
-def encerrar_romaneio_reserva_pela_pesquisa(romaneio_id: int, rota: str):
+# =========================================================
+# ESPELHO: carga dos romaneios em paralelo
+# =========================================================
+COLS_ESPELHO_FULL = ["selecionar", "caixa", "filial_origem", "destino", "qtde_pecas", "ja_expedida", "romaneio_espelho_existente"]
+
+
+@metricas.rotular("carregar_espelho")
+def carregar_espelho(ids: list[int]) -> dict:
+    """
+    Monta a base do romaneio espelho em duas etapas:
+    1) manifestos dos romaneios (cabeçalho + volumes; cache do processo, carga em paralelo)
+    2) faturamento + caixas já expedidas, em paralelo (ambos só dependem da lista de caixas)
+    O tempo total fica perto da soma das consultas mais lentas de cada etapa, não de todas.
+    Retorna: validos, invalidos, caixas (recebidas) e df_itens com as colunas de COLS_ESPELHO_FULL.
     """
-    Encerra romaneio da Reserva a partir da tela de pesquisa.
-    Regras:
+    manifestos = repos.manifestos.varios(ids)
+    encontrados = {i: m.romaneio for i, m in manifestos.items()}
+
+    invalidos = []
+    validos = []
+    for i in ids:
+        r = encontrados.get(i)
+        if not r or r.get("status") != "Encerrado" or r.get("unidade_origem") != "CD Reserva":
+            invalidos.append(i)
+        else:
+            validos.append(i)
+
+    rows = [r for i in validos for r in manifestos[i].linhas()]
+    df_conf = pd.DataFrame(rows, columns=["chave_nfe", "romaneio_id", "data_recebimento"])
+    df_conf = df_conf[df_conf["romaneio_id"].isin(validos) & df_conf["data_recebimento"].notna()]
+    caixas_s = df_conf["chave_nfe"].fillna("").astype(str).str.strip().str.upper()
+    caixas = caixas_s[caixas_s != ""].drop_duplicates().tolist()
+
+    if not validos or not caixas:
+        return {"validos": validos, "invalidos": invalidos, "caixas": caixas,
+                "df_itens": pd.DataFrame(columns=COLS_ESPELHO_FULL)}
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        f_fat = pool.submit(metricas.propagar(buscar_faturamento_batch), caixas)
+        f_exp = pool.submit(metricas.propagar(buscar_caixas_ja_expedidas), caixas)
+        df_batch = f_fat.result()
+        df_expedidas = f_exp.result()
+
+    df_itens = (
+        pd.DataFrame({"caixa": caixas})
+        .merge(df_batch, on="caixa", how="left")
+        .merge(
+            df_expedidas.rename(columns={"romaneio_espelho_id": "romaneio_espelho_existente"}),
+            on="caixa",
+            how="left",
+        )
+    )
+    df_itens["filial_origem"] = df_itens["filial_origem"].fillna("")
+    df_itens["destino"] = df_itens["destino"].fillna("")
+    df_itens["qtde_pecas"] = pd.to_numeric(df_itens["qtde_pecas"], errors="coerce").fillna(0).astype(int)
+
+    # Bloqueio de caixas já expedidas em romaneio espelho anterior
+    df_itens["ja_expedida"] = df_itens["romaneio_espelho_existente"].notna()
+    df_itens["selecionar"] = ~df_itens["ja_expedida"]
+
+    return {"validos": validos, "invalidos": invalidos, "caixas": caixas, "df_itens": df_itens[COLS_ESPELHO_FULL]}
+
+
+MSG_ENCERRAMENTO = {
+    "sem_rota": "Informe a rota antes de encerrar.",
+    "nao_encontrado": "Romaneio não encontrado.",
+    "unidade_invalida": "Somente romaneios do CD Reserva podem ser encerrados aqui.",
+    "ja_encerrado": "Este romaneio já está encerrado.",
+    "sem_volumes": "Não é possível encerrar um romaneio sem volumes.",
+}
+
+
+@metricas.rotular("encerrar_romaneio_reserva")
+def encerrar_romaneio_reserva(romaneio_id: int, rota: str):
+    """
+    Encerra romaneio da Reserva (operação e tela de pesquisa) numa única chamada ao banco.
+    Regras (validadas na função encerrar_romaneio_reserva do banco, na mesma transação):
     - precisa existir
     - precisa ser da unidade CD Reserva
     - não pode já estar encerrado
@@ -272,46 +717,15 @@ def encerrar_romaneio_reserva_pela_pesquisa(romaneio_id: int, rota: str):
     rota = (rota or "").strip().upper()
 
     if not rota:
-        return False, "Informe a rota antes de encerrar."
+        return False, MSG_ENCERRAMENTO["sem_rota"]
 
     try:
-        rom = (
-            supabase.table("romaneios")
-            .select("id, status, unidade_origem, rota")
-            .eq("id", int(romaneio_id))
-            .limit(1)
-            .execute()
-        )
-
-        if not rom.data:
-            return False, "Romaneio não encontrado."
-
-        rom_data = rom.data[0]
+        res = repos.romaneios.encerrar_reserva(romaneio_id, rota)
 
-        if rom_data.get("unidade_origem") != "CD Reserva":
-            return False, "Somente romaneios do CD Reserva podem ser encerrados aqui."
-
-        if rom_data.get("status") == "Encerrado":
-            return False, "Este romaneio já está encerrado."
-
-        qtd = (
-            supabase.table("conferencia_reserva")
-            .select("id", count="exact")
-            .eq("romaneio_id", int(romaneio_id))
-            .execute()
-        )
+        if not res.get("ok"):
+            return False, MSG_ENCERRAMENTO.get(res.get("motivo"), f"Não foi possível encerrar: {res.get('motivo')}")
 
-        total_volumes = qtd.count if qtd.count else 0
-        if total_volumes == 0:
-            return False, "Não é possível encerrar um romaneio sem volumes."
-
-        supabase.table("romaneios").update({
-            "status": "Encerrado",
-            "data_encerramento": get_now_utc(),
-            "rota": rota,
-        }).eq("id", int(romaneio_id)).execute()
-
-        return True, f"Romaneio #{romaneio_id} encerrado com sucesso."
+        return True, f"Romaneio #{romaneio_id} encerrado com sucesso ({res.get('qtd_volumes')} volumes)."
 
     except Exception as e:
         return False, f"Erro ao encerrar romaneio: {e}"
@@ -403,8 +817,8 @@ def imprimir_romaneio_espelho_html(id_romaneio, usuario, origem, df_itens: pd.Da
         if col not in df.columns:
             df[col] = "" if col != "qtde_pecas" else 0
 
-    df["caixa"] = df["caixa"].fillna("").astype(str)
-    df["destino"] = df["destino"].fillna("").astype(str)
+    df["caixa"] = df["caixa"].astype(object).fillna("").astype(str)
+    df["destino"] = df["destino"].astype(object).fillna("").astype(str)  # category ordena por categoria, não por texto
     df["qtde_pecas"] = pd.to_numeric(df["qtde_pecas"], errors="coerce").fillna(0).astype(int)
 
     df = df.sort_values(by=["destino", "caixa"], ascending=[True, True])
@@ -464,6 +878,109 @@ def imprimir_romaneio_espelho_html(id_romaneio, usuario, origem, df_itens: pd.Da
     return st.components.v1.html(html, height=0)
 
 
+# =========================================================
+# PAINEL DE MÉTRICAS (sidebar, opcional)
+# =========================================================
+# e-mails (separados por vírgula) que podem ver as métricas de todas as sessões
+# e usar as ações que valem para o processo inteiro (invalidar caches compartilhados)
+METRICAS_ADMINS = {e.strip().lower() for e in os.environ.get("CONFERENCIA_METRICAS_ADMINS", "").split(",") if e.strip()}
+
+
+def mostrar_painel_metricas():
+    sessao = metricas.sessao_atual()
+    with st.sidebar:
+        st.divider()
+        st.subheader("🔧 Métricas")
+        ver_todas = str(st.session_state.get("user_email") or "").strip().lower() in METRICAS_ADMINS
+        todas = ver_todas and st.checkbox("Todas as sessões", key="debug_metricas_todas")
+        registros = metricas.coletor.listar(sessao=None if todas else sessao)
+
+        reruns = [r for r in registros if r.get("tipo") == "rerun"]
+        if reruns:
+            ultimo = reruns[-1]
+            m1, m2 = st.columns(2)
+            m1.metric("Último rerun (ms)", f"{ultimo['ms']:.0f}")
+            m2.metric("Consultas no rerun", ultimo["consultas"])
+            escopo = f"fragmento {ultimo['fragmento']}" if ultimo.get("fragmento") else "script inteiro"
+            st.caption(f"Tela: {ultimo.get('tela') or '-'} ({escopo}) | tempo em consultas: {ultimo['ms_consultas']:.0f} ms")
+
+        etapas = metricas.consultas_por_etapa(registros)
+        if etapas:
+            st.write("**Consultas por bipagem**")
+            st.dataframe(pd.DataFrame(etapas), hide_index=True, width="stretch")
+
+        agregado = metricas.agregar_consultas(registros)
+        if agregado:
+            st.write("**Consultas por origem**")
+            st.dataframe(pd.DataFrame(agregado), hide_index=True, width="stretch")
+        else:
+            st.caption("Nenhuma consulta registrada ainda.")
+
+        st.download_button(
+            "⬇️ Exportar JSON lines",
+            data=metricas.exportar_jsonl(registros),
+            file_name="metricas_conferencia.jsonl",
+            mime="application/jsonl",
+            key="btn_export_jsonl",
+        )
+        if ver_todas:
+            # counters do processo inteiro (todas as sessões, desde o início)
+            st.download_button(
+                "⬇️ Exportar Prometheus",
+                data=metricas.exportar_prometheus(metricas.coletor.totais()),
+                file_name="metricas_conferencia.prom",
+                mime="text/plain",
+                key="btn_export_prom",
+            )
+        if st.button("🧹 Limpar métricas", key="btn_limpar_metricas"):
+            metricas.coletor.limpar(None if todas else sessao)
+            st.rerun()
+
+        mem = medir_sessao(st.session_state)
+        st.write(f"**Memória da sessão:** {mem['bytes'].sum() / 1024:.1f} KiB")
+        st.dataframe(mem.head(8), hide_index=True, width="stretch")
+
+        st.write("**Caches por caixa**")
+        st.dataframe(
+            pd.DataFrame({
+                "faturamento": cache_faturamento.estatisticas(),
+                "expedidas": cache_expedidas.estatisticas(),
+            }),
+            width="stretch",
+        )
+        if ver_todas and st.button("♻️ Invalidar cache de faturamento", key="btn_invalidar_cache_fat"):
+            cache_faturamento.invalidar()
+            st.rerun()
+
+        if jornal_bipagens is not None:
+            st.write("**Jornal de bipagens (hoje)**")
+            jornal_bipagens.descarregar()
+            hoje = datetime.now(FUSO_SP).date()
+            rel = jornal.relatorio(jornal.carregar(jornal_bipagens.pasta, desde=hoje), por=("op", "tela"))
+            if rel.empty:
+                st.caption("Nenhuma bipagem registrada hoje.")
+            else:
+                st.dataframe(rel, hide_index=True, width="stretch")
+            st.caption(f"Pasta: {jornal_bipagens.pasta} | relatório por hora: python jornal.py")
+
+        st.write("**Manifestos de romaneio (processo)**")
+        st.dataframe(pd.Series(repos.manifestos.estatisticas(), name="manifestos"), width="stretch")
+        if ver_todas and st.button("♻️ Invalidar manifestos", key="btn_invalidar_manifestos"):
+            repos.manifestos.invalidar()
+            st.rerun()
+
+        st.write("**Backend: retentativas e disjuntor (processo)**")
+        st.dataframe(pd.Series(repos.backend.estatisticas(), name="backend").astype(str), width="stretch")
+
+        st.write("**Monitor de romaneios (processo)**")
+        st.dataframe(pd.Series(get_monitor().estatisticas(), name="monitor"), width="stretch")
+
+        if repos.arquivo is not None:
+            st.write("**Arquivo frio (Parquet)**")
+            st.caption(repos.arquivo.pasta)
+            st.dataframe(pd.Series(repos.arquivo.estatisticas(), name="arquivo"), width="stretch")
+
+
 # =========================================================
 # LOGIN
 # =========================================================
@@ -509,22 +1026,62 @@ def show_login():
 if "auth" not in st.session_state:
     show_login()
 
+metricas.iniciar_rerun(metricas.sessao_atual())
+
 st.sidebar.title(f"🏢 {st.session_state['unidade']}")
 st.sidebar.write(f"👤 {st.session_state['user_email']}")
 if st.sidebar.button("Sair"):
+    metricas.coletor.encerrar_sessao(metricas.sessao_atual())
     st.session_state.clear()
     st.rerun()
+st.sidebar.toggle("🔧 Painel de métricas", key="debug_metricas")
+# leitor em lote por padrão; o campo de texto fica para digitação manual / navegador sem componente
+st.sidebar.toggle("⌨️ Entrada simples (campo de texto)", key="entrada_simples")
+
+# navegação: só a seção visível executa (st.tabs roda as duas a cada rerun)
+SECAO_OPERACAO, SECAO_BASE, SECAO_MONITOR = "🎯 Operação", "📊 Base de Dados", "📺 Monitor"
+
+# o Streamlit descarta o estado de widgets que não foram desenhados no rerun;
+# regravar a chave mantém filtros/modos ao trocar de seção e voltar
+MANTER_ENTRE_SECOES = [
+    "modo_pavuna", "conferir_multiplos", "rota_reserva", "rom_multi_input", "rom_single_input",
+    "roms_espelho_input", "rota_espelho",
+    "tipo_consulta", "filter_rom", "dt_ini_base", "dt_fim_base", "rastreio_caixas_input",
+    "conc_ini", "conc_fim", "conc_tipos", "monitor_intervalo",
+]
+for _k in MANTER_ENTRE_SECOES:
+    if _k in st.session_state:
+        st.session_state[_k] = st.session_state[_k]
+st.session_state.setdefault("conferir_multiplos", True)
+st.session_state.setdefault("dt_ini_base", None)
+st.session_state.setdefault("dt_fim_base", None)
+st.session_state.setdefault("conc_ini", datetime.now(FUSO_SP).date() - timedelta(days=7))
+st.session_state.setdefault("conc_fim", datetime.now(FUSO_SP).date())
+st.session_state.setdefault("monitor_intervalo", min(INTERVALOS_MONITOR, key=lambda s: abs(s - get_monitor().intervalo)))
+
+if repos.backend.degradado():
+    st.warning(
+        f"⚠️ Banco instável: modo degradado. As bipagens falham na hora em vez de travar; "
+        f"nova tentativa em {repos.backend.circuito.restante_s():.0f}s. As leituras não gravadas precisam ser bipadas de novo."
+    )
 
-tab_op, tab_base = st.tabs(["🎯 Operação", "📊 Base de Dados"])
+secao = st.radio(
+    "Seção",
+    [SECAO_OPERACAO, SECAO_BASE, SECAO_MONITOR],
+    horizontal=True,
+    key="secao",
+    label_visibility="collapsed",
+)
 
 # =========================================================
 # OPERAÇÃO
 # =========================================================
-with tab_op:
+if secao == SECAO_OPERACAO:
     # -------------------------
     # CD RESERVA (EXPEDIÇÃO)
     # -------------------------
     if st.session_state["unidade"] == "CD Reserva":
+        metricas.definir_tela("Reserva - Expedição")
         st.title("🚛 Expedição CD RESERVA")
 
         # impressão automática após encerrar
@@ -535,18 +1092,12 @@ with tab_op:
             colp1, colp2 = st.columns([1, 1])
             with colp1:
                 if st.button("🖨️ IMPRIMIR ROMANEIO (RESERVA)", type="primary", key="btn_print_reserva"):
-                    rr = (
-                        supabase.table("conferencia_reserva")
-                        .select("chave_nfe, destino, romaneios(usuario_criou, unidade_origem, rota)")
-                        .eq("romaneio_id", rid)
-                        .order("id", desc=False)
-                        .execute()
-                    )
-                    if rr.data:
-                        df_print = montar_df_reserva_com_destino(rr.data)
-                        usuario = rr.data[0]["romaneios"].get("usuario_criou", "")
-                        origem = rr.data[0]["romaneios"].get("unidade_origem", "CD Reserva")
-                        rota = rr.data[0]["romaneios"].get("rota", "")
+                    man = repos.manifestos.obter(rid)
+                    if man and len(man):
+                        df_print = montar_df_reserva_com_destino(man.linhas())
+                        usuario = man.romaneio.get("usuario_criou", "")
+                        origem = man.romaneio.get("unidade_origem", "CD Reserva")
+                        rota = man.romaneio.get("rota", "")
                         imprimir_romaneio_html(rid, df_print, usuario, origem, rota)
                     else:
                         st.warning("Nenhum volume encontrado para este romaneio.")
@@ -562,15 +1113,7 @@ with tab_op:
 
         if "romaneio_id" not in st.session_state:
             if st.button("🚀 ABRIR NOVO ROMANEIO"):
-                res = supabase.table("romaneios").insert(
-                    {
-                        "usuario_criou": st.session_state["user_email"],
-                        "unidade_origem": "CD Reserva",
-                        "status": "Aberto",
-                        "rota": None,
-                    }
-                ).execute()
-                st.session_state["romaneio_id"] = res.data[0]["id"]
+                st.session_state["romaneio_id"] = repos.romaneios.abrir_reserva(st.session_state["user_email"])
                 st.session_state["rota_reserva"] = ""
                 st.rerun()
 
@@ -578,131 +1121,100 @@ with tab_op:
             id_atual = int(st.session_state["romaneio_id"])
             st.info(f"📦 Romaneio Ativo: **#{id_atual}**")
 
+            # o que a Reserva bipa em seguida é o faturamento recente (no máximo 1x a cada 15 min por processo)
+            prefetcher.aquecer_recentes(_faturamento_recente)
+
             st.text_input(
                 "Rota",
                 key="rota_reserva",
                 placeholder="Ex.: ROTA 01, ROTA 02, ROTA 100"
             )
 
-            res_count = (
-                supabase.table("conferencia_reserva")
-                .select("id", count="exact")
-                .eq("romaneio_id", id_atual)
-                .execute()
-            )
-            total_bipado = res_count.count if res_count.count else 0
-            st.metric(label="Volumes Bipados", value=total_bipado)
-
-            res_itens_reserva = (
-                supabase.table("conferencia_reserva")
-                .select("id, chave_nfe, destino")
-                .eq("romaneio_id", id_atual)
-                .order("id", desc=False)
-                .execute()
-            )
-
-            itens_reserva = res_itens_reserva.data or []
-
-            if itens_reserva:
-                df_itens_reserva = pd.DataFrame(itens_reserva)
-
-                if "destino" not in df_itens_reserva.columns:
-                    df_itens_reserva["destino"] = ""
-
-                destinos_corrigidos = []
-                for _, row in df_itens_reserva.iterrows():
-                    destino = row.get("destino", "")
-                    caixa = row.get("chave_nfe", "")
-                    if not destino:
-                        destino_fat, _ = buscar_destino_por_caixa(caixa)
-                        destino = destino_fat or ""
-                    destinos_corrigidos.append(destino)
-
-                df_itens_reserva["destino"] = destinos_corrigidos
-
-                st.write("### Caixas já inseridas no romaneio")
-                st.dataframe(
-                    df_itens_reserva[["chave_nfe", "destino"]].rename(columns={
-                        "chave_nfe": "CAIXA",
-                        "destino": "Destino"
-                    }),
-                    width="stretch"
-                )
-
-                col_del1, col_del2 = st.columns([3, 1])
-
-                with col_del1:
-                    caixa_excluir = st.selectbox(
-                        "Selecione uma caixa para excluir",
-                        options=[""] + df_itens_reserva["chave_nfe"].astype(str).tolist(),
-                        key="caixa_excluir_reserva"
+            @st.fragment
+            @metricas.fragmento("Reserva - Expedição")
+            def painel_bipagem_reserva():
+                # a bipagem reexecuta só este painel (lista + exclusão + leitura), não a página
+                mostrar_avisos("reserva")
+                man_atual = repos.manifestos.obter(id_atual)
+                itens_reserva = man_atual.linhas() if man_atual else []
+                # manifesto completo (carga paginada + deltas em dia) já é a contagem; senão conta no banco
+                bipados = len(man_atual) if man_atual is not None and man_atual.completo else repos.conferencia.contar(id_atual)
+                st.metric(label="Volumes Bipados", value=bipados)
+
+                if itens_reserva:
+                    df_itens_reserva = pd.DataFrame(itens_reserva)
+
+                    if "destino" not in df_itens_reserva.columns:
+                        df_itens_reserva["destino"] = ""
+
+                    destinos_corrigidos = []
+                    for _, row in df_itens_reserva.iterrows():
+                        destino = row.get("destino", "")
+                        caixa = row.get("chave_nfe", "")
+                        if not destino:
+                            destino_fat, _ = buscar_destino_por_caixa(caixa)
+                            destino = destino_fat or ""
+                        destinos_corrigidos.append(destino)
+
+                    df_itens_reserva["destino"] = destinos_corrigidos
+
+                    st.write("### Caixas já inseridas no romaneio")
+                    st.dataframe(
+                        df_itens_reserva[["chave_nfe", "destino"]].rename(columns={
+                            "chave_nfe": "CAIXA",
+                            "destino": "Destino"
+                        }),
+                        width="stretch"
                     )
 
-                with col_del2:
-                    st.write("")
-                    st.write("")
-                    if st.button("🗑️ Excluir Caixa", key="btn_excluir_caixa_reserva"):
-                        if not caixa_excluir:
-                            st.warning("Selecione uma caixa para excluir.")
-                        else:
-                            try:
-                                supabase.table("conferencia_reserva") \
-                                    .delete() \
-                                    .eq("romaneio_id", id_atual) \
-                                    .eq("chave_nfe", caixa_excluir) \
-                                    .execute()
-
-                                st.success(f"✅ Caixa excluída: {caixa_excluir}")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Erro ao excluir caixa: {e}")
-
-            def reg_reserva():
-                raw = st.session_state.get("input_reserva")
-                caixas = extrair_caixas(raw)
-                st.session_state["input_reserva"] = ""
+                    col_del1, col_del2 = st.columns([3, 1])
 
-                if not caixas:
-                    return
-
-                if len(caixas) > 1:
-                    st.warning(f"⚠️ Foram detectadas {len(caixas)} caixas no mesmo input. Vou registrar separadamente.")
-
-                for chave in caixas:
-                    if len(chave) < 4:
-                        st.warning(f"Chave muito curta ignorada: {chave}")
-                        continue
-
-                    try:
-                        dup = (
-                            supabase.table("conferencia_reserva")
-                            .select("id")
-                            .eq("romaneio_id", id_atual)
-                            .eq("chave_nfe", chave)
-                            .limit(1)
-                            .execute()
+                    with col_del1:
+                        st.selectbox(
+                            "Selecione uma caixa para excluir",
+                            options=[""] + df_itens_reserva["chave_nfe"].astype(str).tolist(),
+                            key="caixa_excluir_reserva"
                         )
-                        if dup.data:
-                            st.warning(f"⚠️ Já bipado neste romaneio: {chave}")
-                            continue
-
-                        destino, _filial_origem = buscar_destino_por_caixa(chave)
-
-                        payload = {
-                            "chave_nfe": chave,
-                            "romaneio_id": id_atual,
-                            "data_expedicao": get_now_utc(),
-                        }
-                        if destino:
-                            payload["destino"] = destino
-
-                        supabase.table("conferencia_reserva").insert(payload).execute()
-                        st.toast(f"✅ Bipado: {chave[-10:]}")
 
-                    except Exception as e:
-                        st.error(f"Erro ao registrar {chave}: {e}")
+                    def excluir_caixa_reserva():
+                        # callback: exclui antes de o painel redesenhar a lista
+                        caixa_excluir = st.session_state.get("caixa_excluir_reserva")
+                        if not caixa_excluir:
+                            avisar("reserva", "warning", "Selecione uma caixa para excluir.")
+                            return
+                        try:
+                            repos.conferencia.excluir(id_atual, caixa_excluir)
+                            st.session_state["caixa_excluir_reserva"] = ""
+                            avisar("reserva", "success", f"✅ Caixa excluída: {caixa_excluir}")
+                        except Exception as e:
+                            avisar("reserva", "error", f"Erro ao excluir caixa: {e}")
+
+                    with col_del2:
+                        st.write("")
+                        st.write("")
+                        st.button("🗑️ Excluir Caixa", key="btn_excluir_caixa_reserva", on_click=excluir_caixa_reserva)
+
+                @metricas.etapa("reg_reserva")
+                def reg_reserva():
+                    t0 = perf_counter()
+                    raw = st.session_state.get("input_reserva")
+                    caixas = extrair_caixas(raw)
+                    st.session_state["input_reserva"] = ""
+
+                    if not caixas:
+                        return
+
+                    if len(caixas) > 1:
+                        avisar("reserva", "warning", f"⚠️ Foram detectadas {len(caixas)} caixas no mesmo input. Vou registrar separadamente.")
+
+                    avisar_vereditos("reserva", bipar_reserva(id_atual, caixas, t0))
+
+                if st.session_state.get("entrada_simples"):
+                    st.text_input("Bipe os volumes:", key="input_reserva", on_change=reg_reserva)
+                else:
+                    leitor.leitor_caixas("leitor_reserva", partial(bipar_reserva, id_atual), etapa="leitor_reserva")
 
-            st.text_input("Bipe os volumes:", key="input_reserva", on_change=reg_reserva)
+            painel_bipagem_reserva()
 
             if st.button("🏁 ENCERRAR ROMANEIO", key="btn_fecha_rom_reserva"):
                 rota = (st.session_state.get("rota_reserva") or "").strip().upper()
@@ -711,11 +1223,10 @@ with tab_op:
                     st.error("Informe a rota antes de encerrar o romaneio.")
                     st.stop()
 
-                supabase.table("romaneios").update({
-                    "status": "Encerrado",
-                    "data_encerramento": get_now_utc(),
-                    "rota": rota,
-                }).eq("id", id_atual).execute()
+                ok, msg = encerrar_romaneio_reserva(id_atual, rota)
+                if not ok:
+                    st.error(msg)
+                    st.stop()
 
                 st.session_state["print_romaneio_id_reserva"] = id_atual
                 del st.session_state["romaneio_id"]
@@ -742,18 +1253,13 @@ with tab_op:
         # =========================
         if modo_pavuna == "📥 Recebimento (da Reserva)":
             st.subheader("📥 Recebimento de Romaneios vindos do CD Reserva")
-            conferir_multiplos = st.toggle("Conferir múltiplos romaneios de uma vez", value=True)
+            conferir_multiplos = st.toggle("Conferir múltiplos romaneios de uma vez", key="conferir_multiplos")
 
             # -------- MODO MULTI --------
             if conferir_multiplos:
+                metricas.definir_tela("Pavuna - Recebimento multi")
                 if "romaneios_pavuna_multi" not in st.session_state:
                     st.session_state["romaneios_pavuna_multi"] = []
-                if "map_chave_para_rom" not in st.session_state:
-                    st.session_state["map_chave_para_rom"] = {}
-                if "conferidos_agora_multi" not in st.session_state:
-                    st.session_state["conferidos_agora_multi"] = []
-                if "totais_por_rom" not in st.session_state:
-                    st.session_state["totais_por_rom"] = {}
 
                 if not st.session_state["romaneios_pavuna_multi"]:
                     texto = st.text_area(
@@ -769,13 +1275,36 @@ with tab_op:
                     with colB:
                         st.caption("Dica: cole uma lista; o app extrai só os números.")
 
+                    def iniciar_multi(validos: list[int], manifestos: dict | None = None):
+                        """Carrega os volumes; se houver caixa em mais de um romaneio, guarda os conflitos e não inicia."""
+                        manifestos = manifestos if manifestos is not None else repos.manifestos.varios(validos)
+                        res_envio = [r for i in validos for r in manifestos[i].linhas()]
+
+                        conf, conflitos = ConferenciaCompacta.de_linhas(res_envio, validos)
+                        if len(conflitos):
+                            st.session_state["conflitos_pavuna_multi"] = {"validos": validos, "conflitos": conflitos}
+                            return
+                        st.session_state.pop("conflitos_pavuna_multi", None)
+
+                        if not len(conf):
+                            st.error("Não encontrei volumes em conferencia_reserva para esses romaneios.")
+                            st.stop()
+
+                        # as caixas vão ser recebidas e depois ir para o espelho: aquece o faturamento
+                        prefetcher.aquecer(normalize_chave(r.get("chave_nfe")) for r in res_envio)
+
+                        st.session_state["romaneios_pavuna_multi"] = validos
+                        st.session_state["conf_pavuna_multi"] = conf
+                        st.rerun()
+
                     if abrir:
+                        st.session_state.pop("conflitos_pavuna_multi", None)
                         if not ids:
                             st.error("Informe ao menos 1 número de romaneio válido.")
                             st.stop()
 
-                        roms = supabase.table("romaneios").select("id, status, unidade_origem").in_("id", ids).execute()
-                        encontrados = {r["id"]: r for r in (roms.data or [])}
+                        manifestos = repos.manifestos.varios(ids)
+                        encontrados = {i: m.romaneio for i, m in manifestos.items()}
 
                         faltando = [i for i in ids if i not in encontrados]
                         invalidos = []
@@ -803,106 +1332,101 @@ with tab_op:
                             st.error("Nenhum romaneio válido para conferência.")
                             st.stop()
 
-                        res_envio = (
-                            supabase.table("conferencia_reserva")
-                            .select("chave_nfe, romaneio_id, data_recebimento")
-                            .in_("romaneio_id", validos)
-                            .execute()
-                        )
+                        iniciar_multi(validos, manifestos)
 
-                        map_chave = {}
-                        totais = {}
-                        conferidos_db = set()
-
-                        for row in (res_envio.data or []):
-                            c = normalize_chave(row.get("chave_nfe"))
-                            rid = row.get("romaneio_id")
-                            dr = row.get("data_recebimento")
-                            if c and rid:
-                                if c in map_chave and map_chave[c] != rid:
-                                    st.error(f"Caixa duplicada em romaneios diferentes: {c}")
+                    pendente = st.session_state.get("conflitos_pavuna_multi")
+                    if pendente:
+                        conflitos = pendente["conflitos"]
+                        st.error(
+                            f"❌ {len(conflitos)} caixa(s) aparecem em mais de um romaneio. "
+                            "Tire do recebimento os romaneios em conflito (ou corrija na Reserva) para conferir."
+                        )
+                        st.dataframe(
+                            conflitos.assign(romaneios=conflitos["romaneios"].map(lambda r: ", ".join(map(str, r)))).rename(
+                                columns={"caixa": "Caixa", "romaneios": "Romaneios", "qtd_romaneios": "Qtd Romaneios"}
+                            ),
+                            hide_index=True,
+                            width="stretch",
+                        )
+                        excluir = st.multiselect(
+                            "Romaneios a excluir deste recebimento (sugestão: o mínimo que resolve os conflitos)",
+                            options=pendente["validos"],
+                            default=romaneios_sugeridos(conflitos),
+                            key="excluir_pavuna_multi_" + "_".join(map(str, pendente["validos"])),
+                        )
+                        cexc1, cexc2 = st.columns([1, 1])
+                        with cexc1:
+                            if st.button("✅ Conferir sem os excluídos", key="btn_conferir_sem_conflitos"):
+                                restantes = [i for i in pendente["validos"] if i not in excluir]
+                                if not restantes:
+                                    st.error("Nenhum romaneio sobrou para conferência.")
                                     st.stop()
-                                map_chave[c] = rid
-                                totais[rid] = totais.get(rid, 0) + 1
-                                if dr:
-                                    conferidos_db.add(c)
-
-                        if not map_chave:
-                            st.error("Não encontrei volumes em conferencia_reserva para esses romaneios.")
-                            st.stop()
-
-                        st.session_state["romaneios_pavuna_multi"] = validos
-                        st.session_state["map_chave_para_rom"] = map_chave
-                        st.session_state["totais_por_rom"] = totais
-                        st.session_state["conferidos_agora_multi"] = list(conferidos_db)
-                        st.rerun()
+                                iniciar_multi(restantes)
+                                st.rerun()  # ainda com conflito: mostra a nova lista
+                        with cexc2:
+                            if st.button("Cancelar", key="btn_cancelar_conflitos"):
+                                st.session_state.pop("conflitos_pavuna_multi", None)
+                                st.rerun()
 
                 else:
                     roms_multi = st.session_state["romaneios_pavuna_multi"]
-                    map_chave = st.session_state["map_chave_para_rom"]
-                    totais = st.session_state["totais_por_rom"]
-                    conferidos = set(st.session_state.get("conferidos_agora_multi", []))
+                    conf = st.session_state["conf_pavuna_multi"]
 
                     st.info(f"✅ Conferindo múltiplos romaneios: **{', '.join(map(str, roms_multi))}**")
 
-                    def reg_pavuna_multi():
-                        raw = st.session_state.get("input_pavuna_multi")
-                        caixas = extrair_caixas(raw)
-                        st.session_state["input_pavuna_multi"] = ""
-
-                        if not caixas:
-                            return
-                        if len(caixas) > 1:
-                            st.warning(f"⚠️ Detectei {len(caixas)} caixas no mesmo input. Vou validar separadamente.")
-
-                        for chave in caixas:
-                            rid = map_chave.get(chave)
-                            if not rid:
-                                st.error(f"❌ Volume não pertence aos romaneios carregados: {chave}")
-                                continue
-
-                            if chave in conferidos:
-                                st.warning(f"Já bipado (já consta como recebido): {chave}")
-                                continue
-
-                            try:
-                                supabase.table("conferencia_reserva").update(
-                                    {"data_recebimento": get_now_utc()}
-                                ).eq("chave_nfe", chave).eq("romaneio_id", int(rid)).execute()
-
-                                conferidos.add(chave)
-                                st.session_state["conferidos_agora_multi"] = list(conferidos)
-                                st.toast(f"✅ Validado {chave} no romaneio #{rid}!")
-
-                            except Exception as e:
-                                st.error(f"Erro ao validar {chave}: {e}")
-
-                    st.text_input("Bipe a entrada (multi-romaneio):", key="input_pavuna_multi", on_change=reg_pavuna_multi)
+                    @st.fragment
+                    @metricas.fragmento("Pavuna - Recebimento multi")
+                    def painel_bipagem_multi():
+                        # a bipagem reexecuta só leitura + progresso; conf é alterado in place
+                        mostrar_avisos("pavuna_multi")
+                        @metricas.etapa("reg_pavuna_multi")
+                        def reg_pavuna_multi():
+                            t0 = perf_counter()
+                            raw = st.session_state.get("input_pavuna_multi")
+                            caixas = extrair_caixas(raw)
+                            st.session_state["input_pavuna_multi"] = ""
+
+                            if not caixas:
+                                return
+                            if len(caixas) > 1:
+                                avisar("pavuna_multi", "warning", f"⚠️ Detectei {len(caixas)} caixas no mesmo input. Vou validar separadamente.")
+
+                            avisar_vereditos("pavuna_multi", bipar_recebimento(conf, "pavuna_multi", caixas, t0))
+
+                        if st.session_state.get("entrada_simples"):
+                            st.text_input("Bipe a entrada (multi-romaneio):", key="input_pavuna_multi", on_change=reg_pavuna_multi)
+                        else:
+                            leitor.leitor_caixas(
+                                "leitor_pavuna_multi",
+                                partial(bipar_recebimento, conf, "pavuna_multi"),
+                                etapa="leitor_pavuna_multi",
+                                placeholder="Bipe a entrada (multi-romaneio)",
+                            )
 
-                    total_esperado = sum(totais.get(r, 0) for r in roms_multi)
-                    st.metric("Qtd volumes (TOTAL esperada)", total_esperado)
-                    st.metric("Progresso Total", f"{len(conferidos)} / {total_esperado}")
+                        totais = conf.totais_por_romaneio()
+                        cont_por_rom = conf.recebidos_por_romaneio()
+                        total_esperado = len(conf)
+                        st.metric("Qtd volumes (TOTAL esperada)", total_esperado)
+                        st.metric("Progresso Total", f"{conf.n_recebidos} / {total_esperado}")
 
-                    cont_por_rom = {r: 0 for r in roms_multi}
-                    for c in conferidos:
-                        rid = map_chave.get(c)
-                        if rid in cont_por_rom:
-                            cont_por_rom[rid] += 1
+                        df_prog = pd.DataFrame(
+                            [{
+                                "Romaneio": r,
+                                "Qtd esperada": totais.get(r, 0),
+                                "Qtd conferida": cont_por_rom.get(r, 0),
+                                "Faltam": max(totais.get(r) - cont_por_rom.get(r, 0), 0)
+                            } for r in roms_multi]
+                        ).sort_values(["Faltam", "Romaneio"], ascending=[False, True])
 
-                    df_prog = pd.DataFrame(
-                        [{
-                            "Romaneio": r,
-                            "Qtd esperada": totais.get(r, 0),
-                            "Qtd conferida": cont_por_rom.get(r, 0),
-                            "Faltam": max(totais.get(r) - cont_por_rom.get(r, 0), 0)
-                        } for r in roms_multi]
-                    ).sort_values(["Faltam", "Romaneio"], ascending=[False, True])
+                        st.dataframe(df_prog, width="stretch")
 
-                    st.dataframe(df_prog, width="stretch")
+                    painel_bipagem_multi()
 
                     c1, c2 = st.columns(2)
                     with c1:
                         if st.button("🏁 FINALIZAR CONFERÊNCIA (MULTI)", key="btn_finalizar_multi"):
+                            totais = conf.totais_por_romaneio()
+                            cont_por_rom = conf.recebidos_por_romaneio()
                             faltantes = []
                             for r in roms_multi:
                                 if cont_por_rom.get(r, 0) != totais.get(r, 0):
@@ -917,12 +1441,11 @@ with tab_op:
                         if st.button("🧹 LIMPAR / TROCAR ROMANEIOS", key="btn_clear_multi"):
                             for k in [
                                 "romaneios_pavuna_multi",
-                                "map_chave_para_rom",
-                                "conferidos_agora_multi",
-                                "totais_por_rom",
+                                "conf_pavuna_multi",
                                 "concluido_pavuna_multi",
                                 "rom_multi_input",
                                 "input_pavuna_multi",
+                                "leitor_pavuna_multi__vereditos",
                             ]:
                                 if k in st.session_state:
                                     del st.session_state[k]
@@ -933,6 +1456,7 @@ with tab_op:
 
             # -------- MODO SINGLE --------
             else:
+                metricas.definir_tela("Pavuna - Recebimento single")
                 st.caption("Modo simples: abrir 1 romaneio por vez, com quantidade esperada.")
 
                 if "romaneio_pavuna_single" not in st.session_state:
@@ -942,20 +1466,12 @@ with tab_op:
                             st.error("Digite um número de romaneio válido.")
                             st.stop()
 
-                        check = (
-                            supabase.table("romaneios")
-                            .select("*")
-                            .eq("id", int(id_input))
-                            .limit(1)
-                            .execute()
-                        )
+                        rom = repos.romaneios.buscar(int(id_input))
 
-                        if not check.data:
+                        if not rom:
                             st.error("❌ Romaneio não encontrado.")
                             st.stop()
 
-                        rom = check.data[0]
-
                         if rom.get("unidade_origem") != "CD Reserva":
                             st.error("❌ O romaneio informado não pertence ao CD Reserva.")
                             st.stop()
@@ -965,70 +1481,61 @@ with tab_op:
                             st.stop()
 
                         st.session_state["romaneio_pavuna_single"] = int(id_input)
-                        st.session_state["conferidos_single"] = []
+                        st.session_state.pop("conf_pavuna_single", None)
                         st.rerun()
                 else:
                     rom_id = int(st.session_state["romaneio_pavuna_single"])
                     st.info(f"✅ Conferindo Romaneio (Reserva): **#{rom_id}**")
 
-                    res_count = supabase.table("conferencia_reserva") \
-                        .select("id", count="exact") \
-                        .eq("romaneio_id", rom_id) \
-                        .execute()
-                    total_esperado = res_count.count if res_count.count else 0
-
-                    res_envio = supabase.table("conferencia_reserva") \
-                        .select("chave_nfe, data_recebimento") \
-                        .eq("romaneio_id", rom_id) \
-                        .execute()
-
-                    lista_esperada = [normalize_chave(x.get("chave_nfe")) for x in (res_envio.data or [])]
-                    recebidos_db = set([normalize_chave(x.get("chave_nfe")) for x in (res_envio.data or []) if x.get("data_recebimento")])
-
-                    conferidos = set(st.session_state.get("conferidos_single", []))
-                    conferidos |= recebidos_db
-                    st.session_state["conferidos_single"] = list(conferidos)
-
-                    st.metric("Qtd volumes (esperada)", total_esperado)
-                    st.metric("Qtd conferida", len(conferidos))
-                    st.metric("Faltam", max(total_esperado - len(conferidos), 0))
-
-                    def reg_pavuna_single():
-                        raw = st.session_state.get("input_pavuna_single")
-                        caixas = extrair_caixas(raw)
-                        st.session_state["input_pavuna_single"] = ""
-
-                        if not caixas:
-                            return
-                        if len(caixas) > 1:
-                            st.warning(f"⚠️ Detectei {len(caixas)} caixas no mesmo input. Vou validar separadamente.")
-
-                        for chave in caixas:
-                            if chave not in lista_esperada:
-                                st.error(f"❌ Volume não pertence a este romaneio: {chave}")
-                                continue
-                            if chave in conferidos:
-                                st.warning(f"Já bipado: {chave}")
-                                continue
-
-                            try:
-                                supabase.table("conferencia_reserva") \
-                                    .update({"data_recebimento": get_now_utc()}) \
-                                    .eq("chave_nfe", chave) \
-                                    .eq("romaneio_id", rom_id) \
-                                    .execute()
-
-                                conferidos.add(chave)
-                                st.session_state["conferidos_single"] = list(conferidos)
-                                st.toast(f"✅ Validado: {chave}")
-
-                            except Exception as e:
-                                st.error(f"Erro ao validar {chave}: {e}")
+                    @st.fragment
+                    @metricas.fragmento("Pavuna - Recebimento single")
+                    def painel_bipagem_single():
+                        # manifesto (delta de recebidos de outros operadores) + leitura + progresso
+                        mostrar_avisos("pavuna_single")
+                        man = repos.manifestos.obter(rom_id)
+                        res_envio = man.linhas() if man else []
+                        total_esperado = len(res_envio)
+
+                        conf = st.session_state.get("conf_pavuna_single")
+                        # monta uma vez; só refaz se o manifesto mudar de tamanho (n_linhas conta as repetidas)
+                        if conf is None or getattr(conf, "n_linhas", None) != len(res_envio):
+                            conf, _ = ConferenciaCompacta.de_linhas(res_envio, [rom_id])
+                            st.session_state["conf_pavuna_single"] = conf
+                            prefetcher.aquecer(x.get("chave_nfe") for x in res_envio)
+                        conf.mesclar_recebidas(x.get("chave_nfe") for x in res_envio if x.get("data_recebimento"))
+
+                        st.metric("Qtd volumes (esperada)", total_esperado)
+                        st.metric("Qtd conferida", conf.n_recebidos)
+                        st.metric("Faltam", max(total_esperado - conf.n_recebidos, 0))
+
+                        @metricas.etapa("reg_pavuna_single")
+                        def reg_pavuna_single():
+                            t0 = perf_counter()
+                            raw = st.session_state.get("input_pavuna_single")
+                            caixas = extrair_caixas(raw)
+                            st.session_state["input_pavuna_single"] = ""
+
+                            if not caixas:
+                                return
+                            if len(caixas) > 1:
+                                avisar("pavuna_single", "warning", f"⚠️ Detectei {len(caixas)} caixas no mesmo input. Vou validar separadamente.")
+
+                            avisar_vereditos("pavuna_single", bipar_recebimento(conf, "pavuna_single", caixas, t0, romaneio_id=rom_id))
+
+                        if st.session_state.get("entrada_simples"):
+                            st.text_input("Bipe a entrada:", key="input_pavuna_single", on_change=reg_pavuna_single)
+                        else:
+                            leitor.leitor_caixas(
+                                "leitor_pavuna_single",
+                                partial(bipar_recebimento, conf, "pavuna_single", romaneio_id=rom_id),
+                                etapa="leitor_pavuna_single",
+                                placeholder="Bipe a entrada",
+                            )
 
-                    st.text_input("Bipe a entrada:", key="input_pavuna_single", on_change=reg_pavuna_single)
+                    painel_bipagem_single()
 
                     if st.button("🏁 FINALIZAR CONFERÊNCIA", key="btn_finalizar_single"):
-                        faltas = [c for c in lista_esperada if c not in conferidos]
+                        faltas = st.session_state["conf_pavuna_single"].faltantes()
                         if not faltas:
                             st.success("✅ Tudo conferido com sucesso!")
                         else:
@@ -1036,7 +1543,7 @@ with tab_op:
                             st.table(pd.DataFrame(faltas, columns=["Chaves Faltantes"]))
 
                     if st.button("📦 PRÓXIMO ROMANEIO", type="primary", key="btn_next_single"):
-                        for k in ["romaneio_pavuna_single", "conferidos_single", "rom_single_input", "input_pavuna_single"]:
+                        for k in ["romaneio_pavuna_single", "conf_pavuna_single", "rom_single_input", "input_pavuna_single", "leitor_pavuna_single__vereditos"]:
                             if k in st.session_state:
                                 del st.session_state[k]
                         st.rerun()
@@ -1045,14 +1552,11 @@ with tab_op:
         # EXPEDIÇÃO CD PAVUNA (ROMANEIO ESPELHO)
         # =========================
         else:
+            metricas.definir_tela("Pavuna - Espelho")
             st.subheader("🚛 Expedição CD Pavuna - Romaneio Espelho (somente recebido)")
 
             if "espelho_df_full" not in st.session_state:
-                st.session_state["espelho_df_full"] = pd.DataFrame(
-                    columns=["selecionar", "caixa", "filial_origem", "destino", "qtde_pecas", "ja_expedida", "romaneio_espelho_existente"]
-                )
-            if "espelho_df" not in st.session_state:
-                st.session_state["espelho_df"] = pd.DataFrame(columns=["caixa", "filial_origem", "destino", "qtde_pecas"])
+                st.session_state["espelho_df_full"] = pd.DataFrame(columns=COLS_ESPELHO_FULL)
             if "roms_origem_espelho" not in st.session_state:
                 st.session_state["roms_origem_espelho"] = []
             if "rota_espelho" not in st.session_state:
@@ -1077,77 +1581,23 @@ with tab_op:
                     st.error("Informe ao menos 1 romaneio válido.")
                     st.stop()
 
-                roms = supabase.table("romaneios").select("id, status, unidade_origem").in_("id", ids).execute()
-                encontrados = {r["id"]: r for r in (roms.data or [])}
-
-                invalidos = []
-                validos = []
-                for i in ids:
-                    r = encontrados.get(i)
-                    if not r:
-                        invalidos.append(i)
-                    else:
-                        if r.get("status") != "Encerrado" or r.get("unidade_origem") != "CD Reserva":
-                            invalidos.append(i)
-                        else:
-                            validos.append(i)
+                carga = carregar_espelho(ids)
+                validos = carga["validos"]
+                invalidos = carga["invalidos"]
+                caixas = carga["caixas"]
+                df_itens = carga["df_itens"]
 
                 if invalidos:
                     st.error(f"❌ Romaneios inválidos (não encontrados / não encerrados / não são da Reserva): {invalidos}")
                 if not validos:
                     st.stop()
 
-                res = (
-                    supabase.table("conferencia_reserva")
-                    .select("chave_nfe, romaneio_id, data_recebimento")
-                    .in_("romaneio_id", validos)
-                    .execute()
-                )
-
-                caixas = []
-                for row in (res.data or []):
-                    if row.get("data_recebimento"):
-                        caixas.append(normalize_chave(row.get("chave_nfe")))
-
-                caixas = [c for c in caixas if c]
-                caixas = list(dict.fromkeys(caixas))
-
                 if not caixas:
                     st.warning("Nenhuma caixa RECEBIDA encontrada nesses romaneios.")
                     st.stop()
 
-                df_batch = buscar_faturamento_batch(caixas)
-
-                df_base = pd.DataFrame({"caixa": caixas})
-                df_itens = df_base.merge(df_batch, on="caixa", how="left")
-                df_itens["filial_origem"] = df_itens["filial_origem"].fillna("")
-                df_itens["destino"] = df_itens["destino"].fillna("")
-                df_itens["qtde_pecas"] = pd.to_numeric(df_itens["qtde_pecas"], errors="coerce").fillna(0).astype(int)
-
-                # Bloqueio de caixas já expedidas em romaneio espelho anterior
-                df_expedidas = buscar_caixas_ja_expedidas(caixas)
-
-                if not df_expedidas.empty:
-                    df_itens = df_itens.merge(
-                        df_expedidas.rename(columns={"romaneio_espelho_id": "romaneio_espelho_existente"}),
-                        on="caixa",
-                        how="left"
-                    )
-                else:
-                    df_itens["romaneio_espelho_existente"] = pd.NA
-
-                df_itens["ja_expedida"] = df_itens["romaneio_espelho_existente"].notna()
-                df_itens["selecionar"] = ~df_itens["ja_expedida"]
-
-                st.session_state["espelho_df_full"] = df_itens[
-                    ["selecionar", "caixa", "filial_origem", "destino", "qtde_pecas", "ja_expedida", "romaneio_espelho_existente"]
-                ].copy()
-
+                st.session_state["espelho_df_full"] = compactar_espelho(df_itens)
                 st.session_state["roms_origem_espelho"] = validos
-                st.session_state["espelho_df"] = df_itens.loc[
-                    ~df_itens["ja_expedida"],
-                    ["caixa", "filial_origem", "destino", "qtde_pecas"]
-                ].copy()
 
                 qtd_bloqueadas = int(df_itens["ja_expedida"].sum())
                 if qtd_bloqueadas > 0:
@@ -1176,14 +1626,14 @@ with tab_op:
                 st.write("### Seleção de caixas para expedição")
                 st.caption("Caixas já expedidas anteriormente ficam bloqueadas e não podem ser selecionadas.")
 
-                df_view = df_full.copy()
-                df_view["status"] = df_view.apply(
-                    lambda r: f"Já expedida no espelho #{int(r['romaneio_espelho_existente'])}" if r["ja_expedida"] else "Disponível",
-                    axis=1
+                status = np.where(
+                    df_full["ja_expedida"],
+                    "Já expedida no espelho #" + df_full["romaneio_espelho_existente"].astype("string").fillna(""),
+                    "Disponível",
                 )
 
                 edited_df = st.data_editor(
-                    df_view[["selecionar", "caixa", "filial_origem", "destino", "qtde_pecas", "status"]],
+                    df_full[["selecionar", "caixa", "filial_origem", "destino", "qtde_pecas"]].assign(status=status),
                     hide_index=True,
                     width="stretch",
                     disabled=["caixa", "filial_origem", "destino", "qtde_pecas", "status"],
@@ -1198,18 +1648,9 @@ with tab_op:
                     key="editor_espelho"
                 )
 
-                df_full["selecionar"] = edited_df["selecionar"].astype(bool)
-                df_full.loc[df_full["ja_expedida"], "selecionar"] = False
-                st.session_state["espelho_df_full"] = df_full
-
-                df_selecionado = df_full.loc[
-                    (df_full["selecionar"]) & (~df_full["ja_expedida"]),
-                    ["caixa", "filial_origem", "destino", "qtde_pecas"]
-                ].copy()
-
-                st.session_state["espelho_df"] = df_selecionado
+                df_full["selecionar"] = edited_df["selecionar"].astype(bool).to_numpy() & ~df_full["ja_expedida"].to_numpy()
 
-            df_itens = st.session_state.get("espelho_df", pd.DataFrame())
+            df_itens = espelho_selecionado(df_full)
             qtd_caixas = len(df_itens) if isinstance(df_itens, pd.DataFrame) else 0
             total_pecas = int(df_itens["qtde_pecas"].sum()) if isinstance(df_itens, pd.DataFrame) and "qtde_pecas" in df_itens.columns else 0
 
@@ -1237,7 +1678,7 @@ with tab_op:
                 btn_limpar = st.button("🧹 Limpar", key="btn_limpar_espelho")
 
             if btn_limpar:
-                for k in ["espelho_df", "espelho_df_full", "roms_origem_espelho", "print_rom_espelho_id", "rota_espelho"]:
+                for k in ["espelho_df_full", "roms_origem_espelho", "print_rom_espelho_id", "rota_espelho"]:
                     if k in st.session_state:
                         del st.session_state[k]
                 st.rerun()
@@ -1254,7 +1695,7 @@ with tab_op:
 
                 # Revalidação no banco para evitar duplicidade entre usuários
                 caixas_final = df_itens["caixa"].fillna("").astype(str).str.upper().str.strip().tolist()
-                df_expedidas_now = buscar_caixas_ja_expedidas(caixas_final)
+                df_expedidas_now = buscar_caixas_ja_expedidas(caixas_final, revalidar=True)
 
                 if not df_expedidas_now.empty:
                     caixas_bloqueadas = df_expedidas_now["caixa"].tolist()
@@ -1263,16 +1704,12 @@ with tab_op:
 
                 usuario = st.session_state["user_email"]
 
-                res_rom = supabase.table("romaneios_espelho").insert({
-                    "usuario_criou": usuario,
-                    "unidade_origem": "CD Pavuna",
-                    "status": "Encerrado",
-                    "romaneios_origem": st.session_state.get("roms_origem_espelho", []),
-                    "qtd_caixas": int(len(df_itens)),
-                    "rota": rota,
-                }).execute()
-
-                rom_id = res_rom.data[0]["id"]
+                rom_id = repos.espelhos.criar(
+                    usuario=usuario,
+                    romaneios_origem=st.session_state.get("roms_origem_espelho", []),
+                    qtd_caixas=len(df_itens),
+                    rota=rota,
+                )
 
                 itens_payload = []
                 for _, r in df_itens.iterrows():
@@ -1284,7 +1721,8 @@ with tab_op:
                         "qtde_pecas": int(r.get("qtde_pecas", 0) or 0),
                     })
 
-                supabase.table("romaneio_espelho_itens").insert(itens_payload).execute()
+                repos.espelho_itens.inserir(itens_payload)
+                cache_expedidas.gravar({it["caixa"]: {"romaneio_espelho_id": int(rom_id)} for it in itens_payload})
 
                 st.session_state["print_rom_espelho_id"] = rom_id
                 st.success(f"✅ Romaneio espelho #{rom_id} finalizado na rota {rota}.")
@@ -1297,10 +1735,10 @@ with tab_op:
                         usuario=st.session_state["user_email"],
                         origem="CD Pavuna",
                         rota=st.session_state.get("rota_espelho", ""),
-                        df_itens=st.session_state["espelho_df"],
+                        df_itens=espelho_selecionado(st.session_state.get("espelho_df_full")),
                     )
                 if st.button("✅ OK / NOVO", key="btn_ok_novo_espelho"):
-                    for k in ["espelho_df", "espelho_df_full", "roms_origem_espelho", "print_rom_espelho_id", "roms_espelho_input", "rota_espelho"]:
+                    for k in ["espelho_df_full", "roms_origem_espelho", "print_rom_espelho_id", "roms_espelho_input", "rota_espelho"]:
                         if k in st.session_state:
                             del st.session_state[k]
                     st.rerun()
@@ -1309,42 +1747,42 @@ with tab_op:
 # =========================================================
 # BASE DE DADOS
 # =========================================================
-with tab_base:
+elif secao == SECAO_BASE:
     st.title("📊 Consulta e Reimpressão")
 
     tipo_consulta = st.radio(
         "Tipo de consulta",
-        ["Romaneio Reserva", "Romaneio Pavuna (Espelho)"],
-        horizontal=True
+        ["Romaneio Reserva", "Romaneio Pavuna (Espelho)", "Rastrear Caixa", "Conciliação"],
+        horizontal=True,
+        key="tipo_consulta",
     )
 
-    with st.container(border=True):
-        c1, c2, c3 = st.columns(3)
-        f_rom = c1.text_input("Pesquisar Nº Romaneio", key="filter_rom")
-        dt_ini = c2.date_input("Início", value=None, key="dt_ini_base")
-        dt_fim = c3.date_input("Fim", value=None, key="dt_fim_base")
-        btn_search = st.button("🔍 Pesquisar")
+    if tipo_consulta not in ("Rastrear Caixa", "Conciliação"):
+        with st.container(border=True):
+            c1, c2, c3 = st.columns(3)
+            f_rom = c1.text_input("Pesquisar Nº Romaneio", key="filter_rom")
+            dt_ini = c2.date_input("Início", key="dt_ini_base")
+            dt_fim = c3.date_input("Fim", key="dt_fim_base")
+            btn_search = st.button("🔍 Pesquisar")
 
     # =====================================================
     # CONSULTA ROMANEIO RESERVA
     # =====================================================
     if tipo_consulta == "Romaneio Reserva":
-        if btn_search or f_rom:
-            q = supabase.table("conferencia_reserva").select("*, romaneios(*)")
+        metricas.definir_tela("Base - Romaneio Reserva")
+        filtros = (f_rom, dt_ini, dt_fim)
+        if btn_search or f_rom or consulta_guardada("base_reserva", filtros):
+            dt_ini_full = datetime.combine(dt_ini, time.min).strftime("%Y-%m-%dT%H:%M:%S") if dt_ini else None
+            dt_fim_full = datetime.combine(dt_fim + timedelta(days=1), time.min).strftime("%Y-%m-%dT%H:%M:%S") if dt_fim else None
 
-            if f_rom and f_rom.isdigit():
-                q = q.eq("romaneio_id", int(f_rom))
-            if dt_ini:
-                dt_ini_full = datetime.combine(dt_ini, time.min).strftime("%Y-%m-%dT%H:%M:%S")
-                q = q.gte("data_expedicao", dt_ini_full)
-            if dt_fim:
-                dt_fim_full = datetime.combine(dt_fim + timedelta(days=1), time.min).strftime("%Y-%m-%dT%H:%M:%S")
-                q = q.lt("data_expedicao", dt_fim_full)
-
-            res = q.order("data_expedicao", desc=True).execute()
+            res = consulta_da_secao("base_reserva", filtros, lambda: repos.conferencia.pesquisar(
+                romaneio_id=int(f_rom) if f_rom and f_rom.isdigit() else None,
+                dt_ini=dt_ini_full,
+                dt_fim=dt_fim_full,
+            ), forcar=btn_search)
 
-            if res.data:
-                df = pd.json_normalize(res.data)
+            if res:
+                df = pd.json_normalize(res)
 
                 cols_data = [
                     "created_at",
@@ -1397,23 +1835,20 @@ with tab_base:
 
                     st.divider()
 
-                    rom_info = (
-                        supabase.table("romaneios")
-                        .select("id, status, unidade_origem, rota, usuario_criou, data_encerramento")
-                        .eq("id", rid)
-                        .limit(1)
-                        .execute()
-                    )
+                    rom = consulta_da_secao("base_reserva_rom", rid, lambda: repos.romaneios.buscar(
+                        rid, "id, status, unidade_origem, rota, usuario_criou, data_encerramento, qtd_volumes"
+                    ), forcar=btn_search)
 
-                    if rom_info.data:
-                        rom = rom_info.data[0]
+                    if rom:
 
                         st.write("### Ações do Romaneio Reserva")
 
-                        cinfo1, cinfo2, cinfo3 = st.columns(3)
+                        cinfo1, cinfo2, cinfo3, cinfo4 = st.columns(4)
                         cinfo1.metric("Romaneio", rom.get("id", ""))
                         cinfo2.metric("Status", rom.get("status", ""))
                         cinfo3.metric("Unidade Origem", rom.get("unidade_origem", ""))
+                        # gravado no encerramento; romaneios antigos/abertos não têm
+                        cinfo4.metric("Volumes", rom.get("qtd_volumes") if rom.get("qtd_volumes") is not None else "-")
 
                         rota_pesquisa = st.text_input(
                             "Rota para encerramento / correção",
@@ -1426,28 +1861,25 @@ with tab_base:
 
                         with cbtn1:
                             if st.button("🏁 Encerrar Romaneio Reserva", key=f"btn_encerrar_reserva_pesquisa_{rid}"):
-                                ok, msg = encerrar_romaneio_reserva_pela_pesquisa(rid, rota_pesquisa)
+                                ok, msg = encerrar_romaneio_reserva(rid, rota_pesquisa)
                                 if ok:
                                     st.success(msg)
+                                    # status/rota mudaram: a próxima execução consulta de novo
+                                    st.session_state.pop("base_reserva", None)
+                                    st.session_state.pop("base_reserva_rom", None)
                                     st.rerun()
                                 else:
                                     st.error(msg)
 
                         with cbtn2:
                             if st.button("📥 Reimprimir Romaneio Reserva", key=f"btn_reprint_reserva_{rid}"):
-                                rr = (
-                                    supabase.table("conferencia_reserva")
-                                    .select("chave_nfe, destino, romaneios(usuario_criou, unidade_origem, rota)")
-                                    .eq("romaneio_id", rid)
-                                    .order("id", desc=False)
-                                    .execute()
-                                )
-
-                                if rr.data:
-                                    df_print = montar_df_reserva_com_destino(rr.data)
-                                    usuario = rr.data[0]["romaneios"].get("usuario_criou", "")
-                                    origem = rr.data[0]["romaneios"].get("unidade_origem", "")
-                                    rota = rr.data[0]["romaneios"].get("rota", "")
+                                man = repos.manifestos.obter(rid)
+
+                                if man and len(man):
+                                    df_print = montar_df_reserva_com_destino(man.linhas())
+                                    usuario = man.romaneio.get("usuario_criou", "")
+                                    origem = man.romaneio.get("unidade_origem", "")
+                                    rota = man.romaneio.get("rota", "")
                                     imprimir_romaneio_html(rid, df_print, usuario, origem, rota)
                                 else:
                                     st.warning("Nenhum volume encontrado para este romaneio.")
@@ -1459,25 +1891,26 @@ with tab_base:
     # =====================================================
     # CONSULTA ROMANEIO PAVUNA / ESPELHO
     # =====================================================
-    else:
-        if btn_search or f_rom:
-            q = supabase.table("romaneios_espelho").select("*")
-
-            if f_rom and f_rom.isdigit():
-                q = q.eq("id", int(f_rom))
+    elif tipo_consulta == "Romaneio Pavuna (Espelho)":
+        metricas.definir_tela("Base - Romaneio Espelho")
+        filtros = (f_rom, dt_ini, dt_fim)
+        if btn_search or f_rom or consulta_guardada("base_espelho", filtros):
+            dt_ini_full = dt_fim_full = None
             if dt_ini:
                 dt_ini_utc = datetime.combine(dt_ini, time.min).replace(tzinfo=FUSO_SP).astimezone(timezone.utc)
                 dt_ini_full = dt_ini_utc.strftime("%Y-%m-%dT%H:%M:%S+00:00")
-                q = q.gte("criado_em", dt_ini_full)
             if dt_fim:
                 dt_fim_utc = datetime.combine(dt_fim + timedelta(days=1), time.min).replace(tzinfo=FUSO_SP).astimezone(timezone.utc)
                 dt_fim_full = dt_fim_utc.strftime("%Y-%m-%dT%H:%M:%S+00:00")
-                q = q.lt("criado_em", dt_fim_full)
 
-            res = q.order("id", desc=True).execute()
+            res = consulta_da_secao("base_espelho", filtros, lambda: repos.espelhos.pesquisar(
+                espelho_id=int(f_rom) if f_rom and f_rom.isdigit() else None,
+                dt_ini=dt_ini_full,
+                dt_fim=dt_fim_full,
+            ), forcar=btn_search)
 
-            if res.data:
-                df = pd.DataFrame(res.data)
+            if res:
+                df = pd.DataFrame(res)
 
                 for col in ["created_at", "criado_em"]:
                     if col in df.columns:
@@ -1503,27 +1936,13 @@ with tab_base:
                     if st.button("🖨️ Reimprimir Romaneio Pavuna"):
                         rid = int(f_rom)
 
-                        rom = (
-                            supabase.table("romaneios_espelho")
-                            .select("*")
-                            .eq("id", rid)
-                            .limit(1)
-                            .execute()
-                        )
-
-                        itens = (
-                            supabase.table("romaneio_espelho_itens")
-                            .select("caixa, destino, qtde_pecas")
-                            .eq("romaneio_espelho_id", rid)
-                            .order("destino", desc=False)
-                            .execute()
-                        )
+                        rom = repos.espelhos.buscar(rid)
+                        df_print = repos.espelho_itens.listar_df(rid)
 
-                        if rom.data and itens.data:
-                            df_print = pd.DataFrame(itens.data)
-                            usuario = rom.data[0].get("usuario_criou", "")
-                            origem = rom.data[0].get("unidade_origem", "CD Pavuna")
-                            rota = rom.data[0].get("rota", "")
+                        if rom and len(df_print):
+                            usuario = rom.get("usuario_criou", "")
+                            origem = rom.get("unidade_origem", "CD Pavuna")
+                            rota = rom.get("rota", "")
                             imprimir_romaneio_espelho_html(
                                 id_romaneio=rid,
                                 usuario=usuario,
@@ -1534,4 +1953,222 @@ with tab_base:
                         else:
                             st.warning("Nenhum item encontrado para este romaneio espelho.")
             else:
-                st.warning("Nenhum registro encontrado.")
\ No newline at end of file
+                st.warning("Nenhum registro encontrado.")
+
+    # =====================================================
+    # CONCILIAÇÃO (expedido x recebido x espelho x faturamento)
+    # =====================================================
+    elif tipo_consulta == "Conciliação":
+        metricas.definir_tela("Base - Conciliação")
+        with st.container(border=True):
+            c1, c2 = st.columns(2)
+            conc_ini = c1.date_input("Início", key="conc_ini")
+            conc_fim = c2.date_input("Fim", key="conc_fim")
+            recalcular = st.checkbox("Recalcular também os dias já em cache", key="conc_recalcular")
+            btn_conciliar = st.button("⚖️ Conciliar", key="btn_conciliar")
+
+        filtros = (conc_ini, conc_fim)
+        if btn_conciliar or consulta_guardada("base_conciliacao", filtros):
+            if not conc_ini or not conc_fim or conc_ini > conc_fim:
+                st.error("Informe um período válido (início até fim).")
+                st.stop()
+
+            def _conciliar():
+                barra = st.progress(0.0, text="Conciliando...")
+                res = get_conciliacao().periodo(
+                    conc_ini,
+                    conc_fim,
+                    usar_cache=not recalcular,
+                    progresso=lambda i, n, dia: barra.progress(i / n, text=f"{dia:%d/%m/%Y} ({i}/{n})"),
+                )
+                barra.empty()
+                return res
+
+            df_div, df_resumo_conc = consulta_da_secao("base_conciliacao", filtros, _conciliar, forcar=btn_conciliar)
+
+            por_tipo = df_div["tipo"].value_counts()
+            cols = st.columns(len(conciliacao.TIPOS))
+            for col, tipo in zip(cols, conciliacao.TIPOS):
+                col.metric(ROTULOS_CONCILIACAO[tipo], int(por_tipo.get(tipo, 0)))
+
+            with st.expander("Resumo por dia"):
+                st.dataframe(df_resumo_conc, hide_index=True, width="stretch")
+
+            if df_div.empty:
+                st.success("✅ Nenhuma divergência no período.")
+            else:
+                tipos = st.multiselect(
+                    "Tipos",
+                    conciliacao.TIPOS,
+                    format_func=ROTULOS_CONCILIACAO.get,
+                    key="conc_tipos",
+                )
+                df_ver = df_div[df_div["tipo"].isin(tipos)] if tipos else df_div
+                st.dataframe(
+                    df_ver.assign(tipo=df_ver["tipo"].map(ROTULOS_CONCILIACAO)).rename(columns={
+                        "dia": "Dia",
+                        "tipo": "Divergência",
+                        "caixa": "CAIXA",
+                        "romaneio_id": "Romaneio Reserva",
+                        "romaneio_espelho_id": "Romaneio Espelho",
+                        "esperado": "Esperado",
+                        "encontrado": "Encontrado",
+                    }),
+                    width="stretch",
+                    hide_index=True,
+                )
+                st.download_button(
+                    "⬇️ Baixar divergências (CSV)",
+                    data=df_ver.to_csv(index=False).encode("utf-8"),
+                    file_name=f"conciliacao_{conc_ini:%Y%m%d}_{conc_fim:%Y%m%d}.csv",
+                    mime="text/csv",
+                    key="btn_csv_conciliacao",
+                )
+
+    # =====================================================
+    # RASTREAR CAIXA (ciclo de vida completo)
+    # =====================================================
+    else:
+        metricas.definir_tela("Base - Rastrear Caixa")
+        with st.container(border=True):
+            texto_caixas = st.text_area(
+                "Cole as caixas a rastrear (uma ou várias, em qualquer formato):",
+                key="rastreio_caixas_input",
+                height=150,
+                placeholder="Ex:\nF2830233\nF2830222, F2830244",
+            )
+            btn_rastrear = st.button("🔎 Rastrear", key="btn_rastrear_caixas")
+
+        if btn_rastrear:
+            df_codigos = codigos.classificar(codigos.tokenizar_texto(texto_caixas))
+            # fora do padrão (não NF-e) também é pesquisado, como o extrair_caixas fazia; só NF-e inválida fica de fora
+            fora_padrao = codigos.codigos_fora_padrao(df_codigos)
+            caixas_rastreio = list(dict.fromkeys(codigos.codigos_validos(df_codigos) + fora_padrao))
+            df_rejeitos = codigos.resumo_rejeitos(df_codigos[~df_codigos["motivo"].isin(codigos.MOTIVOS_FORA_PADRAO)])
+            st.session_state.pop("base_rastreio", None)
+            if not caixas_rastreio:
+                if not df_rejeitos.empty:
+                    with st.expander(f"⚠️ {int(df_rejeitos['qtd'].sum())} código(s) ignorado(s)"):
+                        st.dataframe(df_rejeitos, hide_index=True, width="stretch")
+                st.error("Informe ao menos 1 caixa válida.")
+                st.stop()
+
+            with st.spinner(f"Rastreando {len(caixas_rastreio)} caixa(s)..."):
+                df_resumo, df_timeline = rastrear_caixas(caixas_rastreio)
+            st.session_state["base_rastreio"] = {"resumo": df_resumo, "timeline": df_timeline, "rejeitos": df_rejeitos}
+
+        if "base_rastreio" in st.session_state:
+            df_resumo = st.session_state["base_rastreio"]["resumo"]
+            df_timeline = st.session_state["base_rastreio"]["timeline"]
+            df_rejeitos = st.session_state["base_rastreio"]["rejeitos"]
+            if not df_rejeitos.empty:
+                with st.expander(f"⚠️ {int(df_rejeitos['qtd'].sum())} código(s) ignorado(s)"):
+                    st.dataframe(df_rejeitos, hide_index=True, width="stretch")
+
+            nao_encontradas = int((df_resumo["situacao"] == "Não encontrada").sum())
+            r1, r2, r3 = st.columns(3)
+            r1.metric("Caixas pesquisadas", len(df_resumo))
+            r2.metric("Encontradas", len(df_resumo) - nao_encontradas)
+            r3.metric("Não encontradas", nao_encontradas)
+
+            st.write("### Situação por caixa")
+            st.dataframe(
+                df_resumo.rename(columns={
+                    "caixa": "CAIXA",
+                    "situacao": "Situação",
+                    "romaneio": "Romaneio Reserva",
+                    "rota": "Rota Reserva",
+                    "destino": "Destino",
+                    "filial_origem": "Filial Origem",
+                    "qtde_pecas": "Qtde Peças",
+                    "expedicao": "Data Expedição",
+                    "recebimento": "Data Recebimento",
+                    "romaneio_espelho": "Romaneio Espelho",
+                    "rota_espelho": "Rota Espelho",
+                }),
+                width="stretch",
+                hide_index=True,
+            )
+
+            st.write("### Linha do tempo")
+            if df_timeline.empty:
+                st.info("Nenhum evento encontrado para as caixas informadas.")
+            else:
+                st.dataframe(
+                    df_timeline.rename(columns={
+                        "caixa": "CAIXA",
+                        "data": "Data",
+                        "etapa": "Etapa",
+                        "romaneio": "Romaneio",
+                        "rota": "Rota",
+                        "destino": "Destino",
+                        "detalhe": "Detalhe",
+                    }),
+                    width="stretch",
+                    hide_index=True,
+                )
+
+
+# =========================================================
+# MONITOR DE ROMANEIOS ABERTOS (delta por marca d'água, uma chamada por atualização)
+# =========================================================
+else:
+    metricas.definir_tela("Monitor - Romaneios abertos")
+    st.title("📺 Romaneios abertos (CD Reserva)")
+
+    intervalo_monitor = st.select_slider(
+        "Atualizar a cada (segundos)",
+        options=INTERVALOS_MONITOR,
+        key="monitor_intervalo",
+    )
+
+    @st.fragment(run_every=intervalo_monitor)
+    @metricas.fragmento("Monitor - Romaneios abertos")
+    def painel_monitor():
+        mon = get_monitor()
+        try:
+            mon.atualizar(intervalo_monitor)
+        except Exception as e:
+            st.warning(f"⚠️ Falha ao atualizar o monitor (mostrando a última leitura): {e}")
+        df_mon = mon.tabela()
+
+        parados = int((df_mon["parado_min"] >= MONITOR_PARADO_MIN).sum()) if not df_mon.empty else 0
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Romaneios abertos", len(df_mon))
+        m2.metric("Volumes bipados", int(df_mon["volumes"].sum()) if not df_mon.empty else 0)
+        m3.metric(f"Parados há {MONITOR_PARADO_MIN}+ min", parados)
+
+        if df_mon.empty:
+            st.info("Nenhum romaneio aberto no momento.")
+        else:
+            st.dataframe(
+                df_mon.assign(
+                    aberto_em=df_mon["aberto_em"].apply(format_datetime_sp),
+                    ultima_bipagem=df_mon["ultima_bipagem"].apply(lambda v: format_datetime_sp(v) if pd.notna(v) else "—"),
+                ).rename(columns={
+                    "romaneio": "Romaneio",
+                    "usuario": "Usuário",
+                    "aberto_em": "Aberto em",
+                    "volumes": "Volumes",
+                    "ultima_bipagem": "Última bipagem",
+                    "parado_min": "Parado (min)",
+                }),
+                width="stretch",
+                hide_index=True,
+            )
+        if mon.atualizado_as is not None:
+            st.caption(
+                f"Atualizado às {format_datetime_sp(mon.atualizado_as)} | marca #{mon.marca} | "
+                f"recarga completa a cada {mon.intervalo_completo / 60:.0f} min"
+            )
+
+    painel_monitor()
+
+
+# =========================================================
+# MÉTRICAS (fim do rerun + painel de debug opcional)
+# =========================================================
+metricas.finalizar_rerun()
+
+if st.session_state.get("debug_metricas"):
+    mostrar_painel_metricas()
@@ -0,0 +1,263 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metricas
+from helpers import normalize_chave
+
+
+# =========================================================
+# MANIFESTO DE ROMANEIO (processo): volumes de conferencia_reserva
+# =========================================================
+# Vários operadores abrem os mesmos romaneios da Reserva (recebimento,
+# espelho, reimpressão). O manifesto de cada romaneio fica no processo,
+# compartilhado entre as sessões:
+#   - Encerrado: a lista de volumes não muda mais; só data_recebimento é
+#     atualizada, por delta (linhas com data_recebimento > última vista).
+#   - Aberto: novos volumes por delta (id > maior id visto) e recarga
+#     completa a cada ttl_aberto (pega exclusões feitas por outro processo).
+# Se o delta falha (banco instável), o manifesto que já está no processo é
+# servido como está (completo=False: quem decide duplicidade confere no banco)
+# e o delta volta a ser tentado na próxima leitura.
+# As escritas do próprio app passam pelos repositórios, que avisam o cache.
+COLS_MANIFESTO = "id, chave_nfe, romaneio_id, destino, data_expedicao, data_recebimento"
+COLS_ROMANEIO = "id, status, unidade_origem, rota, usuario_criou, data_encerramento, qtd_volumes"
+
+
+class Manifesto:
+    """
+    Cabeçalho (romaneio) + volumes de um romaneio. Somente leitura para quem
+    recebe: as atualizações trocam a linha inteira, sem alterar dicts entregues.
+    """
+
+    def __init__(self, romaneio: dict, linhas: list[dict], agora: float):
+        self.romaneio = romaneio
+        self._linhas = {r["id"]: r for r in sorted(linhas, key=lambda r: r["id"])}
+        # a mesma chave pode ter mais de uma linha (bipagens concorrentes de outro processo)
+        self._por_chave: dict[str, set[int]] = {}
+        for r in self._linhas.values():
+            self._por_chave.setdefault(normalize_chave(r.get("chave_nfe")), set()).add(r["id"])
+        self.max_id = max(self._linhas, default=0)
+        self.marca_recebimento = max((r["data_recebimento"] for r in linhas if r.get("data_recebimento")), default=None)
+        self.carregado_em = agora
+        self.verificado_em = agora
+        # False enquanto o último delta falhou: pode faltar volume inserido por outro processo
+        self.completo = True
+
+    @property
+    def id(self) -> int:
+        return int(self.romaneio["id"])
+
+    @property
+    def encerrado(self) -> bool:
+        return self.romaneio.get("status") == "Encerrado"
+
+    def linhas(self) -> list[dict]:
+        return list(self._linhas.values())
+
+    def contem(self, caixa: str) -> bool:
+        return normalize_chave(caixa) in self._por_chave
+
+    def __len__(self):
+        return len(self._linhas)
+
+    # ---------- atualização (sob o lock do cache) ----------
+    def _mesclar(self, linhas: list[dict]):
+        for r in linhas:
+            if r["id"] in self._linhas:
+                self._linhas[r["id"]] = {**self._linhas[r["id"]], **r}
+            else:
+                self._linhas[r["id"]] = r
+                self._por_chave.setdefault(normalize_chave(r.get("chave_nfe")), set()).add(r["id"])
+            self.max_id = max(self.max_id, r["id"])
+            rec = r.get("data_recebimento")
+            if rec and (self.marca_recebimento is None or rec > self.marca_recebimento):
+                self.marca_recebimento = rec
+
+    def _excluir(self, caixa: str):
+        for k in self._por_chave.pop(normalize_chave(caixa), ()):
+            self._linhas.pop(k, None)
+
+    def _marcar_recebida(self, caixa: str, quando: str):
+        for k in self._por_chave.get(normalize_chave(caixa), ()):
+            self._linhas[k] = {**self._linhas[k], "data_recebimento": quando}
+
+
+class CacheManifestos:
+    """
+    Manifestos por romaneio, compartilhados pelas sessões do processo (LRU por quantidade).
+    intervalo_aberto / intervalo_recebidos: idade máxima antes do próximo delta.
+    """
+
+    def __init__(
+        self,
+        romaneios_repo,
+        conferencia_repo,
+        max_romaneios: int = 500,
+        intervalo_aberto: float = 2.0,
+        intervalo_recebidos: float = 20.0,
+        ttl_aberto: float = 5 * 60,
+    ):
+        self.romaneios_repo = romaneios_repo
+        self.conferencia_repo = conferencia_repo
+        self.max_romaneios = max_romaneios
+        self.intervalo_aberto = intervalo_aberto
+        self.intervalo_recebidos = intervalo_recebidos
+        self.ttl_aberto = ttl_aberto
+        self._dados: OrderedDict[int, Manifesto] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "cargas": 0, "deltas": 0, "linhas_delta": 0, "escritas": 0, "invalidacoes": 0, "despejos": 0, "deltas_falhos": 0}
+
+    # ---------- leitura ----------
+    def obter(self, romaneio_id: int) -> Manifesto | None:
+        return self.varios([romaneio_id]).get(int(romaneio_id))
+
+    def varios(self, ids) -> dict[int, Manifesto]:
+        """Retorna {id: Manifesto} dos romaneios existentes, carregando/atualizando o que precisar."""
+        ids = list(dict.fromkeys(int(i) for i in ids))
+        agora = time.monotonic()
+        carregar, abertos, encerrados = [], [], []
+        with self._lock:
+            for i in ids:
+                m = self._dados.get(i)
+                if m is None or (not m.encerrado and agora - m.carregado_em >= self.ttl_aberto):
+                    carregar.append(i)
+                elif not m.encerrado and agora - m.verificado_em >= self.intervalo_aberto:
+                    abertos.append(m)
+                elif m.encerrado and agora - m.verificado_em >= self.intervalo_recebidos:
+                    encerrados.append(m)
+                else:
+                    self.stats["hits"] += 1
+
+        if carregar:
+            self._carregar(carregar)
+        for delta, manifestos in ((self._delta_abertos, abertos), (self._delta_recebidos, encerrados)):
+            if not manifestos:
+                continue
+            try:
+                delta(manifestos)
+            except Exception:
+                with self._lock:
+                    for m in manifestos:
+                        m.completo = False
+                    self.stats["deltas_falhos"] += len(manifestos)
+
+        with self._lock:
+            out = {}
+            for i in ids:
+                m = self._dados.get(i)
+                if m is not None:
+                    self._dados.move_to_end(i)
+                    out[i] = m
+            return out
+
+    def _carregar(self, ids: list[int]):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            f_roms = pool.submit(metricas.propagar(self.romaneios_repo.buscar_varios), ids, COLS_ROMANEIO)
+            f_conf = pool.submit(metricas.propagar(self.conferencia_repo.listar_por_romaneios), ids, COLS_MANIFESTO)
+            cabecalhos = f_roms.result()
+            rows = f_conf.result()
+
+        por_rom = {i: [] for i in ids}
+        for r in rows:
+            por_rom.setdefault(r.get("romaneio_id"), []).append(r)
+
+        agora = time.monotonic()
+        with self._lock:
+            for i in ids:
+                if i in cabecalhos:
+                    self._guardar(Manifesto(cabecalhos[i], por_rom[i], agora))
+                else:
+                    self._dados.pop(i, None)
+            self.stats["cargas"] += len(ids)
+
+    def _delta_abertos(self, manifestos: list[Manifesto]):
+        ids = [m.id for m in manifestos]
+        desde = min(m.max_id for m in manifestos)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            f_roms = pool.submit(metricas.propagar(self.romaneios_repo.buscar_varios), ids, COLS_ROMANEIO)
+            f_conf = pool.submit(metricas.propagar(self.conferencia_repo.listar_novos), ids, desde, COLS_MANIFESTO)
+            cabecalhos = f_roms.result()
+            rows = f_conf.result()
+        self._aplicar_delta(manifestos, rows, cabecalhos)
+
+    def _delta_recebidos(self, manifestos: list[Manifesto]):
+        ids = [m.id for m in manifestos]
+        marcas = [m.marca_recebimento for m in manifestos]
+        desde = None if None in marcas else min(marcas)
+        rows = self.conferencia_repo.listar_recebidos(ids, desde, "id, romaneio_id, data_recebimento")
+        self._aplicar_delta(manifestos, rows)
+
+    def _aplicar_delta(self, manifestos: list[Manifesto], rows: list[dict], cabecalhos: dict | None = None):
+        por_rom = {}
+        for r in rows:
+            por_rom.setdefault(r.get("romaneio_id"), []).append(r)
+        agora = time.monotonic()
+        with self._lock:
+            for m in manifestos:
+                if self._dados.get(m.id) is not m:
+                    continue  # invalidado enquanto a consulta estava em voo
+                if cabecalhos is not None:
+                    if m.id not in cabecalhos:
+                        self._dados.pop(m.id, None)
+                        continue
+                    m.romaneio = cabecalhos[m.id]
+                m._mesclar(por_rom.get(m.id, []))
+                m.verificado_em = agora
+                m.completo = True
+            self.stats["deltas"] += len(manifestos)
+            self.stats["linhas_delta"] += len(rows)
+
+    def _guardar(self, m: Manifesto):
+        self._dados[m.id] = m
+        self._dados.move_to_end(m.id)
+        while len(self._dados) > self.max_romaneios:
+            self._dados.popitem(last=False)
+            self.stats["despejos"] += 1
+
+    # ---------- escritas do app ----------
+    def registrado(self, romaneio_id: int, linha: dict):
+        """Volume inserido por este app: entra no manifesto sem esperar o delta."""
+        with self._lock:
+            m = self._dados.get(int(romaneio_id))
+            if m is None:
+                return
+            if "id" in linha:
+                m._mesclar([linha])
+            else:
+                self._dados.pop(m.id, None)
+            self.stats["escritas"] += 1
+
+    def excluido(self, romaneio_id: int, chave: str):
+        with self._lock:
+            m = self._dados.get(int(romaneio_id))
+            if m is not None:
+                m._excluir(chave)
+                self.stats["escritas"] += 1
+
+    def recebido(self, romaneio_id: int, chave: str, quando: str):
+        with self._lock:
+            m = self._dados.get(int(romaneio_id))
+            if m is not None:
+                m._marcar_recebida(chave, quando)
+                self.stats["escritas"] += 1
+
+    def invalidar(self, romaneio_id: int | None = None):
+        with self._lock:
+            if romaneio_id is None:
+                self._dados.clear()
+            else:
+                self._dados.pop(int(romaneio_id), None)
+            self.stats["invalidacoes"] += 1
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            st = dict(self.stats)
+            st["romaneios"] = len(self._dados)
+            st["encerrados"] = sum(1 for m in self._dados.values() if m.encerrado)
+            st["volumes"] = sum(len(m) for m in self._dados.values())
+        return st
+
+    def __len__(self):
+        return len(self._dados)
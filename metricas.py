@@ -0,0 +1,572 @@
+import contextvars
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+from backend import Backend
+
+
+# =========================================================
+# MÉTRICAS: tempo e linhas por consulta, por etapa e por rerun
+# =========================================================
+# Cada registro é um dict com "tipo":
+#   "consulta" -> uma ida ao backend (tabela, operacao, origem, tela, ms, linhas, ok)
+#   "etapa"    -> uma função rotulada (ex.: reg_reserva) com ms e nº de consultas feitas dentro
+#   "rerun"    -> uma execução do script (tela, ms, consultas); fragmento=nome quando só um st.fragment rodou
+_origem = contextvars.ContextVar("metricas_origem", default=None)
+_etapa = contextvars.ContextVar("metricas_etapa", default=None)
+_tela = contextvars.ContextVar("metricas_tela", default=None)
+_sessao = contextvars.ContextVar("metricas_sessao", default=None)
+# método de repositório em execução (Classe.metodo): origem das consultas sem rótulo explícito
+_repositorio = contextvars.ContextVar("metricas_repositorio", default=None)
+
+# sessão usada por tarefas em segundo plano (prefetch): não entra na conta de nenhum rerun
+SEGUNDO_PLANO = "segundo_plano"
+# estado por sessão guardado no coletor (sessões que fecham a aba não avisam: as mais antigas saem)
+MAX_SESSOES = 500
+
+
+def sessao_atual():
+    s = _sessao.get()
+    if s:
+        return s
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+class Contadores:
+    """
+    Totais do processo para os counters do Prometheus: somados a cada registro,
+    fora do deque (não voltam quando ele gira nem no "Limpar métricas").
+    """
+
+    def __init__(self):
+        self.req = defaultdict(lambda: [0, 0.0, 0, 0, 0])  # n, segundos, linhas, erros, retentativas
+        self.reruns = defaultdict(lambda: [0, 0.0, 0])  # n, segundos, consultas
+        self.etapas = defaultdict(lambda: [0, 0.0, 0])  # n, segundos, consultas
+        self.circuito = defaultdict(int)  # estado de destino -> transições
+
+    def somar(self, r: dict):
+        tipo = r.get("tipo")
+        if tipo == "consulta":
+            k = (r.get("tabela"), r.get("operacao"), r.get("origem") or "-", r.get("tela") or "-")
+            self.req[k][0] += 1
+            self.req[k][1] += r.get("ms", 0.0) / 1000.0
+            self.req[k][2] += r.get("linhas", 0)
+            self.req[k][3] += 0 if r.get("ok", True) else 1
+            self.req[k][4] += max(r.get("tentativas", 1) - 1, 0)
+        elif tipo == "rerun":
+            k = (r.get("tela") or "-",)
+            self.reruns[k][0] += 1
+            self.reruns[k][1] += r.get("ms", 0.0) / 1000.0
+            self.reruns[k][2] += r.get("consultas", 0)
+        elif tipo == "etapa":
+            k = (r.get("origem"), r.get("tela") or "-")
+            self.etapas[k][0] += 1
+            self.etapas[k][1] += r.get("ms", 0.0) / 1000.0
+            self.etapas[k][2] += r.get("consultas", 0)
+        elif tipo == "circuito":
+            self.circuito[r.get("para")] += 1
+
+    def copia(self) -> "Contadores":
+        c = Contadores()
+        c.req.update((k, list(v)) for k, v in self.req.items())
+        c.reruns.update((k, list(v)) for k, v in self.reruns.items())
+        c.etapas.update((k, list(v)) for k, v in self.etapas.items())
+        c.circuito.update(self.circuito)
+        return c
+
+
+class Coletor:
+    def __init__(self, max_registros: int = 20000, max_sessoes: int = MAX_SESSOES):
+        self._lock = threading.Lock()
+        self.registros = deque(maxlen=max_registros)
+        self.contadores = Contadores()
+        self.max_sessoes = max_sessoes
+        self._reruns = OrderedDict()  # sessao -> rerun em andamento
+        self._telas = OrderedDict()  # sessao -> última tela definida (callbacks rodam antes dela)
+
+    # ---------- registro ----------
+    def _guardar(self, mapa: OrderedDict, sessao, valor):
+        """Grava por sessão mantendo só as max_sessoes usadas mais recentemente (chamar com o lock)."""
+        mapa[sessao] = valor
+        mapa.move_to_end(sessao)
+        while len(mapa) > self.max_sessoes:
+            mapa.popitem(last=False)
+        return valor
+
+    def _anotar(self, reg: dict):
+        """Guarda o registro no deque e soma nos contadores do processo (chamar com o lock)."""
+        self.registros.append(reg)
+        self.contadores.somar(reg)
+
+    def _novo_rerun(self, sessao, tela=None):
+        rr = {"inicio": time.perf_counter(), "ultimo": time.perf_counter(), "tela": tela, "consultas": 0, "ms_consultas": 0.0}
+        return self._guardar(self._reruns, sessao, rr)
+
+    def _tela_de(self, sessao):
+        return _tela.get() or self._telas.get(sessao)
+
+    def registrar_consulta(self, tabela, operacao, ms, linhas, ok=True, erro=None, **extras):
+        sessao = sessao_atual()
+        reg = {
+            "tipo": "consulta",
+            "ts": time.time(),
+            "sessao": sessao,
+            "tela": self._tela_de(sessao),
+            "origem": _origem.get() or "-",
+            "tabela": tabela,
+            "operacao": operacao,
+            "ms": round(ms, 3),
+            "linhas": int(linhas or 0),
+            "ok": bool(ok),
+            **extras,
+        }
+        if erro:
+            reg["erro"] = str(erro)[:200]
+        with self._lock:
+            self._anotar(reg)
+            if sessao != SEGUNDO_PLANO:
+                rr = self._reruns.get(sessao)
+                if rr is None:
+                    rr = self._novo_rerun(sessao)
+                rr["consultas"] += 1
+                rr["ms_consultas"] += ms
+                rr["ultimo"] = time.perf_counter()
+        et = _etapa.get()
+        if et is not None:
+            et["consultas"] += 1
+        return reg
+
+    def registrar(self, tipo: str, **campos):
+        sessao = sessao_atual()
+        reg = {"tipo": tipo, "ts": time.time(), "sessao": sessao, "tela": self._tela_de(sessao), **campos}
+        with self._lock:
+            self._anotar(reg)
+        return reg
+
+    def iniciar_rerun(self, sessao, tela=None, fragmento=None):
+        """
+        Abre o rerun da sessão. Callbacks (on_change) rodam ANTES do corpo do
+        script, então as consultas deles já ficam acumuladas no rerun corrente.
+        Um rerun anterior interrompido (st.stop) é fechado aqui.
+        fragmento: nome do st.fragment quando só ele é reexecutado.
+        """
+        with self._lock:
+            rr = self._reruns.get(sessao)
+            if rr is not None and rr.get("aberto"):
+                self._fechar(sessao, rr, interrompido=True)
+                rr = None
+            if rr is None:
+                rr = self._novo_rerun(sessao, tela)
+            rr["aberto"] = True
+            rr["tela"] = tela
+            rr["fragmento"] = fragmento
+
+    def definir_tela(self, sessao, tela):
+        """O rerun fica com a PRIMEIRA tela definida (a da aba de operação)."""
+        with self._lock:
+            rr = self._reruns.get(sessao)
+            if rr is not None and not rr.get("tela"):
+                rr["tela"] = tela
+            self._guardar(self._telas, sessao, rr["tela"] if rr is not None else tela)
+
+    def finalizar_rerun(self, sessao):
+        with self._lock:
+            rr = self._reruns.get(sessao)
+            if rr is None:
+                return None
+            rr["ultimo"] = time.perf_counter()
+            return self._fechar(sessao, rr)
+
+    def _fechar(self, sessao, rr, interrompido=False):
+        reg = {
+            "tipo": "rerun",
+            "ts": time.time(),
+            "sessao": sessao,
+            "tela": rr.get("tela"),
+            "ms": round((rr["ultimo"] - rr["inicio"]) * 1000, 3),
+            "consultas": rr["consultas"],
+            "ms_consultas": round(rr["ms_consultas"], 3),
+            "interrompido": interrompido,
+            "fragmento": rr.get("fragmento"),
+        }
+        self._anotar(reg)
+        self._reruns.pop(sessao, None)
+        return reg
+
+    def encerrar_sessao(self, sessao):
+        """Sessão saiu (logout): descarta o estado dela; os registros já feitos ficam."""
+        with self._lock:
+            self._reruns.pop(sessao, None)
+            self._telas.pop(sessao, None)
+
+    # ---------- leitura ----------
+    def totais(self) -> Contadores:
+        with self._lock:
+            return self.contadores.copia()
+
+    def listar(self, sessao=None, tipo=None) -> list[dict]:
+        with self._lock:
+            regs = list(self.registros)
+        return [
+            r for r in regs
+            if (sessao is None or r.get("sessao") == sessao) and (tipo is None or r.get("tipo") == tipo)
+        ]
+
+    def limpar(self, sessao=None):
+        with self._lock:
+            if sessao is None:
+                self.registros.clear()
+            else:
+                restantes = [r for r in self.registros if r.get("sessao") != sessao]
+                self.registros.clear()
+                self.registros.extend(restantes)
+
+
+coletor = Coletor()
+
+
+# =========================================================
+# ROTULAGEM (call site / tela)
+# =========================================================
+@contextmanager
+def origem(nome: str):
+    token = _origem.set(nome)
+    try:
+        yield
+    finally:
+        _origem.reset(token)
+
+
+@contextmanager
+def segundo_plano(nome: str):
+    """
+    Para tarefas fora do render (pool de prefetch): as consultas ficam com
+    origem=nome e sessão SEGUNDO_PLANO, sem somar no rerun nem na etapa de quem disparou.
+    """
+    tokens = [(_origem, _origem.set(nome)), (_sessao, _sessao.set(SEGUNDO_PLANO)), (_etapa, _etapa.set(None))]
+    try:
+        yield
+    finally:
+        for var, tok in reversed(tokens):
+            var.reset(tok)
+
+
+def rotular(nome: str):
+    """Decorator: consultas feitas dentro da função recebem origem=nome."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with origem(nome):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def metodo_repositorio(fn):
+    """
+    Decorator dos métodos públicos dos repositórios: as consultas feitas dentro
+    (sem origem/rotular por cima) ficam com origem=Classe.metodo. O método mais
+    interno vale; geradores (páginas) rotulam cada passo.
+    """
+    def nome(args):
+        return f"{type(args[0]).__name__}.{fn.__name__}" if args else fn.__name__
+
+    if inspect.isgeneratorfunction(fn):
+        @wraps(fn)
+        def gerador(*args, **kwargs):
+            gen = fn(*args, **kwargs)
+            while True:
+                token = _repositorio.set(nome(args))
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    return
+                finally:
+                    _repositorio.reset(token)
+                yield item
+        return gerador
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _repositorio.set(nome(args))
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _repositorio.reset(token)
+    return wrapper
+
+
+def etapa(nome: str):
+    """
+    Decorator para callbacks de bipagem: registra a duração da etapa e
+    quantas consultas ela fez (base do "consultas por bipagem").
+    """
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            acum = {"consultas": 0}
+            tok_et = _etapa.set(acum)
+            tok_or = _origem.set(nome)
+            t0 = time.perf_counter()
+            ok = True
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                ok = False
+                raise
+            finally:
+                _origem.reset(tok_or)
+                _etapa.reset(tok_et)
+                coletor.registrar(
+                    "etapa",
+                    origem=nome,
+                    ms=round((time.perf_counter() - t0) * 1000, 3),
+                    consultas=acum["consultas"],
+                    ok=ok,
+                )
+        return wrapper
+    return deco
+
+
+def iniciar_rerun(sessao, tela=None, fragmento=None):
+    _sessao.set(sessao)
+    _tela.set(tela)
+    coletor.iniciar_rerun(sessao, tela, fragmento)
+
+
+def definir_tela(tela: str):
+    _tela.set(tela)
+    coletor.definir_tela(sessao_atual(), tela)
+
+
+def finalizar_rerun():
+    return coletor.finalizar_rerun(sessao_atual())
+
+
+def rerun_de_fragmento() -> bool:
+    """True quando o Streamlit está reexecutando só fragmentos (não o script inteiro)."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+        return bool(ctx and ctx.fragment_ids_this_run)
+    except Exception:
+        return False
+
+
+def fragmento(tela: str):
+    """
+    Decorator para funções com @st.fragment. No rerun só do fragmento o topo
+    e o fim do script não rodam: o rerun é aberto e fechado aqui (com fragmento=nome).
+    No rerun completo não faz nada: o fragmento conta no rerun do script.
+    """
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not rerun_de_fragmento():
+                return fn(*args, **kwargs)
+            iniciar_rerun(sessao_atual(), tela, fragmento=fn.__name__)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                finalizar_rerun()
+        return wrapper
+    return deco
+
+
+def propagar(fn):
+    """
+    Amarra fn a uma cópia do contexto atual (origem/tela/sessão), para
+    que consultas feitas em threads de um pool sejam rotuladas igual.
+    """
+    ctx = contextvars.copy_context()
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return wrapper
+
+
+# =========================================================
+# BACKEND INSTRUMENTADO
+# =========================================================
+class BackendInstrumentado(Backend):
+    """Envolve qualquer Backend e registra cada chamada no coletor."""
+
+    def __init__(self, interno: Backend, destino: Coletor = coletor):
+        self.interno = interno
+        self.coletor = destino
+        self.nome = interno.nome
+
+    def __getattr__(self, item):
+        return getattr(self.interno, item)
+
+    def _medir(self, operacao, tabela, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out, erro = None, None
+        try:
+            out = fn(*args, **kwargs)
+            return out
+        except Exception as e:
+            erro = e
+            raise
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            if isinstance(out, list) or (operacao == "select" and out is not None):  # lista ou DataFrame
+                linhas = len(out)
+            elif operacao == "upsert" and isinstance(out, int):
+                linhas = out
+            else:
+                linhas = 0
+            extras = {"contagem": out} if operacao == "count" and isinstance(out, int) else {}
+            if _origem.get() is None:
+                # sem rótulo explícito, a origem vira o método do repositório (ex.: ConferenciaReservaRepo.contar)
+                extras["origem"] = _repositorio.get() or "-"
+            detalhes = getattr(self.interno, "ultima_chamada", None)  # BackendResiliente: tentativas e circuito
+            if detalhes is not None:
+                extras.update(detalhes())
+            self.coletor.registrar_consulta(tabela, operacao, ms, linhas, ok=erro is None, erro=erro, **extras)
+
+    def select(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, embed=None):
+        return self._medir("select", tabela, self.interno.select, tabela, colunas, filtros, ordem, desc, limite, embed)
+
+    def select_df(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, tipos=None):
+        return self._medir("select", tabela, self.interno.select_df, tabela, colunas, filtros, ordem, desc, limite, tipos)
+
+    def count(self, tabela, filtros=()):
+        return self._medir("count", tabela, self.interno.count, tabela, filtros)
+
+    def insert(self, tabela, rows):
+        return self._medir("insert", tabela, self.interno.insert, tabela, rows)
+
+    def update(self, tabela, valores, filtros):
+        return self._medir("update", tabela, self.interno.update, tabela, valores, filtros)
+
+    def delete(self, tabela, filtros):
+        return self._medir("delete", tabela, self.interno.delete, tabela, filtros)
+
+    def upsert(self, tabela, rows, on_conflict):
+        return self._medir("upsert", tabela, self.interno.upsert, tabela, rows, on_conflict)
+
+    def rpc(self, funcao, params):
+        # a função aparece no lugar da tabela
+        return self._medir("rpc", funcao, self.interno.rpc, funcao, params)
+
+
+# =========================================================
+# AGREGAÇÃO / EXPORTAÇÃO
+# =========================================================
+def agregar_consultas(registros: list[dict]) -> list[dict]:
+    grupos = defaultdict(lambda: {"n": 0, "ms_total": 0.0, "ms_max": 0.0, "linhas": 0, "erros": 0, "retentativas": 0})
+    for r in registros:
+        if r.get("tipo") != "consulta":
+            continue
+        g = grupos[(r.get("tela") or "-", r.get("origem") or "-", r.get("tabela"), r.get("operacao"))]
+        g["n"] += 1
+        g["ms_total"] += r.get("ms", 0.0)
+        g["ms_max"] = max(g["ms_max"], r.get("ms", 0.0))
+        g["linhas"] += r.get("linhas", 0)
+        g["erros"] += 0 if r.get("ok", True) else 1
+        g["retentativas"] += max(r.get("tentativas", 1) - 1, 0)
+    out = []
+    for (tela, orig, tabela, op), g in grupos.items():
+        out.append({
+            "tela": tela,
+            "origem": orig,
+            "tabela": tabela,
+            "operacao": op,
+            "n": g["n"],
+            "ms_total": round(g["ms_total"], 1),
+            "ms_medio": round(g["ms_total"] / g["n"], 1),
+            "ms_max": round(g["ms_max"], 1),
+            "linhas": g["linhas"],
+            "erros": g["erros"],
+            "retentativas": g["retentativas"],
+        })
+    return sorted(out, key=lambda x: x["ms_total"], reverse=True)
+
+
+def consultas_por_etapa(registros: list[dict]) -> list[dict]:
+    grupos = defaultdict(lambda: {"n": 0, "consultas": 0, "ms_total": 0.0})
+    for r in registros:
+        if r.get("tipo") != "etapa":
+            continue
+        g = grupos[(r.get("tela") or "-", r.get("origem"))]
+        g["n"] += 1
+        g["consultas"] += r.get("consultas", 0)
+        g["ms_total"] += r.get("ms", 0.0)
+    return [
+        {
+            "tela": tela,
+            "etapa": nome,
+            "execucoes": g["n"],
+            "consultas_por_execucao": round(g["consultas"] / g["n"], 2),
+            "ms_medio": round(g["ms_total"] / g["n"], 1),
+        }
+        for (tela, nome), g in grupos.items()
+    ]
+
+
+def exportar_jsonl(registros: list[dict]) -> str:
+    return "\n".join(json.dumps(r, ensure_ascii=False, default=str) for r in registros) + ("\n" if registros else "")
+
+
+def _rotulos(d: dict) -> str:
+    partes = []
+    for k, v in d.items():
+        v = str(v if v is not None else "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def exportar_prometheus(contadores: Contadores) -> str:
+    """Formato de exposição texto do Prometheus (counters do processo: ver Coletor.totais)."""
+    req, reruns, etapas, circuito = contadores.req, contadores.reruns, contadores.etapas, contadores.circuito
+
+    linhas = []
+
+    def metrica(nome, tipo, ajuda, series):
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        for rot, valor in series:
+            linhas.append(f"{nome}{_rotulos(rot)} {valor:g}" if isinstance(valor, float) else f"{nome}{_rotulos(rot)} {valor}")
+
+    def rot_req(k):
+        return {"tabela": k[0], "operacao": k[1], "origem": k[2], "tela": k[3]}
+
+    metrica("conferencia_backend_requests_total", "counter", "Requests ao backend.",
+            [(rot_req(k), v[0]) for k, v in req.items()])
+    metrica("conferencia_backend_request_seconds_sum", "counter", "Tempo total em requests ao backend.",
+            [(rot_req(k), round(v[1], 6)) for k, v in req.items()])
+    metrica("conferencia_backend_rows_total", "counter", "Linhas retornadas/afetadas pelo backend.",
+            [(rot_req(k), v[2]) for k, v in req.items()])
+    metrica("conferencia_backend_errors_total", "counter", "Requests ao backend com erro.",
+            [(rot_req(k), v[3]) for k, v in req.items()])
+    metrica("conferencia_backend_retries_total", "counter", "Novas tentativas de leituras com falha transitória.",
+            [(rot_req(k), v[4]) for k, v in req.items()])
+    metrica("conferencia_backend_circuit_transitions_total", "counter", "Mudanças de estado do disjuntor do backend.",
+            [({"para": k}, v) for k, v in circuito.items()])
+    metrica("conferencia_rerun_total", "counter", "Reruns do script.",
+            [({"tela": k[0]}, v[0]) for k, v in reruns.items()])
+    metrica("conferencia_rerun_seconds_sum", "counter", "Tempo total de reruns.",
+            [({"tela": k[0]}, round(v[1], 6)) for k, v in reruns.items()])
+    metrica("conferencia_rerun_queries_total", "counter", "Requests ao backend feitos em reruns.",
+            [({"tela": k[0]}, v[2]) for k, v in reruns.items()])
+    metrica("conferencia_etapa_total", "counter", "Execuções de etapas rotuladas (bipagens).",
+            [({"etapa": k[0], "tela": k[1]}, v[0]) for k, v in etapas.items()])
+    metrica("conferencia_etapa_seconds_sum", "counter", "Tempo total das etapas rotuladas.",
+            [({"etapa": k[0], "tela": k[1]}, round(v[1], 6)) for k, v in etapas.items()])
+    metrica("conferencia_etapa_queries_total", "counter", "Requests ao backend feitos dentro das etapas.",
+            [({"etapa": k[0], "tela": k[1]}, v[2]) for k, v in etapas.items()])
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pandas as pd
+
+COLUNAS = ["romaneio", "usuario", "aberto_em", "volumes", "ultima_bipagem", "parado_min"]
+
+
+# =========================================================
+# MONITOR DE ROMANEIOS ABERTOS (processo)
+# =========================================================
+# Telas de parede e supervisores olham a mesma lista: o estado fica no
+# processo e cada atualização é uma chamada só (monitor_romaneios_abertos),
+# com a marca d'água (maior id de conferencia_reserva já visto). Voltam a
+# lista de abertos (poucos) e os volumes novos agregados por romaneio.
+# Exclusões de volume não aparecem no delta: a cada intervalo_completo a
+# marca volta a zero e as contagens são refeitas.
+class MonitorRomaneios:
+    def __init__(self, romaneios_repo, intervalo: float = 5.0, intervalo_completo: float = 5 * 60):
+        self.romaneios_repo = romaneios_repo
+        self.intervalo = intervalo
+        self.intervalo_completo = intervalo_completo
+        self.marca = 0
+        self._abertos: dict[int, dict] = {}
+        self._volumes: dict[int, int] = {}
+        self._ultima: dict[int, str] = {}
+        self._atualizado_em = None
+        self._completo_em = None
+        self.atualizado_as = None  # relógio de parede da última atualização (para a tela)
+        self._lock = threading.Lock()
+        self.stats = {"atualizacoes": 0, "completas": 0, "reaproveitadas": 0, "linhas_delta": 0, "erros": 0}
+
+    def atualizar(self, intervalo: float | None = None) -> bool:
+        """
+        Consulta se a última atualização tem mais de `intervalo` s (padrão: self.intervalo).
+        Sessões que chegam juntas esperam a mesma consulta em vez de repeti-la.
+        """
+        intervalo = self.intervalo if intervalo is None else intervalo
+        with self._lock:
+            agora = time.monotonic()
+            if self._atualizado_em is not None and agora - self._atualizado_em < intervalo:
+                self.stats["reaproveitadas"] += 1
+                return False
+
+            completo = self._completo_em is None or agora - self._completo_em >= self.intervalo_completo
+            try:
+                res = self.romaneios_repo.monitor_abertos(0 if completo else self.marca)
+            except Exception:
+                self.stats["erros"] += 1
+                raise
+
+            abertos = {int(r["id"]): r for r in res.get("abertos") or []}
+            if completo:
+                volumes, ultima = {}, {}
+            else:
+                volumes = {i: n for i, n in self._volumes.items() if i in abertos}
+                ultima = {i: u for i, u in self._ultima.items() if i in abertos}
+            for n in res.get("novos") or []:
+                rid = int(n["romaneio_id"])
+                volumes[rid] = volumes.get(rid, 0) + int(n["volumes"])
+                if n.get("ultima_bipagem") and (rid not in ultima or n["ultima_bipagem"] > ultima[rid]):
+                    ultima[rid] = n["ultima_bipagem"]
+
+            self._abertos, self._volumes, self._ultima = abertos, volumes, ultima
+            self.marca = int(res.get("marca") or 0) if completo else max(self.marca, int(res.get("marca") or 0))
+            self._atualizado_em = agora
+            self.atualizado_as = pd.Timestamp.now(tz="UTC")
+            if completo:
+                self._completo_em = agora
+                self.stats["completas"] += 1
+            self.stats["atualizacoes"] += 1
+            self.stats["linhas_delta"] += len(res.get("novos") or [])
+            return True
+
+    def tabela(self) -> pd.DataFrame:
+        """Um romaneio aberto por linha; parados há mais tempo primeiro."""
+        with self._lock:
+            linhas = [
+                {
+                    "romaneio": rid,
+                    "usuario": r.get("usuario_criou"),
+                    "aberto_em": r.get("created_at"),
+                    "volumes": self._volumes.get(rid, 0),
+                    "ultima_bipagem": self._ultima.get(rid),
+                }
+                for rid, r in self._abertos.items()
+            ]
+            referencia = self.atualizado_as
+        df = pd.DataFrame(linhas, columns=COLUNAS)
+        if df.empty:
+            return df
+        for col in ["aberto_em", "ultima_bipagem"]:
+            df[col] = pd.to_datetime(df[col], utc=True, errors="coerce", format="ISO8601")
+        desde = df["ultima_bipagem"].fillna(df["aberto_em"])
+        df["parado_min"] = ((referencia - desde).dt.total_seconds() // 60).astype("Int64")
+        return df.sort_values(["parado_min", "romaneio"], ascending=[False, True], ignore_index=True)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            st = dict(self.stats)
+            st["abertos"] = len(self._abertos)
+            st["marca"] = self.marca
+        return st
@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metricas
+from helpers import chunk_list, normalize_chave
+
+
+# =========================================================
+# PREFETCH: aquece o faturamento por caixa fora do render
+# =========================================================
+# Quando uma sessão carrega romaneios, as caixas deles vão precisar de
+# destino/filial/qtde logo em seguida (recebimento e espelho na Pavuna).
+# O Prefetcher busca em lote num pool de threads e grava no CacheCaixas;
+# o passo seguinte encontra tudo em cache em vez de consultar o banco.
+class Prefetcher:
+    def __init__(self, cache, carregar, max_workers: int = 2, tamanho_lote: int = 500, intervalo_recentes: float = 15 * 60):
+        """
+        cache: CacheCaixas de destino.
+        carregar(caixas) -> {caixa: valor}; caixas ausentes do retorno ficam em cache como None.
+        """
+        self.cache = cache
+        self.carregar = carregar
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_recentes = intervalo_recentes
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._em_voo: set[str] = set()
+        self._ultimo_recentes = 0.0
+
+    def aquecer(self, caixas) -> list[Future]:
+        """Agenda a busca das caixas que ainda não estão em cache nem em andamento. Não bloqueia."""
+        caixas = list(dict.fromkeys(c for c in (normalize_chave(x) for x in caixas) if c))
+        _, faltando = self.cache.buscar(caixas)
+        with self._lock:
+            novas = [c for c in faltando if c not in self._em_voo]
+            self._em_voo.update(novas)
+        return [
+            self._pool.submit(metricas.propagar(self._carregar_lote), part)
+            for part in chunk_list(novas, size=self.tamanho_lote)
+        ]
+
+    def aquecer_recentes(self, carregar_recentes) -> Future | None:
+        """
+        Aquece com o faturamento mais recente (o que a Reserva deve bipar em seguida).
+        No máximo uma vez por intervalo_recentes, por processo.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            if agora - self._ultimo_recentes < self.intervalo_recentes:
+                return None
+            self._ultimo_recentes = agora
+        return self._pool.submit(metricas.propagar(self._carregar_recentes), carregar_recentes)
+
+    def _carregar_lote(self, caixas: list[str]):
+        try:
+            with metricas.segundo_plano("prefetch_faturamento"):
+                valores = self.carregar(caixas)
+            self.cache.gravar(valores, ausentes=caixas)
+        except Exception as e:
+            metricas.coletor.registrar("prefetch", origem="prefetch_faturamento", caixas=len(caixas), ok=False, erro=str(e)[:200])
+        finally:
+            with self._lock:
+                self._em_voo.difference_update(caixas)
+
+    def _carregar_recentes(self, carregar_recentes):
+        try:
+            with metricas.segundo_plano("prefetch_faturamento_recente"):
+                valores = carregar_recentes()
+            self.cache.gravar(valores)
+        except Exception as e:
+            metricas.coletor.registrar("prefetch", origem="prefetch_faturamento_recente", ok=False, erro=str(e)[:200])
+            with self._lock:
+                self._ultimo_recentes = 0.0
+
+    def aguardar(self, timeout: float | None = None):
+        """Espera as buscas agendadas até agora (usado no benchmark)."""
+        fim = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                pendentes = bool(self._em_voo)
+            if not pendentes:
+                return True
+            if fim is not None and time.monotonic() > fim:
+                return False
+            time.sleep(0.01)
+
+    def encerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
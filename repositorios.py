@@ -0,0 +1,486 @@
+import inspect
+
+import pandas as pd
+
+import metricas
+from backend import tipar
+from helpers import chunk_list, get_now_utc, normalize_chave
+from manifestos import CacheManifestos
+
+
+# =========================================================
+# REPOSITÓRIOS: todas as consultas do app passam por aqui
+# =========================================================
+# Cada repositório recebe um Backend (Supabase ou SQLite) e expõe
+# as operações de negócio. Lotes grandes (in_) são quebrados aqui.
+TAMANHO_LOTE = 500
+# leituras em massa: páginas por id (keyset); não passar do max-rows do PostgREST (1000 no Supabase)
+TAMANHO_PAGINA = 1000
+# leituras em DataFrame (backend.select_df): texto de muitas repetições vira category
+TIPOS_CAIXA = {"caixa": "string", "filial_origem": "category", "destino": "category", "qtde_pecas": "Int64"}
+
+
+class _Repo:
+    tabela = ""
+    chave = ""  # romaneio dono da linha, nas tabelas que têm arquivo frio
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # métricas: consultas sem rótulo explícito ficam com origem=Classe.metodo
+        for nome, attr in list(vars(cls).items()):
+            if inspect.isfunction(attr) and not nome.startswith("_"):
+                setattr(cls, nome, metricas.metodo_repositorio(attr))
+
+    def __init__(self, backend, manifestos=None, arquivo=None):
+        self.backend = backend
+        # CacheManifestos avisado nas escritas que mudam um romaneio (só romaneios/conferencia)
+        self.manifestos = manifestos
+        # ArquivoFrio (arquivo.py): linhas antigas fora do banco; None = só o banco
+        self.arquivo = arquivo
+
+    def _em_lotes(self, coluna: str, valores: list, colunas="*", embed=None, tamanho: int = TAMANHO_LOTE) -> list[dict]:
+        out = []
+        for part in chunk_list(list(valores), size=tamanho):
+            out.extend(self.backend.select(self.tabela, colunas, [("in", coluna, part)], embed=embed))
+        return out
+
+    def _em_lotes_df(self, coluna: str, valores: list, colunas: str, tipos: dict, tamanho: int = TAMANHO_LOTE) -> pd.DataFrame:
+        partes = [
+            self.backend.select_df(self.tabela, colunas, [("in", coluna, part)], tipos=tipos)
+            for part in chunk_list(list(valores), size=tamanho)
+        ]
+        if not partes:
+            return tipar(pd.DataFrame(), tipos)
+        # concat de category com categorias diferentes vira object: tipa de novo
+        return partes[0] if len(partes) == 1 else tipar(pd.concat(partes, ignore_index=True), tipos)
+
+    def _paginas(self, filtros, colunas="*", tamanho: int = TAMANHO_PAGINA, desde_id: int = 0):
+        """Gera páginas em ordem de id (id > último visto, sem offset). colunas precisa incluir id."""
+        ultimo = int(desde_id)
+        while True:
+            rows = self.backend.select(self.tabela, colunas, [*filtros, ("gt", "id", ultimo)], ordem="id", limite=tamanho)
+            if rows:
+                yield rows
+            if len(rows) < tamanho:
+                return
+            ultimo = rows[-1]["id"]
+
+    @metricas.metodo_repositorio
+    def apagar_ids(self, ids: list[int]) -> int:
+        n = 0
+        for part in chunk_list(list(ids), size=TAMANHO_LOTE):
+            self.backend.delete(self.tabela, [("in", "id", part)])
+            n += len(part)
+        return n
+
+    # ---------- arquivo frio ----------
+    def _arquivados(self, ids) -> set[int]:
+        return self.arquivo.arquivados(self.tabela, ids) if self.arquivo is not None else set()
+
+    def _do_arquivo(self, colunas="*", limite: int | None = None, **filtros) -> list[dict]:
+        if self.arquivo is None:
+            return []
+        return self.arquivo.ler(self.tabela, colunas, limite=limite, **filtros)
+
+    def _mesclar(self, quentes: list[dict], frias: list[dict]) -> list[dict]:
+        """De romaneio já arquivado vale só o arquivo (o banco pode ter sobra de uma cópia interrompida)."""
+        if not frias:
+            return quentes
+        arquivados = self._arquivados({r.get(self.chave) for r in quentes})
+        return [r for r in quentes if r.get(self.chave) not in arquivados] + frias
+
+    def _com_cabecalho(self, rows: list[dict], pai: str, colunas: str) -> list[dict]:
+        """Embed do cabeçalho (pai) nas linhas vindas do arquivo, no formato do PostgREST."""
+        ids = {r[self.chave] for r in rows if r.get(self.chave) is not None}
+        cab = {}
+        for part in chunk_list(sorted(ids), size=TAMANHO_LOTE):
+            for c in self.backend.select(pai, "*", [("in", "id", part)]):
+                cab[c["id"]] = c if colunas.strip() == "*" else {k.strip(): c.get(k.strip()) for k in colunas.split(",")}
+        for r in rows:
+            r[pai] = cab.get(r.get(self.chave))
+        return rows
+
+
+class RomaneiosRepo(_Repo):
+    tabela = "romaneios"
+
+    def buscar(self, romaneio_id: int, colunas="*"):
+        rows = self.backend.select(self.tabela, colunas, [("eq", "id", int(romaneio_id))], limite=1)
+        return rows[0] if rows else None
+
+    def buscar_varios(self, ids: list[int], colunas="id, status, unidade_origem") -> dict:
+        if not ids:
+            return {}
+        rows = self.backend.select(self.tabela, colunas, [("in", "id", [int(i) for i in ids])])
+        return {r["id"]: r for r in rows}
+
+    def monitor_abertos(self, desde_id: int = 0) -> dict:
+        """
+        Romaneios abertos da Reserva + volumes com id > desde_id agregados por romaneio
+        (sql/monitor_romaneios.sql). Retorna {"marca", "abertos", "novos"}.
+        """
+        res = self.backend.rpc("monitor_romaneios_abertos", {"p_desde_id": int(desde_id)})
+        return res or {"marca": int(desde_id), "abertos": [], "novos": []}
+
+    def encerrados_entre(self, dt_ini: str, dt_fim: str, colunas="id, qtd_volumes") -> list[dict]:
+        """Romaneios da Reserva encerrados em [dt_ini, dt_fim)."""
+        return [r for pagina in self._paginas(self._filtros_encerrados(dt_ini, dt_fim), colunas) for r in pagina]
+
+    def contar_encerrados_entre(self, dt_ini: str, dt_fim: str) -> int:
+        return self.backend.count(self.tabela, self._filtros_encerrados(dt_ini, dt_fim))
+
+    @staticmethod
+    def _filtros_encerrados(dt_ini: str, dt_fim: str) -> list:
+        return [
+            ("eq", "unidade_origem", "CD Reserva"),
+            ("eq", "status", "Encerrado"),
+            ("gte", "data_encerramento", dt_ini),
+            ("lt", "data_encerramento", dt_fim),
+        ]
+
+    def abrir_reserva(self, usuario: str) -> int:
+        rows = self.backend.insert(self.tabela, {
+            "usuario_criou": usuario,
+            "unidade_origem": "CD Reserva",
+            "status": "Aberto",
+            "rota": None,
+        })
+        return rows[0]["id"]
+
+    def encerrar_reserva(self, romaneio_id: int, rota: str) -> dict:
+        """
+        Valida e encerra numa única chamada (sql/encerrar_romaneio.sql), gravando qtd_volumes.
+        Retorna {"ok", "motivo", "qtd_volumes"}; motivo: sem_rota | nao_encontrado |
+        unidade_invalida | ja_encerrado | sem_volumes.
+        """
+        res = self.backend.rpc("encerrar_romaneio_reserva", {"p_romaneio_id": int(romaneio_id), "p_rota": rota})
+        if self.manifestos is not None and res and res.get("ok"):
+            self.manifestos.invalidar(romaneio_id)
+        return res or {"ok": False, "motivo": "nao_encontrado"}
+
+
+class ConferenciaReservaRepo(_Repo):
+    tabela = "conferencia_reserva"
+    chave = "romaneio_id"
+
+    def contar(self, romaneio_id: int) -> int:
+        return self.backend.count(self.tabela, [("eq", "romaneio_id", int(romaneio_id))])
+
+    def listar(self, romaneio_id: int, colunas="id, chave_nfe, destino", com_romaneio=None) -> list[dict]:
+        embed = {"romaneios": com_romaneio} if com_romaneio else None
+        return self.backend.select(
+            self.tabela, colunas, [("eq", "romaneio_id", int(romaneio_id))], ordem="id", embed=embed
+        )
+
+    def listar_por_romaneios(self, ids: list[int], colunas="id, chave_nfe, romaneio_id, data_recebimento") -> list[dict]:
+        """Todos os volumes dos romaneios (páginas por id; colunas precisa incluir id)."""
+        if not ids:
+            return []
+        arquivados = self._arquivados(ids)
+        rows = [
+            r
+            for part in chunk_list([int(i) for i in ids if int(i) not in arquivados], size=TAMANHO_LOTE)
+            for pagina in self._paginas([("in", "romaneio_id", part)], colunas)
+            for r in pagina
+        ]
+        return rows + (self._do_arquivo(colunas, ids=arquivados) if arquivados else [])
+
+    def contar_por_romaneios(self, ids: list[int]) -> int:
+        return sum(
+            self.backend.count(self.tabela, [("in", "romaneio_id", part)])
+            for part in chunk_list([int(i) for i in ids], size=TAMANHO_LOTE)
+        )
+
+    def listar_novos(self, ids: list[int], id_maior: int, colunas="id, chave_nfe, romaneio_id") -> list[dict]:
+        """Volumes inseridos depois de id_maior (delta de romaneios abertos)."""
+        return [
+            r
+            for part in chunk_list([int(i) for i in ids], size=TAMANHO_LOTE)
+            for pagina in self._paginas([("in", "romaneio_id", part)], colunas, desde_id=id_maior)
+            for r in pagina
+        ]
+
+    def listar_recebidos(self, ids: list[int], desde: str | None, colunas="id, romaneio_id, data_recebimento") -> list[dict]:
+        """Volumes recebidos a partir de `desde` (todos os recebidos, se None)."""
+        recebido = ("gte", "data_recebimento", desde) if desde else ("not_null", "data_recebimento", None)
+        return [
+            r
+            for part in chunk_list([int(i) for i in ids], size=TAMANHO_LOTE)
+            for pagina in self._paginas([("in", "romaneio_id", part), recebido], colunas)
+            for r in pagina
+        ]
+
+    def paginas_por_romaneios(self, ids: list[int], colunas="id, romaneio_id", tamanho: int = TAMANHO_PAGINA):
+        arquivados = self._arquivados(ids)
+        for part in chunk_list([int(i) for i in ids if int(i) not in arquivados], size=TAMANHO_LOTE):
+            yield from self._paginas([("in", "romaneio_id", part)], colunas, tamanho)
+        if arquivados:
+            yield from self.arquivo.paginas(self.tabela, colunas, tamanho, ids=arquivados)
+
+    def paginas_por_expedicao(self, dt_ini: str, dt_fim: str, colunas="id, chave_nfe, romaneio_id, data_recebimento", tamanho: int = TAMANHO_PAGINA):
+        """Volumes expedidos em [dt_ini, dt_fim), página a página (conciliação); depois os do arquivo."""
+        for pagina in self._paginas([("gte", "data_expedicao", dt_ini), ("lt", "data_expedicao", dt_fim)], colunas, tamanho):
+            arquivados = self._arquivados({r.get("romaneio_id") for r in pagina})
+            pagina = [r for r in pagina if r.get("romaneio_id") not in arquivados] if arquivados else pagina
+            if pagina:
+                yield pagina
+        if self.arquivo is not None:
+            yield from self.arquivo.paginas(self.tabela, colunas, tamanho, dt_ini=dt_ini, dt_fim=dt_fim)
+
+    def contar_por_expedicao(self, dt_ini: str, dt_fim: str, recebidos: bool = False) -> int:
+        filtros = [("gte", "data_expedicao", dt_ini), ("lt", "data_expedicao", dt_fim)]
+        if recebidos:
+            filtros.append(("not_null", "data_recebimento", None))
+        return self.backend.count(self.tabela, filtros)
+
+    def por_caixas(self, caixas: list[str], colunas="*", com_romaneio=None, com_arquivo: bool = False) -> list[dict]:
+        """com_arquivo: inclui os volumes já arquivados (consultas; a operação só olha o banco)."""
+        embed = {"romaneios": com_romaneio} if com_romaneio else None
+        rows = self._em_lotes("chave_nfe", caixas, colunas, embed=embed)
+        if not com_arquivo:
+            return rows
+        frias = self._do_arquivo(colunas, caixas=caixas)
+        if frias and com_romaneio:
+            self._com_cabecalho(frias, "romaneios", com_romaneio)
+        return self._mesclar(rows, frias)
+
+    def existe(self, romaneio_id: int, chave: str) -> bool:
+        rows = self.backend.select(
+            self.tabela, "id",
+            [("eq", "romaneio_id", int(romaneio_id)), ("eq", "chave_nfe", chave)],
+            limite=1,
+        )
+        return bool(rows)
+
+    def existentes(self, romaneio_id: int, chaves: list[str]) -> set[str]:
+        """Chaves do lote que já estão no romaneio (checagem no banco quando o manifesto não está completo)."""
+        return {
+            r["chave_nfe"]
+            for part in chunk_list(list(chaves), size=TAMANHO_LOTE)
+            for r in self.backend.select(
+                self.tabela, "chave_nfe", [("eq", "romaneio_id", int(romaneio_id)), ("in", "chave_nfe", part)]
+            )
+        }
+
+    def registrar(self, romaneio_id: int, chave: str, destino: str | None = None) -> dict:
+        return self.registrar_varios(romaneio_id, [(chave, destino)])[0]
+
+    def registrar_varios(self, romaneio_id: int, itens: list[tuple[str, str | None]]) -> list[dict]:
+        """Um insert para um lote de volumes (chave, destino) do mesmo romaneio."""
+        agora = get_now_utc()
+        payload = [
+            {"chave_nfe": chave, "romaneio_id": int(romaneio_id), "data_expedicao": agora, "destino": destino or None}
+            for chave, destino in itens
+        ]
+        if not payload:
+            return []
+        rows = self.backend.insert(self.tabela, payload)
+        linhas = rows if len(rows) == len(payload) else payload
+        if self.manifestos is not None:
+            for linha in linhas:
+                self.manifestos.registrado(romaneio_id, linha)
+        return linhas
+
+    def excluir(self, romaneio_id: int, chave: str):
+        rows = self.backend.delete(
+            self.tabela, [("eq", "romaneio_id", int(romaneio_id)), ("eq", "chave_nfe", chave)]
+        )
+        if self.manifestos is not None:
+            self.manifestos.excluido(romaneio_id, chave)
+        return rows
+
+    def marcar_recebido(self, romaneio_id: int, chave: str):
+        return self.marcar_recebidos(romaneio_id, [chave])
+
+    def marcar_recebidos(self, romaneio_id: int, chaves: list[str]) -> list[dict]:
+        """Um update por lote de caixas do mesmo romaneio (in_ em vez de eq por caixa)."""
+        agora = get_now_utc()
+        rows = []
+        for part in chunk_list(list(chaves), size=TAMANHO_LOTE):
+            rows.extend(self.backend.update(
+                self.tabela,
+                {"data_recebimento": agora},
+                [("in", "chave_nfe", part), ("eq", "romaneio_id", int(romaneio_id))],
+            ))
+        if self.manifestos is not None:
+            for chave in chaves:
+                self.manifestos.recebido(romaneio_id, chave, agora)
+        return rows
+
+    def pesquisar(self, romaneio_id: int | None = None, dt_ini: str | None = None, dt_fim: str | None = None) -> list[dict]:
+        filtros = []
+        if romaneio_id is not None:
+            filtros.append(("eq", "romaneio_id", int(romaneio_id)))
+        if dt_ini:
+            filtros.append(("gte", "data_expedicao", dt_ini))
+        if dt_fim:
+            filtros.append(("lt", "data_expedicao", dt_fim))
+        rows = self.backend.select(
+            self.tabela, "*", filtros, ordem="data_expedicao", desc=True, embed={"romaneios": "*"}
+        )
+        if romaneio_id is None and not dt_ini and not dt_fim:
+            return rows  # sem filtro nenhum o arquivo não entra (seria lido inteiro)
+        # mesmo teto do banco (max-rows do PostgREST)
+        frias = self._do_arquivo(
+            "*", limite=TAMANHO_PAGINA, ids=None if romaneio_id is None else [int(romaneio_id)], dt_ini=dt_ini, dt_fim=dt_fim
+        )
+        if not frias:
+            return rows
+        rows = self._mesclar(rows, self._com_cabecalho(frias, "romaneios", "*"))
+        return sorted(rows, key=lambda r: r.get("data_expedicao") or "", reverse=True)
+
+
+class FaturamentoRepo(_Repo):
+    tabela = "faturamento"
+    tipos = {**TIPOS_CAIXA, "created_at": "datetime"}
+
+    def ultimo_por_caixa(self, caixa: str, colunas="destino, filial_origem"):
+        caixa = normalize_chave(caixa)
+        if not caixa:
+            return None
+        rows = self.backend.select(
+            self.tabela, colunas, [("eq", "caixa", caixa)], ordem="created_at", desc=True, limite=1
+        )
+        return rows[0] if rows else None
+
+    def por_caixas(self, caixas: list[str], colunas="caixa, filial_origem, destino, qtde_pecas, created_at") -> list[dict]:
+        return self._em_lotes("caixa", caixas, colunas)
+
+    def recentes(self, desde: str, colunas="caixa, filial_origem, destino, qtde_pecas, created_at", limite: int = 5000) -> list[dict]:
+        return self.backend.select(
+            self.tabela, colunas, [("gte", "created_at", desde)], ordem="created_at", desc=True, limite=limite
+        )
+
+    # ---------- DataFrame (transporte colunar) ----------
+    def por_caixas_df(self, caixas: list[str], colunas="caixa, filial_origem, destino, qtde_pecas, created_at") -> pd.DataFrame:
+        return self._em_lotes_df("caixa", caixas, colunas, self.tipos)
+
+    def recentes_df(self, desde: str, colunas="id, caixa, filial_origem, destino, qtde_pecas, created_at", limite: int = 5000) -> pd.DataFrame:
+        """
+        Até `limite` linhas criadas desde `desde`, das mais novas (maior id) para trás,
+        em páginas de TAMANHO_PAGINA (id < menor visto). colunas precisa incluir id.
+        """
+        partes, filtros = [], [("gte", "created_at", desde)]
+        while limite > 0:
+            tamanho = min(limite, TAMANHO_PAGINA)
+            df = self.backend.select_df(self.tabela, colunas, filtros, ordem="id", desc=True, limite=tamanho, tipos=self.tipos)
+            if len(df):
+                partes.append(df)
+            if len(df) < tamanho:
+                break
+            limite -= tamanho
+            filtros = [("gte", "created_at", desde), ("lt", "id", int(df["id"].min()))]
+        if not partes:
+            return tipar(pd.DataFrame(), self.tipos)
+        return partes[0] if len(partes) == 1 else tipar(pd.concat(partes, ignore_index=True), self.tipos)
+
+
+class RomaneiosEspelhoRepo(_Repo):
+    tabela = "romaneios_espelho"
+
+    def buscar(self, espelho_id: int, colunas="*"):
+        rows = self.backend.select(self.tabela, colunas, [("eq", "id", int(espelho_id))], limite=1)
+        return rows[0] if rows else None
+
+    def criar(self, usuario: str, romaneios_origem: list[int], qtd_caixas: int, rota: str) -> int:
+        rows = self.backend.insert(self.tabela, {
+            "usuario_criou": usuario,
+            "unidade_origem": "CD Pavuna",
+            "status": "Encerrado",
+            "romaneios_origem": romaneios_origem,
+            "qtd_caixas": int(qtd_caixas),
+            "rota": rota,
+        })
+        return rows[0]["id"]
+
+    def pesquisar(self, espelho_id: int | None = None, dt_ini: str | None = None, dt_fim: str | None = None) -> list[dict]:
+        filtros = []
+        if espelho_id is not None:
+            filtros.append(("eq", "id", int(espelho_id)))
+        if dt_ini:
+            filtros.append(("gte", "criado_em", dt_ini))
+        if dt_fim:
+            filtros.append(("lt", "criado_em", dt_fim))
+        return self.backend.select(self.tabela, "*", filtros, ordem="id", desc=True)
+
+    def criados_entre(self, dt_ini: str, dt_fim: str, colunas="id, qtd_caixas") -> list[dict]:
+        filtros = [("gte", "criado_em", dt_ini), ("lt", "criado_em", dt_fim)]
+        return [r for pagina in self._paginas(filtros, colunas) for r in pagina]
+
+    def contar_criados_entre(self, dt_ini: str, dt_fim: str) -> int:
+        return self.backend.count(self.tabela, [("gte", "criado_em", dt_ini), ("lt", "criado_em", dt_fim)])
+
+
+class RomaneioEspelhoItensRepo(_Repo):
+    tabela = "romaneio_espelho_itens"
+    chave = "romaneio_espelho_id"
+    tipos = TIPOS_CAIXA
+
+    def listar(self, espelho_id: int, colunas="caixa, destino, qtde_pecas") -> list[dict]:
+        if self._arquivados([espelho_id]):
+            return sorted(self._do_arquivo(colunas, ids=[int(espelho_id)]), key=lambda r: r.get("destino") or "")
+        return self.backend.select(
+            self.tabela, colunas, [("eq", "romaneio_espelho_id", int(espelho_id))], ordem="destino"
+        )
+
+    def listar_df(self, espelho_id: int, colunas="caixa, destino, qtde_pecas") -> pd.DataFrame:
+        """listar em DataFrame (reimpressão de espelhos grandes)."""
+        cols = {c.strip() for c in colunas.split(",")}
+        tipos = {c: t for c, t in self.tipos.items() if c in cols}
+        if self._arquivados([espelho_id]):
+            return tipar(pd.DataFrame(self.listar(espelho_id, colunas)), tipos)
+        return self.backend.select_df(
+            self.tabela, colunas, [("eq", "romaneio_espelho_id", int(espelho_id))], ordem="destino", tipos=tipos
+        )
+
+    def por_caixas(self, caixas: list[str], colunas="caixa, romaneio_espelho_id", com_espelho=None,
+                   com_arquivo: bool = False, desde: str | None = None) -> list[dict]:
+        """
+        com_arquivo: inclui os itens já arquivados (consultas; a operação só olha o banco).
+        desde: só espelhos criados a partir daí no arquivo (poda os meses lidos).
+        """
+        embed = {"romaneios_espelho": com_espelho} if com_espelho else None
+        rows = self._em_lotes("caixa", caixas, colunas, embed=embed)
+        if not com_arquivo:
+            return rows
+        frias = self._do_arquivo(colunas, caixas=caixas, dt_ini=desde)
+        if frias and com_espelho:
+            self._com_cabecalho(frias, "romaneios_espelho", com_espelho)
+        return self._mesclar(rows, frias)
+
+    def paginas_por_espelhos(self, ids: list[int], colunas="id, romaneio_espelho_id, caixa, qtde_pecas", tamanho: int = TAMANHO_PAGINA):
+        arquivados = self._arquivados(ids)
+        for part in chunk_list([int(i) for i in ids if int(i) not in arquivados], size=TAMANHO_LOTE):
+            yield from self._paginas([("in", "romaneio_espelho_id", part)], colunas, tamanho)
+        if arquivados:
+            yield from self.arquivo.paginas(self.tabela, colunas, tamanho, ids=arquivados)
+
+    def contar_por_espelhos(self, ids: list[int]) -> int:
+        return sum(
+            self.backend.count(self.tabela, [("in", "romaneio_espelho_id", part)])
+            for part in chunk_list([int(i) for i in ids], size=TAMANHO_LOTE)
+        )
+
+    def inserir(self, itens: list[dict]) -> list[dict]:
+        if not itens:
+            return []
+        return self.backend.insert(self.tabela, itens)
+
+
+class Repositorios:
+    """
+    Agrupa os repositórios sobre um mesmo backend.
+    manifestos: volumes por romaneio compartilhados por quem usa esta instância
+    (no app, o processo inteiro: get_repos é um cache_resource).
+    """
+
+    def __init__(self, backend, arquivo=None):
+        self.backend = backend
+        self.arquivo = arquivo
+        self.romaneios = RomaneiosRepo(backend)
+        self.conferencia = ConferenciaReservaRepo(backend, arquivo=arquivo)
+        self.manifestos = CacheManifestos(self.romaneios, self.conferencia)
+        self.romaneios.manifestos = self.conferencia.manifestos = self.manifestos
+        self.faturamento = FaturamentoRepo(backend)
+        self.espelhos = RomaneiosEspelhoRepo(backend)
+        self.espelho_itens = RomaneioEspelhoItensRepo(backend, arquivo=arquivo)
@@ -0,0 +1,282 @@
+import contextvars
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturoEsgotado
+from contextlib import contextmanager
+
+import metricas
+from backend import Backend
+from helpers import env_float
+
+FECHADO, ABERTO, MEIO_ABERTO = "fechado", "aberto", "meio_aberto"
+
+# rpc que só leem podem ser repetidas como um select
+RPC_LEITURA = {"monitor_romaneios_abertos"}
+
+# códigos do Postgres que indicam banco sobrecarregado/instável (não erro de consulta)
+CODIGOS_TRANSITORIOS = {"57014", "40001", "40P01", "53300", "53400", "08000", "08001", "08003", "08006", "57P01", "57P03"}
+
+_prazo = contextvars.ContextVar("resiliencia_prazo", default=None)
+_ultima = contextvars.ContextVar("resiliencia_ultima", default=None)
+
+
+class ErroBackend(Exception):
+    """Falha rápida da camada de resiliência (o banco não chegou a responder)."""
+
+
+class CircuitoAberto(ErroBackend):
+    def __init__(self, restante_s: float):
+        super().__init__(f"banco indisponível (modo degradado, nova tentativa em {restante_s:.0f}s)")
+        self.restante_s = restante_s
+
+
+class PrazoEsgotado(ErroBackend):
+    def __init__(self, operacao: str, tabela: str):
+        super().__init__(f"sem resposta do banco a tempo ({operacao} {tabela})")
+
+
+def transitorio(e: Exception) -> bool:
+    """Falha de rede/sobrecarga (vale repetir e conta para o circuito); erro de consulta não."""
+    if isinstance(e, (ConnectionError, TimeoutError, PrazoEsgotado)):
+        return True
+    if isinstance(e, sqlite3.OperationalError):
+        # só banco ocupado; "no such table", erro de sintaxe etc. são erro da consulta
+        msg = str(e).lower()
+        return "locked" in msg or "busy" in msg
+    try:
+        import httpx
+
+        if isinstance(e, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    codigo = str(getattr(e, "code", "") or "")
+    return codigo in CODIGOS_TRANSITORIOS
+
+
+@contextmanager
+def prazo(segundos: float):
+    """
+    Orçamento de tempo para as chamadas ao banco dentro do bloco (ex.: uma bipagem).
+    Leituras que passam do prazo são abandonadas; escritas não começam sem prazo
+    e não são interrompidas no meio. Prazos aninhados valem o menor.
+    """
+    limite = time.monotonic() + segundos
+    atual = _prazo.get()
+    token = _prazo.set(limite if atual is None else min(atual, limite))
+    try:
+        yield
+    finally:
+        _prazo.reset(token)
+
+
+def restante() -> float | None:
+    limite = _prazo.get()
+    return None if limite is None else limite - time.monotonic()
+
+
+# =========================================================
+# DISJUNTOR (processo)
+# =========================================================
+# Todas as sessões dividem o mesmo backend: depois de `falhas` erros
+# transitórios seguidos o circuito abre e as chamadas falham na hora
+# (modo degradado) por `espera_s`. Depois disso uma chamada de teste
+# passa (meio aberto): deu certo, fecha; falhou, abre de novo.
+class Circuito:
+    def __init__(self, falhas: int = 5, espera_s: float = 15.0, ao_mudar=None):
+        self.falhas = falhas
+        self.espera_s = espera_s
+        self.ao_mudar = ao_mudar
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self.aberto_em = None
+        self._testando = False
+        self._lock = threading.Lock()
+        self.stats = {"aberturas": 0, "rejeitadas": 0, "testes": 0}
+        self.ultimo_erro = None
+
+    def _mudar(self, novo: str, motivo: str):
+        de, self.estado = self.estado, novo
+        if de != novo and self.ao_mudar is not None:
+            self.ao_mudar(de, novo, motivo)
+
+    def restante_s(self) -> float:
+        if self.estado != ABERTO:
+            return 0.0
+        return max(self.espera_s - (time.monotonic() - self.aberto_em), 0.0)
+
+    def permitir(self):
+        """Levanta CircuitoAberto se a chamada não deve nem ir ao banco."""
+        with self._lock:
+            if self.estado == ABERTO and time.monotonic() - self.aberto_em >= self.espera_s:
+                self._mudar(MEIO_ABERTO, "fim da espera")
+            if self.estado == FECHADO:
+                return
+            if self.estado == MEIO_ABERTO and not self._testando:
+                self._testando = True
+                self.stats["testes"] += 1
+                return
+            self.stats["rejeitadas"] += 1
+            raise CircuitoAberto(self.restante_s() or self.espera_s)
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas_seguidas = 0
+            self._testando = False
+            if self.estado != FECHADO:
+                self._mudar(FECHADO, "chamada de teste ok")
+
+    def falha(self, e: Exception):
+        with self._lock:
+            self._testando = False
+            if not transitorio(e):  # erro da consulta: o banco respondeu
+                self.falhas_seguidas = 0
+                if self.estado == MEIO_ABERTO:
+                    self._mudar(FECHADO, "banco respondeu")
+                return
+            self.falhas_seguidas += 1
+            self.ultimo_erro = f"{type(e).__name__}: {e}"[:200]
+            if self.estado == MEIO_ABERTO or self.falhas_seguidas >= self.falhas:
+                self.aberto_em = time.monotonic()
+                self.stats["aberturas"] += 1
+                self._mudar(ABERTO, self.ultimo_erro)
+
+
+# =========================================================
+# BACKEND RESILIENTE
+# =========================================================
+class BackendResiliente(Backend):
+    """
+    Envolve qualquer Backend: disjuntor em todas as chamadas, prazo (resiliencia.prazo)
+    e até `tentativas` com backoff exponencial e jitter nas leituras (select, count,
+    rpc de leitura). Escritas vão uma vez só.
+    """
+
+    def __init__(self, interno: Backend, tentativas: int = 3, backoff_ms: float = 100, backoff_max_ms: float = 1000,
+                 circuito: Circuito | None = None, workers: int = 8):
+        self.interno = interno
+        self.nome = interno.nome
+        self.tentativas = max(int(tentativas), 1)
+        self.backoff_ms = backoff_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.circuito = circuito or Circuito(ao_mudar=self._registrar_mudanca)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backend_prazo")
+        self._lock = threading.Lock()
+        self.stats = {"chamadas": 0, "retentativas": 0, "falhas": 0, "prazos_esgotados": 0, "ms_backoff": 0.0}
+
+    def __getattr__(self, item):
+        return getattr(self.interno, item)
+
+    @staticmethod
+    def _registrar_mudanca(de: str, para: str, motivo: str):
+        metricas.coletor.registrar("circuito", de=de, para=para, motivo=motivo)
+
+    def _contar(self, campo: str, n=1):
+        with self._lock:
+            self.stats[campo] += n
+
+    def ultima_chamada(self) -> dict:
+        """Tentativas e estado do circuito da última chamada deste contexto (para o instrumentado)."""
+        return dict(_ultima.get() or {})
+
+    def _uma(self, leitura: bool, operacao: str, tabela: str, fn, args):
+        rest = restante()
+        if rest is None or not leitura:
+            return fn(*args)
+        # leitura com prazo: roda no pool e é abandonada se passar do prazo
+        futuro = self._pool.submit(contextvars.copy_context().run, fn, *args)
+        try:
+            return futuro.result(timeout=rest)
+        except FuturoEsgotado:
+            self._contar("prazos_esgotados")
+            raise PrazoEsgotado(operacao, tabela) from None
+
+    def _chamar(self, operacao: str, tabela: str, fn, *args, leitura: bool = False):
+        self._contar("chamadas")
+        tentativas = self.tentativas if leitura else 1
+        n = 0
+        try:
+            while True:
+                n += 1
+                rest = restante()
+                if rest is not None and rest <= 0:
+                    # recusada antes de sair: o banco não foi chamado, não conta no circuito
+                    self._contar("prazos_esgotados")
+                    self._contar("falhas")
+                    raise PrazoEsgotado(operacao, tabela)
+                self.circuito.permitir()
+                try:
+                    out = self._uma(leitura, operacao, tabela, fn, args)
+                except Exception as e:
+                    self.circuito.falha(e)
+                    rest = restante()
+                    espera = random.uniform(0, min(self.backoff_max_ms, self.backoff_ms * 2 ** (n - 1))) / 1000
+                    if n >= tentativas or not transitorio(e) or (rest is not None and espera >= rest):
+                        self._contar("falhas")
+                        raise
+                    self._contar("retentativas")
+                    self._contar("ms_backoff", espera * 1000)
+                    time.sleep(espera)
+                    continue
+                self.circuito.sucesso()
+                return out
+        finally:
+            _ultima.set({"tentativas": n, "circuito": self.circuito.estado})
+
+    def select(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, embed=None):
+        return self._chamar("select", tabela, self.interno.select, tabela, colunas, filtros, ordem, desc, limite, embed, leitura=True)
+
+    def select_df(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, limite=None, tipos=None):
+        return self._chamar("select", tabela, self.interno.select_df, tabela, colunas, filtros, ordem, desc, limite, tipos, leitura=True)
+
+    def count(self, tabela, filtros=()):
+        return self._chamar("count", tabela, self.interno.count, tabela, filtros, leitura=True)
+
+    def insert(self, tabela, rows):
+        return self._chamar("insert", tabela, self.interno.insert, tabela, rows)
+
+    def update(self, tabela, valores, filtros):
+        return self._chamar("update", tabela, self.interno.update, tabela, valores, filtros)
+
+    def delete(self, tabela, filtros):
+        return self._chamar("delete", tabela, self.interno.delete, tabela, filtros)
+
+    def upsert(self, tabela, rows, on_conflict):
+        return self._chamar("upsert", tabela, self.interno.upsert, tabela, rows, on_conflict)
+
+    def rpc(self, funcao, params):
+        return self._chamar("rpc", funcao, self.interno.rpc, funcao, params, leitura=funcao in RPC_LEITURA)
+
+    def degradado(self) -> bool:
+        return self.circuito.estado != FECHADO
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            st = dict(self.stats)
+        st["ms_backoff"] = round(st["ms_backoff"], 1)
+        st.update(self.circuito.stats)
+        st["circuito"] = self.circuito.estado
+        st["falhas_seguidas"] = self.circuito.falhas_seguidas
+        st["reabre_em_s"] = round(self.circuito.restante_s(), 1)
+        st["ultimo_erro"] = self.circuito.ultimo_erro
+        return st
+
+
+def criar_backend_resiliente(interno: Backend) -> BackendResiliente:
+    """
+    Variáveis (opcionais):
+      CONFERENCIA_RETRY_TENTATIVAS (3), CONFERENCIA_RETRY_BACKOFF_MS (100), CONFERENCIA_RETRY_BACKOFF_MAX_MS (1000),
+      CONFERENCIA_CIRCUITO_FALHAS (5), CONFERENCIA_CIRCUITO_ESPERA_S (15)
+    """
+    be = BackendResiliente(
+        interno,
+        tentativas=int(env_float("CONFERENCIA_RETRY_TENTATIVAS", 3)),
+        backoff_ms=env_float("CONFERENCIA_RETRY_BACKOFF_MS", 100),
+        backoff_max_ms=env_float("CONFERENCIA_RETRY_BACKOFF_MAX_MS", 1000),
+    )
+    be.circuito.falhas = int(env_float("CONFERENCIA_CIRCUITO_FALHAS", 5))
+    be.circuito.espera_s = env_float("CONFERENCIA_CIRCUITO_ESPERA_S", 15)
+    return be
@@ -0,0 +1,49 @@
+-- Encerramento de romaneio da Reserva numa única chamada (RomaneiosRepo.encerrar_reserva).
+-- Valida, conta os volumes e encerra na mesma transação; a contagem final
+-- fica em romaneios.qtd_volumes para as telas não precisarem de count="exact".
+-- Executar uma vez no SQL Editor do Supabase.
+
+alter table public.romaneios add column if not exists qtd_volumes integer;
+
+create or replace function public.encerrar_romaneio_reserva(p_romaneio_id bigint, p_rota text)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_rom public.romaneios%rowtype;
+    v_rota text := upper(btrim(coalesce(p_rota, '')));
+    v_qtd integer;
+begin
+    if v_rota = '' then
+        return jsonb_build_object('ok', false, 'motivo', 'sem_rota');
+    end if;
+
+    -- trava a linha: dois encerramentos simultâneos não contam/gravam duas vezes
+    select * into v_rom from public.romaneios where id = p_romaneio_id for update;
+
+    if not found then
+        return jsonb_build_object('ok', false, 'motivo', 'nao_encontrado');
+    end if;
+    if v_rom.unidade_origem is distinct from 'CD Reserva' then
+        return jsonb_build_object('ok', false, 'motivo', 'unidade_invalida');
+    end if;
+    if v_rom.status = 'Encerrado' then
+        return jsonb_build_object('ok', false, 'motivo', 'ja_encerrado', 'qtd_volumes', v_rom.qtd_volumes);
+    end if;
+
+    select count(*) into v_qtd from public.conferencia_reserva where romaneio_id = p_romaneio_id;
+
+    if v_qtd = 0 then
+        return jsonb_build_object('ok', false, 'motivo', 'sem_volumes', 'qtd_volumes', 0);
+    end if;
+
+    update public.romaneios
+       set status = 'Encerrado',
+           data_encerramento = now(),
+           rota = v_rota,
+           qtd_volumes = v_qtd
+     where id = p_romaneio_id;
+
+    return jsonb_build_object('ok', true, 'motivo', null, 'qtd_volumes', v_qtd, 'rota', v_rota);
+end;
+$$;
@@ -0,0 +1,6 @@
+-- Chave do upsert da ingestão de faturamento (ingest_faturamento.py).
+-- O PostgREST exige um índice único com as colunas de on_conflict.
+-- Executar uma vez no SQL Editor do Supabase.
+
+create unique index if not exists uq_faturamento_caixa_created_at
+    on public.faturamento (caixa, created_at);
@@ -0,0 +1,11 @@
+-- Índices usados pelo "Rastrear Caixa" (consultas in_ por caixa nas três tabelas).
+-- Executar uma vez no SQL Editor do Supabase.
+
+create index if not exists idx_conferencia_reserva_chave_nfe
+    on public.conferencia_reserva (chave_nfe);
+
+create index if not exists idx_faturamento_caixa_created_at
+    on public.faturamento (caixa, created_at desc);
+
+create index if not exists idx_romaneio_espelho_itens_caixa
+    on public.romaneio_espelho_itens (caixa);
@@ -0,0 +1,35 @@
+-- Monitor de romaneios abertos da Reserva (monitor.py / RomaneiosRepo.monitor_abertos).
+-- Uma chamada por atualização: a lista (pequena) de romaneios abertos e só os
+-- volumes com id > p_desde_id, agregados por romaneio. O app soma os deltas;
+-- p_desde_id = 0 devolve a contagem completa (recarga periódica).
+-- Executar uma vez no SQL Editor do Supabase.
+
+create index if not exists idx_romaneios_abertos
+    on public.romaneios (id) where status = 'Aberto';
+
+create or replace function public.monitor_romaneios_abertos(p_desde_id bigint default 0)
+returns jsonb
+language sql
+stable
+as $$
+    with abertos as (
+        select id, usuario_criou, created_at
+          from public.romaneios
+         where status = 'Aberto' and unidade_origem = 'CD Reserva'
+    ),
+    novos as (
+        select c.romaneio_id,
+               count(*) as volumes,
+               max(c.data_expedicao) as ultima_bipagem
+          from public.conferencia_reserva c
+          join abertos a on a.id = c.romaneio_id
+         where c.id > p_desde_id
+         group by c.romaneio_id
+    )
+    select jsonb_build_object(
+        -- marca d'água: maior id de conferencia_reserva (pela PK, não varre a tabela)
+        'marca', coalesce((select max(id) from public.conferencia_reserva where id > p_desde_id), p_desde_id),
+        'abertos', coalesce((select jsonb_agg(to_jsonb(a) order by a.id) from abertos a), '[]'::jsonb),
+        'novos', coalesce((select jsonb_agg(to_jsonb(n)) from novos n), '[]'::jsonb)
+    );
+$$;